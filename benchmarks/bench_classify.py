@@ -0,0 +1,60 @@
+"""
+Benchmarks process.classify_text against process.TopicClassifier
+for increasing numbers of queries
+
+Usage: python -m benchmarks.bench_classify --texts 200
+"""
+import argparse
+import random
+import timeit
+
+from veryscrape.process import TopicClassifier, classify_text
+
+
+def create_topics(n_queries, n_topics=10):
+    topics = {}
+    for k in range(n_topics):
+        topics['topic%d' % k] = [
+            'query%d' % q for q in range(k, n_queries, n_topics)
+        ]
+    return topics
+
+
+def create_texts(rng, n_texts, n_queries, n_words=500):
+    # Roughly one word in twenty of a text is a query
+    words = ['word%d' % k for k in range(5000)]
+    queries = ['query%d' % q for q in range(n_queries)]
+    return [
+        ' '.join(rng.choice(queries) if rng.random() < 0.05
+                 else rng.choice(words) for _ in range(n_words))
+        for _ in range(n_texts)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--texts', type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    for n_queries in (10, 1000, 100000):
+        topics = create_topics(n_queries)
+        texts = create_texts(rng, args.texts, n_queries)
+
+        start = timeit.default_timer()
+        classifier = TopicClassifier(topics)
+        build = timeit.default_timer() - start
+
+        original = timeit.timeit(
+            lambda: [classify_text(t, topics) for t in texts], number=1)
+        indexed = timeit.timeit(
+            lambda: [classifier(t) for t in texts], number=1)
+        print('%6d queries: classify_text %8.1f us/text, '
+              'TopicClassifier %6.1f us/text (%.1fx), built in %.1f ms' % (
+                  n_queries, original / len(texts) * 1e6,
+                  indexed / len(texts) * 1e6, original / indexed,
+                  build * 1e3))
+
+
+if __name__ == '__main__':
+    main()
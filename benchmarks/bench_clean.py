@@ -0,0 +1,77 @@
+"""
+Benchmarks the cleaning functions registered for each source,
+applied one after another and compiled with process.compile_cleaner
+
+Usage: python -m benchmarks.bench_clean --repeat 5
+"""
+import argparse
+import os
+import random
+import timeit
+
+import veryscrape  # noqa: F401 - registers default scrapers
+from veryscrape.process import _clean_functions, clean_article, \
+    compile_cleaner
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data')
+
+
+def _read_lines(name):
+    path = os.path.join(DATA_PATH, name)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return f.read().splitlines()
+
+
+def _fake_tweets(n):
+    rng = random.Random(0)
+    words = ['RT', '@some_user:', '#topic', 'https://t.co/AbCdEf', '&amp;',
+             'café', '\U0001f600', 'some', 'data', 'is', 'brewing', '!!!!']
+    return [' '.join(rng.choice(words) for _ in range(20)) for _ in range(n)]
+
+
+def corpus(source):
+    if source == 'twitter':
+        return _read_lines('tweets.txt') or _fake_tweets(10000)
+    elif source == 'reddit':
+        return _read_lines('reddit_comments.txt')
+    # Html is converted to article text before the rest of the cleaning
+    htmls = '\n'.join(_read_lines('htmls.txt')).split('|S|P|E|C|I|A|L|S|E|P|')
+    return [clean_article(h) for h in htmls] * 20
+
+
+def apply_all(funcs, texts):
+    for text in texts:
+        for func in funcs:
+            text = func(text)
+
+
+def apply_compiled(cleaner, texts):
+    for text in texts:
+        cleaner(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for source in ('twitter', 'reddit', 'article'):
+        # Article text extraction is the same for both, so it is left out
+        funcs = [f for f in _clean_functions[source] if f is not clean_article]
+        texts = corpus(source)
+        cleaner = compile_cleaner(funcs)
+
+        original = min(timeit.repeat(lambda: apply_all(funcs, texts),
+                                     number=1, repeat=args.repeat))
+        compiled = min(timeit.repeat(lambda: apply_compiled(cleaner, texts),
+                                     number=1, repeat=args.repeat))
+        print('%-8s %6d texts: original %.2f us/text, compiled %.2f us/text '
+              '(%.1fx)' % (source, len(texts),
+                           original / len(texts) * 1e6,
+                           compiled / len(texts) * 1e6, original / compiled))
+
+
+if __name__ == '__main__':
+    main()
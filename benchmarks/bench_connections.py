@@ -0,0 +1,116 @@
+"""
+Benchmarks fetching pages from a local aiohttp server with a new client
+session for each request, with a connection pool that neither keeps
+connections open nor caches resolved hosts, and with the connection pool
+of session.Session, and requesting OAuth2 tokens with a new client session
+or with the connection pool of a session like OAuth2Session
+
+Usage: python -m benchmarks.bench_connections --requests 2000 --hosts 4
+"""
+import argparse
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+
+from veryscrape.session import OAuth2, Session
+
+
+def create_app(connections):
+    page = 'some data is brewing ' * 500
+
+    async def get_page(request):
+        connections.add(request.transport.get_extra_info('peername'))
+        return web.Response(text=page)
+
+    async def get_token(request):
+        connections.add(request.transport.get_extra_info('peername'))
+        return web.json_response({'access_token': 'abc', 'expires_in': 3600})
+
+    app = web.Application()
+    app.router.add_get('/page', get_page)
+    app.router.add_post('/token', get_token)
+    return app
+
+
+async def fetch_all(urls, concurrency, create_session, new_sessions=False):
+    urls = iter(urls)
+    session = None if new_sessions else create_session()
+
+    async def fetch_urls():
+        for url in urls:
+            if new_sessions:
+                async with create_session() as sess:
+                    async with sess.get(url) as resp:
+                        await resp.read()
+            else:
+                async with session.get(url) as resp:
+                    await resp.read()
+
+    await asyncio.gather(*[fetch_urls() for _ in range(concurrency)])
+    if session is not None:
+        await session.close()
+
+
+async def request_tokens(patcher, n_tokens):
+    for _ in range(n_tokens):
+        patcher.token = None
+        await patcher.auth_token()
+
+
+async def main_async(args):
+    connections = set()
+    runner = web.AppRunner(create_app(connections))
+    await runner.setup()
+    ports = []
+    for _ in range(args.hosts):
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        ports.append(site._server.sockets[0].getsockname()[1])
+    # Hosts are named so they are resolved like real hosts
+    urls = ['http://localhost:%d/page' % ports[k % len(ports)]
+            for k in range(args.requests)]
+
+    for name, create_session, new_sessions in (
+            ('session per request', aiohttp.ClientSession, True),
+            ('no keepalive or dns cache', lambda: aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    force_close=True, use_dns_cache=False)), False),
+            ('Session connection pool', lambda: aiohttp.ClientSession(
+                connector=Session.create_connector()), False)):
+        connections.clear()
+        start = time.perf_counter()
+        await fetch_all(urls, args.concurrency, create_session, new_sessions)
+        elapsed = time.perf_counter() - start
+        print('%-25s %6.0f requests/s, %5d connections' % (
+            name, len(urls) / elapsed, len(connections)))
+
+    token_url = 'http://localhost:%d/token' % ports[0]
+    session = aiohttp.ClientSession(connector=Session.create_connector())
+    for name, request in (('new session', None),
+                          ('session pool', session._request)):
+        patcher = OAuth2('client', 'secret', token_url)
+        patcher.request = request
+        connections.clear()
+        start = time.perf_counter()
+        await request_tokens(patcher, args.tokens)
+        elapsed = time.perf_counter() - start
+        print('OAuth2 tokens with %-12s %6.0f tokens/s, %5d connections' % (
+            name, args.tokens / elapsed, len(connections)))
+    await session.close()
+    await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--hosts', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--tokens', type=int, default=500)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
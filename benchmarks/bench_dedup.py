@@ -0,0 +1,66 @@
+"""
+Benchmarks the stores of seen texts in dedup against the set of md5 hex
+digests ItemGenerator.filter used to keep for each stream
+
+Usage: python -m benchmarks.bench_dedup --items 500000 --max-items 50000
+"""
+import argparse
+import timeit
+import tracemalloc
+from hashlib import md5
+
+from veryscrape.dedup import RotatingBloomFilter, SeenSet
+
+
+class Md5Set:
+    """The store ItemGenerator.filter used before dedup"""
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.seen = set()
+
+    def add(self, text):
+        hsh = md5(str(text).encode()).hexdigest()
+        if hsh not in self.seen:
+            self.seen.add(hsh)
+            if len(self.seen) >= self.max_items:
+                self.seen.pop()
+            return True
+        return False
+
+
+def measure(store, max_items, n_items):
+    texts = ['seen text number %d' % k for k in range(n_items)]
+    seen = store(max_items)
+    elapsed = timeit.timeit(lambda: [seen.add(t) for t in texts], number=1)
+
+    # Memory is measured separately as tracing slows down adding texts
+    tracemalloc.start()
+    seen = store(max_items)
+    for text in texts:
+        seen.add(text)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # Texts added after the last max_items // 2 should be remembered
+    missed = sum(seen.add(t) for t in texts[-(max_items // 2):])
+    # Few unseen texts are added so the false positive rate barely changes
+    unseen = ['unseen text number %d' % k for k in range(max_items // 10)]
+    false_positives = sum(not seen.add(t) for t in unseen)
+    return elapsed / n_items, memory, missed, false_positives / len(unseen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=500000)
+    parser.add_argument('--max-items', type=int, default=50000)
+    args = parser.parse_args()
+
+    for store in (Md5Set, SeenSet, RotatingBloomFilter):
+        seconds, memory, missed, fpr = measure(
+            store, args.max_items, args.items)
+        print('%-19s %5.2f us/text, %8.1f KB, %5d recent texts forgotten, '
+              'false positive rate %.4f' % (
+                  store.__name__, seconds * 1e6, memory / 1024, missed, fpr))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmarks extracting links from html with process.extract_urls,
+against parsing the html with lxml and selecting every href attribute,
+with and without canonicalizing the links
+
+Usage: python -m benchmarks.bench_extract_urls --repeat 5
+"""
+import argparse
+import os
+import timeit
+
+import lxml.html
+
+from veryscrape.process import canonicalize_url, extract_urls
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data')
+
+
+def lxml_urls(text):
+    # How links were extracted before
+    try:
+        return {e.get('href') for e in
+                lxml.html.fromstring(text).xpath('//*[@href]')}
+    except Exception:
+        return set()
+
+
+def lxml_canonical_urls(text, base_url):
+    urls = {canonicalize_url(url, base_url) for url in lxml_urls(text)}
+    urls.discard(None)
+    return urls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    with open(os.path.join(DATA_PATH, 'htmls.txt'), encoding='utf-8',
+              errors='replace') as f:
+        htmls = [h for h in f.read().split('|S|P|E|C|I|A|L|S|E|P|')
+                 if h.strip()]
+
+    base_url = 'http://example.com/a/'
+    for name, extract in (
+            ('lxml', lxml_urls),
+            ('lxml + canonicalize_url',
+             lambda h: lxml_canonical_urls(h, base_url)),
+            ('extract_urls', lambda h: extract_urls(h, base_url))):
+        n_urls = sum(len(extract(h)) for h in htmls)
+        elapsed = min(timeit.repeat(
+            lambda: [extract(h) for h in htmls], number=1,
+            repeat=args.repeat))
+        print('%-23s %4d pages, %6d urls: %7.2f ms/page' % (
+            name, len(htmls), n_urls, elapsed / len(htmls) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
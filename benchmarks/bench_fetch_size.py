@@ -0,0 +1,107 @@
+"""
+Benchmarks fetching a mix of pages, very large pages and binary files
+from a local aiohttp server with session.Session.fetch, reading every
+whole body with resp.text(), and reading bodies in chunks with the
+max_size and content_types that scrapers use by default
+
+Usage: python -m benchmarks.bench_fetch_size --requests 200 --large 0.05
+"""
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+from aiohttp import web
+
+from veryscrape.scrape import Scraper
+from veryscrape.session import Session
+
+
+def create_app(large_size):
+    # Charset is only in a meta tag, as on many pages, so resp.text()
+    # has to detect the charset from the body
+    page = ('<html><head><meta charset="utf-8"></head><body>%s</body>'
+            '</html>' % ('<p>some data is brewing caf\xe9</p>\n' * 3000)
+            ).encode('utf-8')
+    large_page = page * (large_size // len(page))
+    binary = bytes(random.Random(0).getrandbits(8)
+                   for _ in range(1024)) * (large_size // 1024)
+
+    def handler(body, content_type):
+        async def handle(request):
+            return web.Response(body=body, content_type=content_type)
+        return handle
+
+    app = web.Application()
+    app.router.add_get('/page', handler(page, 'text/html'))
+    app.router.add_get('/large', handler(large_page, 'text/html'))
+    app.router.add_get('/binary',
+                       handler(binary, 'application/octet-stream'))
+    return app
+
+
+async def fetch_all(session, urls, concurrency, **kwargs):
+    urls = iter(urls)
+    read = []
+
+    async def fetch_urls():
+        for url in urls:
+            text = await session.fetch('GET', url, **kwargs)
+            read.append(len(text) if text is not None else 0)
+
+    await asyncio.gather(*[fetch_urls() for _ in range(concurrency)])
+    return sum(read), sum(1 for n in read if n)
+
+
+async def main_async(args):
+    runner = web.AppRunner(create_app(args.large_size * 1024 ** 2))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    rng = random.Random(0)
+    urls = ['http://127.0.0.1:%d/%s' % (
+        port, 'page' if rng.random() > args.large
+        else rng.choice(('large', 'binary'))) for _ in range(args.requests)]
+
+    for name, kwargs in (
+            ('resp.text()', {}),
+            ('max_size and content_types', dict(
+                max_size=Scraper.max_page_size,
+                content_types=Scraper.page_content_types))):
+        session = Session()
+        # resp.text() fails to decode binary files, which are not retried
+        session.retries_to_error = 0
+        session.error_on_failure = False
+        start = time.perf_counter()
+        chars, pages = await fetch_all(session, urls, args.concurrency,
+                                       **kwargs)
+        elapsed = time.perf_counter() - start
+        # Memory is measured separately as tracing slows down decoding
+        tracemalloc.start()
+        await fetch_all(session, urls, args.concurrency, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        await session.close()
+        print('%-28s %6.2f s, %6.1f requests/s, %4d pages read, '
+              '%6.1f MB of text, %6.1f MB peak' % (
+                  name, elapsed, len(urls) / elapsed, pages,
+                  chars / 1024 ** 2, peak / 1024 ** 2))
+    await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--large', type=float, default=0.05,
+                        help='fraction of requests of large pages or files')
+    parser.add_argument('--large-size', type=int, default=20,
+                        help='MB of large pages and files')
+    parser.add_argument('--concurrency', type=int, default=10)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmarks crawling a synthetic web graph with frontier.URLFrontier,
+where every page links to other pages of mostly a few popular hosts.
+Pages are crawled instantly, so this measures the cost of scheduling urls.
+Pass --crawl-state to keep the crawl state in a sqlite database
+
+Usage: python -m benchmarks.bench_frontier --pages 100000 --links 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import tracemalloc
+from collections import Counter
+
+from veryscrape.frontier import SQLiteFrontier, URLFrontier
+
+
+def page_links(url, n_links, n_hosts):
+    rng = random.Random(url)
+    # Host popularity follows a power law, like links on the web
+    return ['http://host%d.com/page%d' % (
+        int(n_hosts ** rng.random()) - 1, rng.randrange(10 ** 9))
+        for _ in range(n_links)]
+
+
+async def crawl_pages(frontier, crawled, n_pages, n_links, n_hosts):
+    while len(crawled) < n_pages:
+        url = await frontier.get()
+        if url is None:
+            break
+        crawled.append(url)
+        # Lets other requests start, like waiting for a response
+        await asyncio.sleep(0)
+        for link in page_links(url, n_links, n_hosts):
+            frontier.add(link)
+        frontier.done(url)
+
+
+async def crawl(frontier, n_pages, n_links, n_hosts, concurrency):
+    crawled = []
+    frontier.add('http://host0.com/')
+    await asyncio.gather(*[
+        crawl_pages(frontier, crawled, n_pages, n_links, n_hosts)
+        for _ in range(concurrency)
+    ])
+    return Counter(url.split('/')[2] for url in crawled), \
+        len(crawled) * n_links
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=100000)
+    parser.add_argument('--links', type=int, default=10)
+    parser.add_argument('--hosts', type=int, default=100000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--per-host', type=int, default=4)
+    parser.add_argument('--crawl-state', default=None,
+                        help='path of a sqlite database, which is deleted')
+    args = parser.parse_args()
+
+    def create_frontier():
+        if args.crawl_state is None:
+            return URLFrontier(max_per_host=args.per_host)
+        for path in (args.crawl_state, args.crawl_state + '-wal',
+                     args.crawl_state + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        return SQLiteFrontier(args.crawl_state, max_urls=100000,
+                              max_per_host=args.per_host)
+
+    frontier = create_frontier()
+    loop = asyncio.get_event_loop()
+    start = time.perf_counter()
+    crawled, links = loop.run_until_complete(crawl(
+        frontier, args.pages, args.links, args.hosts, args.concurrency))
+    elapsed = time.perf_counter() - start
+    frontier.close()
+
+    # Memory is measured separately as tracing slows down crawling
+    tracemalloc.start()
+    frontier = create_frontier()
+    loop.run_until_complete(crawl(
+        frontier, args.pages, args.links, args.hosts, args.concurrency))
+    memory = tracemalloc.get_traced_memory()[0]
+    frontier.close()
+
+    print('Crawled %d pages of %d hosts with %d links in %.1f s: '
+          '%.0f links/s, %.0f pages/s' % (
+              sum(crawled.values()), len(crawled), links, elapsed,
+              links / elapsed, sum(crawled.values()) / elapsed))
+    print('%d urls waiting, %.1f MB used, most crawled host has %.1f%% of '
+          'pages' % (len(frontier), memory / 1024 ** 2,
+                     crawled.most_common(1)[0][1] /
+                     sum(crawled.values()) * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmarks encoding and decoding items in the text and binary formats
+of the cli, and the size of the encoded items
+
+Usage: python -m benchmarks.bench_item_format --items 100000
+"""
+import argparse
+import random
+import timeit
+from datetime import datetime
+
+from veryscrape.items import Item, decode_item, encode_item
+from veryscrape.writer import format_item
+
+
+def decode_text(data):
+    # How consumers parse text items, which fails for content containing '|'
+    source, topic, created_at, content = data.decode('utf-8').split('|', 3)
+    try:
+        created_at = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S.%f')
+    except ValueError:
+        created_at = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
+    return Item(content, topic, source, created_at)
+
+
+def encode_text(item):
+    return format_item(item).encode('utf-8')
+
+
+def create_items(n_items):
+    rng = random.Random(0)
+    words = ['some', 'data', 'is', 'brewing', 'café', 'https://t.co/AbCdEf']
+    return [Item(' '.join(rng.choice(words)
+                          for _ in range(rng.randint(5, 50))),
+                 'topic%d' % rng.randint(0, 20), 'twitter',
+                 datetime.fromtimestamp(1.5e9 + rng.random() * 1e7))
+            for _ in range(n_items)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=100000)
+    args = parser.parse_args()
+    items = create_items(args.items)
+
+    for name, encode, decode in (('text', encode_text, decode_text),
+                                 ('binary', encode_item, decode_item)):
+        encoded = [encode(item) for item in items]
+        encode_time = timeit.timeit(
+            lambda: [encode(item) for item in items], number=1)
+        decode_time = timeit.timeit(
+            lambda: [decode(data) for data in encoded], number=1)
+        print('%-6s encode %5.2f us/item, decode %5.2f us/item, '
+              '%6.1f bytes/item' % (
+                  name, encode_time / len(items) * 1e6,
+                  decode_time / len(items) * 1e6,
+                  sum(map(len, encoded)) / len(items)))
+
+
+if __name__ == '__main__':
+    main()
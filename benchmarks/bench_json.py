@@ -0,0 +1,138 @@
+"""
+Benchmarks decoding tweets of a stream with each installed backend of
+fastjson, and decoding only the text and timestamp_ms of tweets with
+fastjson.project. Tweets are read from a corpus of recorded tweets with
+one tweet of JSON on each line, or else generated like tweets of the
+statuses/filter.json stream, with a user, entities and a retweet
+
+Usage: python -m benchmarks.bench_json --corpus tweets.jsonl --tweets 20000
+"""
+import argparse
+import json
+import random
+import time
+
+from veryscrape import fastjson
+
+
+def user(rng, k):
+    return {
+        'id': k, 'id_str': str(k), 'name': 'User %d' % k,
+        'screen_name': 'user_%d' % k, 'location': 'Somewhere, Earth',
+        'url': 'https://example.com/user_%d' % k,
+        'description': ' '.join(rng.choice(('data', 'brewing', 'caf\xe9',
+                                            '#hashtag', '@someone'))
+                                for _ in range(30)),
+        'protected': False, 'verified': False,
+        'followers_count': rng.randrange(10 ** 6),
+        'friends_count': rng.randrange(10 ** 4),
+        'listed_count': rng.randrange(100), 'favourites_count': 0,
+        'statuses_count': rng.randrange(10 ** 5),
+        'created_at': 'Sat May 26 16:41:11 +0000 2012',
+        'lang': 'en', 'profile_background_color': 'C0DEED',
+        'profile_image_url_https': 'https://pbs.twimg.com/profile_images/'
+                                   '%d/photo_normal.jpg' % k,
+        'profile_banner_url': 'https://pbs.twimg.com/profile_banners/%d/'
+                              '1527352873' % k,
+        'profile_link_color': '1DA1F2', 'profile_text_color': '333333',
+        'profile_sidebar_fill_color': 'DDEEF6',
+        'profile_use_background_image': True, 'default_profile': True,
+        'default_profile_image': False, 'following': None,
+        'follow_request_sent': None, 'notifications': None,
+        'contributors_enabled': False, 'is_translator': False,
+        'geo_enabled': False, 'time_zone': None, 'utc_offset': None,
+    }
+
+
+def status(rng, k, retweet=None):
+    words = [rng.choice(('some', 'data', 'is', 'brewing', 'caf\xe9',
+                         '#hashtag', '@user_1', 'http://t.co/abc'))
+             for _ in range(rng.randint(5, 25))]
+    tweet = {
+        'created_at': 'Sat May 26 16:41:11 +0000 2018',
+        'id': 10 ** 18 + k, 'id_str': str(10 ** 18 + k),
+        'text': ' '.join(words),
+        'source': '<a href="http://twitter.com" rel="nofollow">Twitter</a>',
+        'truncated': False, 'in_reply_to_status_id': None,
+        'user': user(rng, k), 'geo': None, 'coordinates': None,
+        'place': None, 'is_quote_status': False, 'quote_count': 0,
+        'reply_count': 0, 'retweet_count': 0, 'favorite_count': 0,
+        'entities': {
+            'hashtags': [{'text': 'hashtag', 'indices': [0, 8]}],
+            'urls': [{'url': 'http://t.co/abc',
+                      'expanded_url': 'https://example.com/page%d' % k,
+                      'display_url': 'example.com/page%d' % k,
+                      'indices': [10, 25]}],
+            'user_mentions': [{'screen_name': 'user_1', 'name': 'User 1',
+                               'id': 1, 'id_str': '1', 'indices': [30, 37]}],
+            'symbols': []},
+        'extended_entities': {'media': [{
+            'id': k, 'id_str': str(k), 'type': 'photo',
+            'media_url_https': 'https://pbs.twimg.com/media/%d.jpg' % k,
+            'url': 'http://t.co/abc', 'display_url': 'pic.twitter.com/abc',
+            'expanded_url': 'https://twitter.com/user_%d/status/%d/photo/1'
+                            % (k, k),
+            'sizes': {size: {'w': 1200, 'h': 675, 'resize': 'fit'}
+                      for size in ('thumb', 'small', 'medium', 'large')},
+            'indices': [40, 63]}]},
+        'favorited': False, 'retweeted': False, 'filter_level': 'low',
+        'lang': 'en',
+    }
+    if retweet is not None:
+        tweet['retweeted_status'] = retweet
+    return tweet
+
+
+def create_tweets(n_tweets):
+    rng = random.Random(0)
+    tweets = []
+    for k in range(n_tweets):
+        tweet = status(rng, k, status(rng, -k) if rng.random() < 0.7
+                       else None)
+        tweet['timestamp_ms'] = '1527352873612'
+        tweets.append(json.dumps(tweet).encode('utf-8'))
+    return tweets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--corpus', default=None,
+                        help='path of file with a tweet of JSON on each line')
+    parser.add_argument('--tweets', type=int, default=20000)
+    args = parser.parse_args()
+
+    if args.corpus is None:
+        tweets = create_tweets(args.tweets)
+    else:
+        with open(args.corpus, 'rb') as f:
+            tweets = [line.strip() for line in f if line.strip()]
+        tweets = tweets[:args.tweets]
+    size = sum(map(len, tweets))
+    print('%d tweets of %.1f KB on average' % (
+        len(tweets), size / len(tweets) / 1024))
+
+    fields = ('text', 'timestamp_ms')
+    decoders = []
+    for backend in fastjson.BACKENDS:
+        try:
+            fastjson.use_backend(backend)
+        except ImportError:
+            print('%-28s not installed' % backend)
+            continue
+        decoders.append(('%s, all fields' % backend, fastjson.loads))
+    fastjson.use_backend()
+    decoders.append(('project text, timestamp_ms',
+                     lambda line: fastjson.project(line, fields)))
+
+    for name, decode in decoders:
+        start = time.perf_counter()
+        for line in tweets:
+            tweet = decode(line)
+            tweet['text'], tweet['timestamp_ms']
+        elapsed = time.perf_counter() - start
+        print('%-28s %6.1f us/tweet, %6.0f MB/s' % (
+            name, elapsed / len(tweets) * 1e6, size / elapsed / 1024 ** 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmarks how long parsing fetched pages blocks the event loop, measured
+with monitor.LoopLagMonitor, when pages are parsed with process.parse_html
+on the loop like Spider used to, or in a process pool with a limited
+number of pages being parsed at once like Scraper.parse
+
+Usage: python -m benchmarks.bench_loop_lag --pages 200 --workers 2
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from veryscrape.monitor import LoopLagMonitor
+from veryscrape.process import parse_html
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data')
+
+
+async def crawl(htmls, n_pages, concurrency, parse):
+    pages = iter(range(n_pages))
+
+    async def fetch_pages():
+        for k in pages:
+            # Waiting for a response
+            await asyncio.sleep(1e-3)
+            await parse(htmls[k % len(htmls)], 'http://example.com/%d' % k)
+
+    await asyncio.gather(*[fetch_pages() for _ in range(concurrency)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrent-parses', type=int, default=8)
+    args = parser.parse_args()
+    with open(os.path.join(DATA_PATH, 'htmls.txt'), encoding='utf-8',
+              errors='replace') as f:
+        htmls = [h for h in f.read().split('|S|P|E|C|I|A|L|S|E|P|')
+                 if h.strip()]
+
+    loop = asyncio.get_event_loop()
+    pool = ProcessPoolExecutor(args.workers)
+    parses = asyncio.Semaphore(args.concurrent_parses)
+
+    async def parse_on_loop(html, url):
+        return parse_html(html, url)
+
+    async def parse_in_pool(html, url):
+        async with parses:
+            return await loop.run_in_executor(pool, parse_html, html, url)
+
+    # Starts the worker processes before measuring
+    loop.run_until_complete(parse_in_pool(htmls[0], None))
+    for name, parse in (('on loop', parse_on_loop),
+                        ('in pool', parse_in_pool)):
+        monitor = LoopLagMonitor(interval=1e-2, threshold=0.1)
+        monitor.start()
+        start = time.perf_counter()
+        loop.run_until_complete(
+            crawl(htmls, args.pages, args.concurrency, parse))
+        elapsed = time.perf_counter() - start
+        monitor.stop()
+        print('%s: %5.1f pages/s, loop lag mean %6.1f ms, max %6.1f ms, '
+              '%d times over 100 ms' % (
+                  name, args.pages / elapsed, monitor.mean_lag * 1e3,
+                  monitor.max_lag * 1e3, monitor.slow))
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Benchmarks the cost of updating metrics.Registry metrics, which are
+updated on every fetch, parse, batch and redis write, and of collecting
+all metrics in the Prometheus text format
+
+Usage: python -m benchmarks.bench_metrics --updates 1000000 --series 100
+"""
+import argparse
+import random
+import timeit
+
+from veryscrape.metrics import Registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--updates', type=int, default=1000000)
+    parser.add_argument('--series', type=int, default=100)
+    args = parser.parse_args()
+    registry = Registry()
+    counter = registry.counter('counter_total', labels=('x',))
+    histogram = registry.histogram('histogram_seconds', labels=('x',))
+    rng = random.Random(0)
+    values = [rng.expovariate(10) for _ in range(1000)]
+
+    child = counter.labels('a')
+    hist_child = histogram.labels('a')
+    for name, update in (
+            ('counter inc', lambda: child.inc()),
+            ('counter labels + inc', lambda: counter.labels('a').inc()),
+            ('histogram observe', lambda: hist_child.observe(values[7]))):
+        elapsed = timeit.timeit(update, number=args.updates)
+        print('%-21s %6.0f ns/update' % (name, elapsed / args.updates * 1e9))
+
+    for k in range(args.series):
+        counter.labels(str(k)).inc()
+        for value in values:
+            histogram.labels(str(k)).observe(value)
+    number = 100
+    elapsed = timeit.timeit(registry.exposition, number=number)
+    print('Exposition of %d series: %.2f ms, %d bytes' % (
+        2 * args.series, elapsed / number * 1e3,
+        len(registry.exposition())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmarks finding near-duplicate items with dedup.simhash and
+dedup.SimHashIndex, for tweet and article sized texts where some texts
+are copies of earlier texts with a word added or changed
+
+Usage: python -m benchmarks.bench_near_dedup --items 100000 --distance 3
+"""
+import argparse
+import random
+import timeit
+
+from veryscrape.dedup import SimHashIndex, simhash
+
+
+def create_texts(rng, n_texts, n_words, duplicate_rate=0.3):
+    words = ['word%d' % k for k in range(20000)]
+    texts, is_duplicate = [], []
+    for _ in range(n_texts):
+        if texts and rng.random() < duplicate_rate:
+            text = rng.choice(texts[-1000:]).split()
+            # Retweets with a trailing word, or reposts with a word changed
+            if rng.random() < 0.5:
+                text.append(rng.choice(words))
+            else:
+                text[rng.randrange(len(text))] = rng.choice(words)
+            texts.append(' '.join(text))
+            is_duplicate.append(True)
+        else:
+            texts.append(' '.join(rng.choice(words) for _ in range(n_words)))
+            is_duplicate.append(False)
+    return texts, is_duplicate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--distance', type=int, default=3)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    for name, n_words in (('tweets', 20), ('articles', 500)):
+        n_items = args.items if n_words < 100 else args.items // 20
+        texts, is_duplicate = create_texts(rng, n_items, n_words)
+        index = SimHashIndex(max_distance=args.distance, max_items=n_items)
+
+        hashes = []
+        hash_time = timeit.timeit(
+            lambda: hashes.extend(simhash(t) for t in texts), number=1)
+        kept = []
+        index_time = timeit.timeit(
+            lambda: kept.extend(index.add(h, now=0) for h in hashes), number=1)
+
+        found = sum(d and not k for d, k in zip(is_duplicate, kept))
+        wrong = sum(not d and not k for d, k in zip(is_duplicate, kept))
+        print('%-8s %6d items: %7.0f items/s (simhash %6.1f us, index %5.1f '
+              'us), found %.1f%% of near-duplicates, dropped %d originals' % (
+                  name, n_items, n_items / (hash_time + index_time),
+                  hash_time / n_items * 1e6, index_time / n_items * 1e6,
+                  found / max(1, sum(is_duplicate)) * 100, wrong))
+
+
+if __name__ == '__main__':
+    main()
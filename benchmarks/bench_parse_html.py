@@ -0,0 +1,63 @@
+"""
+Benchmarks extracting article text, links and publish date from html
+with process.parse_html, which parses each page once, against parsing
+each page separately for each of them, and the size of the results
+sent back from a worker process compared to the size of the html
+
+Usage: python -m benchmarks.bench_parse_html --repeat 3
+"""
+import argparse
+import os
+import pickle
+import timeit
+
+import lxml.html
+from newspaper.configuration import Configuration
+from newspaper.extractors import ContentExtractor
+
+from veryscrape.process import clean_article, extract_urls, parse_html
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data')
+URL = 'http://example.com/a/'
+
+
+def parse_separately(html):
+    config = Configuration()
+    doc = config.get_parser().fromstring(html)
+    published = ContentExtractor(config).get_publishing_date(URL, doc)
+    urls = {e.get('href') for e in
+            lxml.html.fromstring(html).xpath('//*[@href]')}
+    return clean_article(html), urls, published
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    with open(os.path.join(DATA_PATH, 'htmls.txt'), encoding='utf-8',
+              errors='replace') as f:
+        htmls = [h for h in f.read().split('|S|P|E|C|I|A|L|S|E|P|')
+                 if h.strip()]
+
+    for name, parse in (('parsed separately', parse_separately),
+                        ('parse_html', lambda h: parse_html(h, URL))):
+        elapsed = min(timeit.repeat(
+            lambda: [parse(h) for h in htmls], number=1,
+            repeat=args.repeat))
+        print('%-17s %d pages: %6.2f ms/page' % (
+            name, len(htmls), elapsed / len(htmls) * 1e3))
+
+    html_size = sum(len(pickle.dumps(h)) for h in htmls)
+    result_size = sum(len(pickle.dumps(parse_html(h, URL))) for h in htmls)
+    print('Pickled html %.1f KB/page, results %.1f KB/page' % (
+        html_size / len(htmls) / 1024, result_size / len(htmls) / 1024))
+    # Link extraction was run on the event loop for every page crawled
+    elapsed = min(timeit.repeat(
+        lambda: [extract_urls(h, URL) for h in htmls], number=1,
+        repeat=args.repeat))
+    print('extract_urls on the loop took %.2f ms/page' % (
+        elapsed / len(htmls) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
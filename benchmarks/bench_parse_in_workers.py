@@ -0,0 +1,59 @@
+"""
+Benchmarks processing tweets of a stream with ItemProcessor, parsing and
+filtering tweets on the event loop before cleaning and classifying them in
+worker processes, and parsing, filtering, cleaning and classifying them in
+one pass in the workers with item generators in raw mode. The CPU time of
+the main process is the time the event loop is busy with items
+
+Usage: python -m benchmarks.bench_parse_in_workers --tweets 20000 --cores 2
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.bench_json import create_tweets
+from veryscrape.items import END_OF_STREAM
+from veryscrape.scrapers.twitter import TweetGen
+from veryscrape.wrappers import ItemProcessor
+
+
+async def process(tweets, raw, args):
+    q = asyncio.Queue()
+    for line in tweets:
+        q.put_nowait(line)
+    q.put_nowait(END_OF_STREAM)
+    item_gen = TweetGen(q, topic='__classify__', source='twitter')
+    item_gen.raw = raw
+    items = ItemProcessor(item_gen, n_cores=args.cores,
+                          batch_size=args.batch_size)
+    items.update_topics(twitter={'data': ['data'], 'coffee': ['caf\xe9']})
+
+    n_items = 0
+    wall, cpu = time.perf_counter(), time.process_time()
+    async for _ in items:
+        n_items += 1
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    items.pool.shutdown(wait=True)
+    return n_items, wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tweets', type=int, default=20000)
+    parser.add_argument('--cores', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    tweets = create_tweets(args.tweets)
+    loop = asyncio.get_event_loop()
+    for name, raw in (('parse on event loop', False),
+                      ('parse in workers', True)):
+        n_items, wall, cpu = loop.run_until_complete(
+            process(tweets, raw, args))
+        print('%-20s %6.2f s, %6.0f tweets/s, %6.1f us of main process '
+              'CPU/tweet, %d items' % (name, wall, len(tweets) / wall,
+                                       cpu / len(tweets) * 1e6, n_items))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmarks the idle CPU usage of the item pipeline and the latency of an item
+travelling from a scraper queue to the VeryScrape output queue
+
+Usage: python -m benchmarks.bench_pipeline --streams 500 --items 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from veryscrape import VeryScrape, register
+from veryscrape.scrape import Scraper
+
+
+class IdleScraper(Scraper):
+    """Never scrapes anything, items are put on its queues directly"""
+    source = 'bench'
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super(IdleScraper, self).__init__(*args, **kwargs)
+        IdleScraper.instances.append(self)
+
+    async def scrape(self, query, topic='', **kwargs):
+        await asyncio.sleep(3600)
+
+
+async def measure_idle_cpu(seconds):
+    wall, cpu = time.time(), time.process_time()
+    await asyncio.sleep(seconds)
+    return (time.process_time() - cpu) / (time.time() - wall)
+
+
+async def measure_latency(scraper, queue, n_items):
+    topics = list(scraper.queues.keys())
+    latencies = []
+    for k in range(n_items):
+        scraper.queues[topics[k % len(topics)]].put_nowait(time.perf_counter())
+        item = await queue.get()
+        latencies.append(time.perf_counter() - item.content)
+    return latencies
+
+
+async def run(n_streams, n_items, idle_seconds):
+    queue = asyncio.Queue()
+    vs = VeryScrape(queue)
+    config = {'bench': {'': {
+        'topic%d' % k: ['query'] for k in range(n_streams)
+    }}}
+    future = asyncio.ensure_future(vs.scrape(config, n_cores=-1))
+    await asyncio.sleep(0.5)
+
+    cpu = await measure_idle_cpu(idle_seconds)
+    print('Idle CPU usage with %d streams: %.1f%%' % (n_streams, cpu * 100))
+
+    latencies = sorted(await measure_latency(
+        IdleScraper.instances[-1], queue, n_items))
+    print('Latency over %d items: mean %.3f ms, p50 %.3f ms, p99 %.3f ms' % (
+        n_items, statistics.mean(latencies) * 1e3,
+        latencies[len(latencies) // 2] * 1e3,
+        latencies[int(len(latencies) * 0.99)] * 1e3
+    ))
+
+    vs.close()
+    await future
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--streams', type=int, default=500)
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--idle-seconds', type=float, default=5.)
+    args = parser.parse_args()
+
+    register('bench', IdleScraper)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(run(args.streams, args.items, args.idle_seconds))
+
+
+if __name__ == '__main__':
+    main()
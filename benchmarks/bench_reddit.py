@@ -0,0 +1,214 @@
+"""
+Benchmarks scraping a subreddit from a local mock Reddit server,
+which answers each request after a delay like the round trip to Reddit.
+Comments are fetched for one link after another keeping only top level
+comments, as Reddit scraped before, and with scrapers.Reddit fetching
+the comment trees of links concurrently, with nested replies and
+comments hidden behind 'more' stubs. Then the subreddit is scraped again
+after new comments were added to a few links, fetching every comment
+tree again, or only the new comments of the subreddit with the state
+kept by Reddit. Rate limits are disabled
+
+Usage: python -m benchmarks.bench_reddit --links 100 --latency 0.05 --new 50
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+from veryscrape.scrapers.reddit import Reddit, RedditSession
+
+
+class MockReddit:
+    def __init__(self, args):
+        self.args = args
+        # All comments in the order they were created
+        self.comments = []
+        self.names = {}
+        self.trees = {}
+        self.counts = {}
+        self.bytes_sent = 0
+        self.requests = 0
+        for k in range(args.links):
+            link = 'link%d' % k
+            self.counts[link] = 0
+            self.trees[link] = [
+                self.comment(link, args.depth, args.replies)
+                for _ in range(args.comments)]
+            self.trees[link].append({'kind': 'more', 'data': {'children': [
+                self.comment(link, 0, 0)['data']['id']
+                for _ in range(args.more)]}})
+
+    def comment(self, link, depth, n_replies):
+        comment_id = 'c%d' % len(self.comments)
+        data = {'id': comment_id, 'name': 't1_' + comment_id,
+                'body': 'some data is brewing %s' % comment_id,
+                'created_utc': float(len(self.comments)), 'replies': ''}
+        comment = {'kind': 't1', 'data': data}
+        self.names[data['name']] = len(self.comments)
+        self.comments.append(comment)
+        self.counts[link] += 1
+        replies = [self.comment(link, depth - 1, n_replies)
+                   for _ in range(n_replies)] if depth else []
+        if replies:
+            data['replies'] = {'data': {'children': replies}}
+        return comment
+
+    def add_comments(self, n_comments):
+        for k in range(n_comments):
+            link = 'link%d' % (k % self.args.changed)
+            self.trees[link].insert(0, self.comment(link, 0, 0))
+
+    async def respond(self, data):
+        await asyncio.sleep(self.args.latency)
+        body = json.dumps(data).encode('utf-8')
+        self.bytes_sent += len(body)
+        self.requests += 1
+        return web.Response(body=body, content_type='application/json')
+
+    async def get_token(self, request):
+        return await self.respond({'access_token': 'abc',
+                                   'expires_in': 3600})
+
+    async def get_links(self, request):
+        return await self.respond({'data': {'children': [
+            {'data': {'id': link, 'num_comments': count}}
+            for link, count in self.counts.items()]}})
+
+    async def get_comments(self, request):
+        return await self.respond([{}, {'data': {
+            'children': self.trees[request.match_info['link']]}}])
+
+    async def get_new_comments(self, request):
+        limit = int(request.query.get('limit', 25))
+        if 'before' in request.query:
+            start = self.names[request.query['before']] + 1
+            comments = self.comments[start:start + limit]
+        else:
+            comments = self.comments[-limit:]
+        return await self.respond({'data': {
+            'children': comments[::-1]}})
+
+    async def get_more(self, request):
+        ids = request.query['children'].split(',')
+        return await self.respond({'json': {'data': {'things': [
+            self.comments[self.names['t1_' + comment_id]]
+            for comment_id in ids]}}})
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_post('/api/v1/access_token', self.get_token)
+        app.router.add_get('/r/{query}/hot.json', self.get_links)
+        app.router.add_get('/r/{query}/comments.json', self.get_new_comments)
+        app.router.add_get('/r/{query}/comments/{link}.json',
+                           self.get_comments)
+        app.router.add_get('/api/morechildren', self.get_more)
+        return app
+
+
+async def scrape_one_by_one(scraper, query):
+    # Reddit.scrape before comments were fetched concurrently
+    n_comments = 0
+    for link in await scraper.get_links(query):
+        res = json.loads(await scraper.client.fetch(
+            'GET', '%s/comments/%s.json' % (query, link),
+            params={'raw_json': 1, 'limit': 10000, 'depth': 10}))
+        n_comments += sum(1 for c in res[1]['data']['children']
+                          if c['kind'] == 't1')
+    return n_comments
+
+
+async def scrape_concurrently(scraper, query):
+    await scraper.scrape(query, topic='topic')
+    n_comments = scraper.queues['topic'].qsize()
+    while not scraper.queues['topic'].empty():
+        scraper.queues['topic'].get_nowait()
+    return n_comments
+
+
+async def start_server(args):
+    mock = MockReddit(args)
+    runner = web.AppRunner(mock.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    url = 'http://127.0.0.1:%d' % site._server.sockets[0].getsockname()[1]
+
+    class LocalRedditSession(RedditSession):
+        base_url = url + '/r/'
+        rate_limits = {}
+
+    class LocalReddit(Reddit):
+        session_class = LocalRedditSession
+
+    def create_scraper(concurrency):
+        LocalReddit.concurrent_requests = concurrency
+        scraper = LocalReddit('key', 'secret')
+        scraper.client.patcher.token_url = url + '/api/v1/access_token'
+        return scraper
+
+    return mock, runner, create_scraper
+
+
+async def main_async(args):
+    mock, runner, create_scraper = await start_server(args)
+    for name, scrape, concurrency in (
+            ('one by one, top level', scrape_one_by_one, 1),
+            ('Reddit.scrape', scrape_concurrently, 1),
+            ('Reddit.scrape', scrape_concurrently, 8),
+            ('Reddit.scrape', scrape_concurrently, 32)):
+        scraper = create_scraper(concurrency)
+        start = time.perf_counter()
+        n_comments = await scrape(scraper, 'data')
+        elapsed = time.perf_counter() - start
+        await scraper.client.close()
+        print('%-22s %2d links at once %6.2f s, %6d comments, '
+              '%6.0f comments/s' % (name, concurrency, elapsed, n_comments,
+                                    n_comments / elapsed))
+    await runner.cleanup()
+
+    for name, incremental in (('all comments', False),
+                              ('only new comments', True)):
+        mock, runner, create_scraper = await start_server(args)
+        scraper = create_scraper(8)
+        await scrape_concurrently(scraper, 'data')
+        mock.add_comments(args.new)
+        if not incremental:
+            scraper.subreddits.clear()
+        requests, bytes_sent = mock.requests, mock.bytes_sent
+        start = time.perf_counter()
+        n_comments = await scrape_concurrently(scraper, 'data')
+        elapsed = time.perf_counter() - start
+        await scraper.client.close()
+        await runner.cleanup()
+        print('Scraping again, %-17s %6.2f s, %4d requests, %7.1f KB, '
+              '%6d comments' % (name, elapsed, mock.requests - requests,
+                                (mock.bytes_sent - bytes_sent) / 1024,
+                                n_comments))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--links', type=int, default=100)
+    parser.add_argument('--comments', type=int, default=20,
+                        help='top level comments of each link')
+    parser.add_argument('--replies', type=int, default=2,
+                        help='replies to each comment')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='depth of replies to top level comments')
+    parser.add_argument('--more', type=int, default=150,
+                        help='comments of each link hidden behind a stub')
+    parser.add_argument('--new', type=int, default=50,
+                        help='comments added before scraping again')
+    parser.add_argument('--changed', type=int, default=10,
+                        help='links new comments are added to')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds the server waits before answering')
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
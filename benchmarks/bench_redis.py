@@ -0,0 +1,79 @@
+"""
+Benchmarks pushing items to a local redis server one rpush at a time,
+as the cli used to, against writer.RedisWriter
+
+Usage: python -m benchmarks.bench_redis --items 20000 --port 6379
+"""
+import argparse
+import asyncio
+import time
+
+from redis import Redis
+
+from veryscrape.items import Item
+from veryscrape.writer import RedisWriter, format_item
+
+KEY = 'veryscrape:bench'
+
+
+async def push_each(db, items):
+    for item in items:
+        db.rpush(KEY, format_item(item))
+
+
+async def push_batched(db, items, batch_size):
+    writer = RedisWriter(db, key=KEY, batch_size=batch_size)
+    for item in items:
+        await writer.put(item)
+    await writer.close()
+    return writer
+
+
+async def measure_loop_lag(future, interval=1e-3):
+    # The longest time the loop was blocked while pushing items
+    lag = 0.
+    while not future.done():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(lag, time.perf_counter() - start - interval)
+    return lag
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    future = asyncio.ensure_future(coro)
+    lag = await measure_loop_lag(future)
+    return time.perf_counter() - start, lag, await future
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+
+    db = Redis(host=args.host, port=args.port)
+    items = [Item('some data ' * 20, 'topic', 'source')
+             for _ in range(args.items)]
+    loop = asyncio.get_event_loop()
+
+    db.delete(KEY)
+    seconds, lag, _ = loop.run_until_complete(timed(push_each(db, items)))
+    print('rpush per item:    %8.0f items/s, max loop lag %7.2f ms' % (
+        len(items) / seconds, lag * 1e3))
+
+    for batch_size in (10, 100, 1000):
+        db.delete(KEY)
+        seconds, lag, writer = loop.run_until_complete(
+            timed(push_batched(db, items, batch_size)))
+        print('batch size %5d: %8.0f items/s, max loop lag %7.2f ms, '
+              'mean batch %6.1f, mean flush %.2f ms, max flush %.2f ms' % (
+                  batch_size, len(items) / seconds, lag * 1e3,
+                  writer.mean_batch_size, writer.mean_flush_seconds * 1e3,
+                  writer.max_flush_seconds * 1e3))
+    db.delete(KEY)
+
+
+if __name__ == '__main__':
+    main()
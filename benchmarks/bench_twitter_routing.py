@@ -0,0 +1,75 @@
+"""
+Benchmarks routing synthetic tweets to topics. With one filter stream
+for each query, every tweet is sent and decoded once for each query it
+matches, while one shared stream for all queries of a credential decodes
+every tweet once and matches it to topics with scrapers.twitter's
+KeywordMatcher
+
+Usage: python -m benchmarks.bench_twitter_routing --tweets 20000 --queries 50
+"""
+import argparse
+import json
+import random
+import time
+
+from veryscrape.scrapers.twitter import KeywordMatcher, _tweet_text
+
+
+def create_tweets(n_tweets, vocabulary, rng):
+    tweets = []
+    for k in range(n_tweets):
+        # Word frequencies follow a power law, like words of tweets
+        words = [vocabulary[int(len(vocabulary) ** rng.random()) - 1]
+                 for _ in range(rng.randint(5, 30))]
+        tweets.append(json.dumps({
+            'id': k, 'text': ' '.join(words), 'timestamp_ms': '1527352873612',
+            'user': {'id': k, 'name': 'user%d' % k, 'description': 'a' * 100},
+            'entities': {'hashtags': [], 'urls': []}}).encode('utf-8'))
+    return tweets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tweets', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = ['word%d' % k for k in range(args.vocabulary)]
+    queries = rng.sample(vocabulary[:args.vocabulary // 10], args.queries)
+    matcher = KeywordMatcher()
+    for k, query in enumerate(queries):
+        matcher.add(query, 'topic%d' % (k % 10))
+    tweets = create_tweets(args.tweets, vocabulary, rng)
+    # Tweets Twitter sends on each stream of one query
+    streams = [[line for line in tweets
+                if query in json.loads(line.decode('utf-8'))['text'].split()]
+               for query in queries]
+
+    start = time.perf_counter()
+    decoded = 0
+    for stream in streams:
+        for line in stream:
+            json.loads(line.decode('utf-8'))
+            decoded += 1
+    per_query = time.perf_counter() - start
+
+    # Only tweets matching any query are sent on the shared stream
+    sent = [line for line in tweets if matcher.match(
+        json.loads(line.decode('utf-8'))['text'])]
+    start = time.perf_counter()
+    routed = 0
+    for line in sent:
+        tweet = json.loads(line.decode('utf-8'))
+        routed += len(matcher.match(_tweet_text(tweet)))
+    shared = time.perf_counter() - start
+
+    print('Stream for each query: %3d connections, %7d tweets decoded, '
+          '%.3f s' % (len(queries), decoded, per_query))
+    print('Shared stream:         %3d connections, %7d tweets decoded, '
+          '%.3f s, %d routed to topics' % (1, len(sent), shared, routed))
+
+
+if __name__ == '__main__':
+    main()
@@ -18,6 +18,9 @@ requirements = [
     'redis>=2.10.6'
 ]
 
+# Optional faster JSON decoding, see veryscrape.fastjson
+extra_requirements = {'json': ['orjson']}
+
 setup_requirements = ['pytest-runner', ]
 
 test_requirements = ['pytest', ]
@@ -40,6 +43,7 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require=extra_requirements,
     license="GNU General Public License v3",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
@@ -41,6 +41,25 @@ class FakeStreamReader:
             data += item
         return data
 
+    def iter_chunked(self, n):
+        return FakeChunkReader(self.data, n)
+
+
+class FakeChunkReader:
+    def __init__(self, data, n):
+        self.data = data
+        self.n = n
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0)
+        if not self.data:
+            raise StopAsyncIteration
+        chunk, self.data = self.data[:self.n], self.data[self.n:]
+        return chunk
+
 
 class FakeResponse:
     def __init__(self, method, url, status, body):
@@ -50,6 +69,8 @@ class FakeResponse:
         self.version = '1.1'
         self.status = status
         self._body = body
+        self.charset = 'utf-8'
+        self.closed = False
 
     async def json(self, **kwargs):
         return json.loads(self._body.decode(encoding='utf-8'))
@@ -61,6 +82,21 @@ class FakeResponse:
     def content(self):
         return FakeStreamReader(self._body)
 
+    @property
+    def headers(self):
+        return {'Content-Length': str(len(self._body))}
+
+    @property
+    def content_type(self):
+        if self._body[:1] in (b'{', b'['):
+            return 'application/json'
+        elif self._body.lstrip()[:1] == b'<':
+            return 'text/html'
+        return 'application/octet-stream'
+
+    def close(self):
+        self.closed = True
+
     def raise_for_status(self):
         if self.status != 200:
             err = aiohttp.ClientResponseError({}, [])
@@ -183,12 +219,29 @@ class TestRedis:
     def __init__(self, *args, **kwargs):
         pass
 
-    def rpush(self, key, d):
-        self.data[key].append(d)
+    def rpush(self, key, *values):
+        self.data[key].extend(values)
 
     def lpop(self, key):
         return self.data[key].popleft()
 
+    def pipeline(self, transaction=True):
+        return TestPipeline(self)
+
+
+class TestPipeline:
+    def __init__(self, db):
+        self.db = db
+        self.commands = []
+
+    def rpush(self, key, *values):
+        self.commands.append((self.db.rpush, key, values))
+
+    def execute(self):
+        for command, key, values in self.commands:
+            command(key, *values)
+        self.commands = []
+
 
 class TestItemGen(ItemGenerator):
     def process_text(self, text):
@@ -285,7 +338,8 @@ def html_scraper(request):
         if url == 'urls':
             return 'http://example.com\nhttps://example.com'
         else:
-            return '<html>stuff%d</html>' % len(TestHTMLScraper.calls)
+            return '<html><p>there is some stuff%d in the page</p></html>' \
+                % len(TestHTMLScraper.calls)
     veryscrape.session.Session.fetch = _add
     request.addfinalizer(TestHTMLScraper.calls.clear)
 
@@ -412,6 +466,8 @@ FakeInternet.register(method='POST', path=r'reddit.com/api/v1/access_token', dat
 FakeInternet.register(path='fstream', data=b'\n'.join([b'test%d' % i for i in range(10)]))
 FakeInternet.register(path='fail', data=b'failed', status=404)
 FakeInternet.register(path='fetch', data=b'test')
+FakeInternet.register(path='fpage', data=FakeInternet.html('caf\xe9 ' * 100))
+FakeInternet.register(path='fbinary', data=b'\x89PNG\r\n' * 100)
 FakeInternet.register(path='user', data=lambda **k: k.pop('headers', {}).pop('user-agent', None))
 FakeInternet.register(path='error', data=b'failed', status=400)
 FakeInternet.register(path='exception', data=1)  # data not bytes causes error
@@ -420,7 +476,13 @@ FakeInternet.register(path=r'news\.google\.com', data=FakeInternet.html(['http:/
 FakeInternet.register(path=r'oauth\.reddit\.com/r/\w+/\w+\.json', data={"data": {"children": [{"data": {"id": "id"}}]}})
 FakeInternet.register(path=r'oauth\.reddit\.com/r/\w+/comments/\w+\.json',
                       data=b'[0, {"data": {"children": [{"kind": "t1", '
-                           b'"data": {"body": "some data", "created_utc": 0.0}}]}}]')
+                           b'"data": {"body": "some data", "created_utc": 0.0, "replies": '
+                           b'{"data": {"children": [{"kind": "t1", '
+                           b'"data": {"body": "some data reply", "created_utc": 1.0, "replies": ""}}]}}}}, '
+                           b'{"kind": "more", "data": {"children": ["c1", "c2"]}}]}}]')
+FakeInternet.register(path=r'oauth\.reddit\.com/api/morechildren',
+                      data={"json": {"data": {"things": [
+                          {"kind": "t1", "data": {"body": "some data more", "created_utc": 2.0}}]}}})
 FakeInternet.register(method='POST', path=r'stream\.twitter\.com',
                       data=b'{"created_at":"Sat May 26 16:41:11 +0000 2018","text":"some data 2",'
                            b'"created_at":"Fri Oct 28 22:38:06 +0000 2016","timestamp_ms":"1527352873612"}\r\n'
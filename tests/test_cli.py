@@ -1,6 +1,7 @@
 from threading import Thread
 from _thread import interrupt_main
-from veryscrape.cli import main
+from veryscrape.cli import main, _push_items
+import asyncio
 import pytest
 import time
 
@@ -21,3 +22,33 @@ def test_main(patched_aiohttp, temp_config, patched_redis):
         _, topic, _, content = patched_redis.lpop('events').split('|')
         assert topic == 'topic1', 'Incorrect topic for item'
         assert 'some data' in content, 'Data did not pass through cleaning'
+
+
+class FakeScraper:
+    def __init__(self):
+        self.kill_event = asyncio.Event()
+
+
+class FakeWriter:
+    def __init__(self):
+        self.items = []
+        self.closed = False
+
+    async def put(self, item):
+        self.items.append(item)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_push_items():
+    scraper, queue, writer = FakeScraper(), asyncio.Queue(), FakeWriter()
+    future = asyncio.ensure_future(_push_items(scraper, queue, writer))
+    for k in range(3):
+        await queue.put(k)
+    await asyncio.sleep(0.01)
+    assert writer.items == [0, 1, 2], 'Did not put items in writer'
+    scraper.kill_event.set()
+    await asyncio.wait_for(future, 1)
+    assert writer.closed, 'Did not close writer'
@@ -0,0 +1,72 @@
+import pytest
+from veryscrape.dedup import RotatingBloomFilter, SeenSet, SimHashIndex, \
+    simhash, text_digest
+
+
+@pytest.mark.parametrize('store', [SeenSet, RotatingBloomFilter])
+def test_store_remembers_recent_texts(store):
+    seen = store(100)
+    assert all(seen.add(str(k)) for k in range(100)), 'Did not add new texts'
+    assert not any(seen.add(str(k)) for k in range(100)), \
+        'Did not remember recent texts'
+    for k in range(100, 1000):
+        seen.add(str(k))
+    assert not any(seen.add(str(k)) for k in range(900, 1000)), \
+        'Did not remember recent texts'
+    assert seen.memory_usage > 0, 'Did not report memory usage'
+
+
+@pytest.mark.parametrize('store', [SeenSet, RotatingBloomFilter])
+def test_store_add_digest(store):
+    seen = store(100)
+    assert seen.add_digest(text_digest('text')), 'Did not add new digest'
+    assert not seen.add('text'), 'Did not remember text by its digest'
+    assert seen.add_digest(text_digest('other')), 'Did not add new digest'
+
+
+def test_seen_set_forgets_oldest():
+    seen = SeenSet(10)
+    for k in range(15):
+        seen.add(str(k))
+    assert len(seen) == 10, 'Remembered more than max items'
+    assert all(seen.add(str(k)) for k in range(5)), 'Did not forget oldest'
+    assert seen.false_positive_rate < 1e-15, 'Incorrect false positive rate'
+
+
+def test_rotating_bloom_filter_false_positive_rate():
+    seen = RotatingBloomFilter(10000, error_rate=0.01)
+    for k in range(25000):
+        seen.add('seen%d' % k)
+    false_positives = sum(not seen.add('unseen%d' % k) for k in range(10000))
+    assert 0 < seen.false_positive_rate < 0.05, \
+        'Incorrect estimated false positive rate'
+    assert false_positives / 10000 < 2 * seen.false_positive_rate, \
+        'Too many false positives'
+    assert seen.memory_usage < 30000, 'Used too much memory'
+
+
+def test_simhash():
+    words = ['word%d' % k for k in range(100)]
+    text = ' '.join(words)
+    assert simhash(text) == simhash(text.upper() + '!!!'), \
+        'Simhash depends on case or punctuation'
+    near = bin(simhash(text) ^ simhash(text + ' via')).count('1')
+    assert near <= 10, 'Simhashes of near-duplicates differ too much'
+    other = bin(simhash(text) ^ simhash(text.replace('1', '2'))).count('1')
+    assert other > near, 'Simhashes of different texts too similar'
+    assert simhash('') == 0, 'Incorrect simhash of empty text'
+
+
+def test_simhash_index():
+    index = SimHashIndex(max_distance=3, window=10, max_items=3)
+    assert index.add(0b1111, now=0), 'Did not add new hash'
+    assert not index.add(0b1000, now=0), 'Did not find near-duplicate'
+    assert index.add(0b1111 << 60, now=0), \
+        'Found near-duplicate of distant hash'
+    assert index.add(0b1111, key='other', now=0), \
+        'Found near-duplicate with a different key'
+    assert index.add(0b0111 << 30, now=0), 'Did not add new hash'
+    assert len(index) == 3, 'Remembered more than max items'
+    assert index.add(0b1000, now=0), 'Did not forget oldest hash'
+    assert index.add(0b0111 << 30, now=11), 'Did not forget hash after window'
+    assert len(index) == 1, 'Did not forget hashes after window'
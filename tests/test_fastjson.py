@@ -0,0 +1,39 @@
+import json
+import pytest
+from veryscrape import fastjson
+
+TWEET = json.dumps({
+    'user': {'text': 'nested', 'description': '{"text": "in a string"}'},
+    'text': 'some "data" {', 'entities': {'urls': [{'timestamp_ms': 0}]},
+    'timestamp_ms': '1527352873612'
+}).encode('utf-8')
+
+
+@pytest.mark.parametrize('backend', fastjson.BACKENDS)
+def test_backends(backend):
+    try:
+        fastjson.use_backend(backend)
+    except ImportError:
+        pytest.skip('%s is not installed' % backend)
+    try:
+        assert fastjson.loads(TWEET) == json.loads(TWEET.decode('utf-8')), \
+            'Did not decode bytes'
+        assert fastjson.loads('[1]') == [1], 'Did not decode str'
+        with pytest.raises(ValueError):
+            fastjson.loads(b'{"text": ')
+    finally:
+        fastjson.use_backend()
+
+
+def test_unknown_backend():
+    with pytest.raises(ImportError):
+        fastjson.use_backend('simdjson')
+
+
+def test_project():
+    fields = fastjson.project(TWEET, ('text', 'timestamp_ms', 'user', 'id'))
+    assert fields == {
+        'text': 'some "data" {', 'timestamp_ms': '1527352873612',
+        'user': {'text': 'nested',
+                 'description': '{"text": "in a string"}'}
+    }, 'Did not decode only top level fields'
@@ -0,0 +1,89 @@
+import asyncio
+import time
+import pytest
+from veryscrape.frontier import SQLiteFrontier, URLFrontier
+
+
+@pytest.mark.asyncio
+async def test_frontier_round_robin():
+    frontier = URLFrontier(max_per_host=10)
+    for k in range(3):
+        for host in ('a.com', 'b.com'):
+            assert frontier.add('http://%s/%d' % (host, k)), 'Did not add url'
+    assert not frontier.add('http://a.com/0'), 'Added seen url'
+    urls = []
+    for _ in range(6):
+        urls.append(await frontier.get())
+    assert urls == ['http://%s/%d' % (host, k)
+                    for k in range(3) for host in ('a.com', 'b.com')], \
+        'Hosts did not take turns'
+
+
+@pytest.mark.asyncio
+async def test_frontier_max_per_host():
+    frontier = URLFrontier(max_per_host=2)
+    for k in range(3):
+        frontier.add('http://a.com/%d' % k)
+    frontier.add('http://b.com/0')
+    urls = []
+    for _ in range(3):
+        urls.append(await frontier.get())
+    assert urls == ['http://a.com/0', 'http://b.com/0', 'http://a.com/1'], \
+        'Incorrect order of urls'
+
+    getter = asyncio.ensure_future(frontier.get())
+    await asyncio.sleep(1e-2)
+    assert not getter.done(), 'Crawled too many urls of one host at once'
+    frontier.done('http://a.com/0')
+    assert await getter == 'http://a.com/2', 'Did not crawl next url of host'
+
+    for url in urls[1:] + ['http://a.com/2']:
+        frontier.done(url)
+    assert await frontier.get() is None, 'Did not finish after all urls'
+
+
+@pytest.mark.asyncio
+async def test_frontier_delay():
+    frontier = URLFrontier(delay=0.05)
+    frontier.add('http://a.com/0')
+    frontier.add('http://a.com/1')
+    start = time.monotonic()
+    await frontier.get()
+    await frontier.get()
+    assert time.monotonic() - start >= 0.05, 'Did not wait between urls'
+
+
+def test_frontier_max_urls():
+    frontier = URLFrontier(max_urls=2)
+    assert all(frontier.add('http://a.com/%d' % k) for k in range(2)), \
+        'Did not add url'
+    assert not frontier.add('http://a.com/2'), 'Added url to full frontier'
+    assert len(frontier) == 2 and frontier.dropped == 1, \
+        'Did not drop url when full'
+
+
+@pytest.mark.asyncio
+async def test_sqlite_frontier_resumes(tmpdir):
+    path = str(tmpdir.join('crawl.db'))
+    frontier = SQLiteFrontier(path, max_urls=2)
+    for k in range(5):
+        assert frontier.add('http://a.com/%d' % k), 'Did not add url'
+    assert len(frontier) == 5, 'Did not count urls in database'
+    url = await frontier.get()
+    frontier.done(url)
+    # Crawling, but not done when the frontier is closed
+    await frontier.get()
+    frontier.close()
+
+    frontier = SQLiteFrontier(path, max_urls=2)
+    assert not frontier.add('http://a.com/0'), 'Did not remember seen url'
+    assert len(frontier) == 4, 'Did not resume waiting urls'
+    urls = []
+    while len(urls) < 4:
+        url = await frontier.get()
+        urls.append(url)
+        frontier.done(url)
+    assert urls == ['http://a.com/%d' % k for k in range(1, 5)], \
+        'Did not resume urls in order'
+    assert await frontier.get() is None, 'Did not finish after all urls'
+    frontier.close()
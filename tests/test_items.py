@@ -1,6 +1,8 @@
 import asyncio
 import pytest
-from veryscrape.items import ItemGenerator
+from datetime import datetime
+from veryscrape.items import ItemGenerator, DroppingQueue, END_OF_STREAM, \
+    Item, encode_item, decode_item
 
 
 @pytest.mark.asyncio
@@ -54,3 +56,100 @@ async def test_item_generator_cancelled():
     with pytest.raises(StopAsyncIteration):
         await items.__anext__()
 
+
+@pytest.mark.asyncio
+async def test_item_generator_cancelled_while_waiting():
+    items = ItemGenerator(asyncio.Queue(), topic='test', source='t')
+    future = asyncio.ensure_future(items.__anext__())
+    await asyncio.sleep(0)
+    items.cancel()
+    with pytest.raises(StopAsyncIteration):
+        await asyncio.wait_for(future, 1)
+
+
+@pytest.mark.asyncio
+async def test_item_generator_end_of_stream():
+    q = asyncio.Queue()
+    q.put_nowait('0')
+    q.put_nowait(END_OF_STREAM)
+
+    contents = []
+    async for item in ItemGenerator(q, topic='test', source='t'):
+        contents.append(item.content)
+    assert contents == ['0'], 'Did not stop at end of stream'
+
+    async for _ in ItemGenerator(q, topic='test', source='t'):
+        assert False, 'End of stream was not seen by all generators of queue'
+
+
+@pytest.mark.parametrize('overflow, expected', [
+    ('drop_oldest', [3, 4]),
+    ('drop_newest', [0, 1])
+])
+@pytest.mark.asyncio
+async def test_dropping_queue(overflow, expected):
+    q = DroppingQueue(2, overflow=overflow)
+    for i in range(5):
+        await q.put(i)
+    assert [q.get_nowait() for _ in range(2)] == expected, \
+        'Did not drop correct items'
+    assert q.dropped == 3, 'Did not count dropped items'
+
+
+@pytest.mark.parametrize('overflow', ['drop_oldest', 'drop_newest'])
+@pytest.mark.asyncio
+async def test_dropping_queue_keeps_end_of_stream(overflow):
+    q = DroppingQueue(2, overflow=overflow)
+    await q.put(0)
+    await q.put(END_OF_STREAM)
+    for i in range(1, 5):
+        await q.put(i)
+    await q.put(END_OF_STREAM)
+    items = [q.get_nowait() for _ in range(q.qsize())]
+    assert END_OF_STREAM in items, 'Dropped end of stream'
+
+    async for _ in ItemGenerator(q, topic='test', source='t'):
+        pass
+    assert q.get_nowait() is END_OF_STREAM, 'Did not end stream'
+
+
+@pytest.mark.asyncio
+async def test_item_generator_end_of_stream_full_queue():
+    q = asyncio.Queue(1)
+    first = asyncio.ensure_future(
+        ItemGenerator(q, topic='test', source='t').__anext__())
+    await asyncio.sleep(0)
+    q.put_nowait(END_OF_STREAM)
+    await asyncio.sleep(0)
+    # The scraper fills the queue before the generator sees the end
+    q.put_nowait('item')
+    with pytest.raises(StopAsyncIteration):
+        await asyncio.wait_for(first, 1)
+
+    items = [item async for item in ItemGenerator(q, topic='test',
+                                                      source='t')]
+    assert [i.content for i in items] == ['item'], \
+        'End of stream was not seen by all generators of queue'
+
+
+def test_encode_decode_item():
+    created_at = datetime(2018, 3, 1, 12, 30, 15, 123000)
+    item = Item('some | content\n with ünïcödé', 'topic|1', 'twitter',
+                created_at)
+    decoded = decode_item(encode_item(item))
+    assert decoded.content == item.content, 'Incorrect decoded content'
+    assert decoded.topic == item.topic, 'Incorrect decoded topic'
+    assert decoded.source == item.source, 'Incorrect decoded source'
+    assert decoded.created_at == created_at, 'Incorrect decoded created_at'
+
+    timestamp = Item('', '', '', created_at.timestamp())
+    assert decode_item(encode_item(timestamp)).created_at == created_at, \
+        'Incorrect decoded created_at from timestamp'
+
+
+def test_decode_item_invalid():
+    data = encode_item(Item('content', 'topic', 'source'))
+    with pytest.raises(ValueError):
+        decode_item(b'\x00' + data[1:])
+    with pytest.raises(ValueError):
+        decode_item(data[:-1])
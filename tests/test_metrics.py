@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from veryscrape.metrics import MetricsServer, Registry
+
+
+def test_registry_exposition():
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Requests', labels=('x',))
+    requests.labels('a').inc()
+    requests.labels('a').inc(2)
+    requests.labels('b"\n').inc()
+    registry.gauge('queued', 'Queued items', function=lambda: 3)
+    latency = registry.histogram('latency_seconds', 'Latency',
+                                 buckets=(0.1, 1.))
+    for value in (0.05, 0.1, 0.5, 2.):
+        latency.observe(value)
+
+    assert registry.exposition().splitlines() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{x="a"} 3.0',
+        'requests_total{x="b\\"\\n"} 1.0',
+        '# HELP queued Queued items',
+        '# TYPE queued gauge',
+        'queued 3',
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        'latency_seconds_sum 2.65',
+        'latency_seconds_count 4',
+    ], 'Incorrect exposition of metrics'
+
+
+def test_registry_existing_metric():
+    registry = Registry()
+    counter = registry.counter('items_total')
+    assert registry.counter('items_total') is counter, \
+        'Did not return existing metric'
+    with pytest.raises(ValueError):
+        registry.gauge('items_total')
+
+
+@pytest.mark.asyncio
+async def test_metrics_server(unused_tcp_port):
+    registry = Registry()
+    registry.counter('items_total', 'Items').inc(5)
+    server = MetricsServer(registry, port=unused_tcp_port)
+    await server.start()
+    responses = []
+    for path in ('/metrics', '/'):
+        reader, writer = await asyncio.open_connection(
+            '127.0.0.1', unused_tcp_port)
+        writer.write(b'GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n' %
+                     path.encode())
+        responses.append(await reader.read())
+        writer.close()
+    await server.close()
+
+    assert responses[0].startswith(b'HTTP/1.1 200 OK\r\n'), \
+        'Did not serve metrics'
+    body = responses[0].split(b'\r\n\r\n', 1)[1]
+    assert body == registry.exposition().encode(), \
+        'Did not serve exposition of metrics'
+    assert responses[1].startswith(b'HTTP/1.1 404'), 'Served unknown path'
@@ -0,0 +1,19 @@
+import asyncio
+import time
+import pytest
+from veryscrape.monitor import LoopLagMonitor
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor():
+    monitor = LoopLagMonitor(interval=1e-2, threshold=0.04)
+    monitor.start()
+    await asyncio.sleep(5e-2)
+    # Blocks the loop like a slow callback
+    time.sleep(0.1)
+    await asyncio.sleep(5e-2)
+    monitor.stop()
+    assert monitor.samples >= 2, 'Did not measure lag'
+    assert monitor.max_lag >= 0.08, 'Did not measure blocked loop'
+    assert monitor.slow == 1, 'Did not count lag over threshold'
+    assert monitor.mean_lag < monitor.max_lag, 'Incorrect mean lag'
@@ -2,7 +2,8 @@ import pytest
 import re
 import random
 
-from veryscrape.items import Item
+from veryscrape.dedup import text_digest
+from veryscrape.items import Item, ItemGenerator
 from veryscrape.process import *
 
 # size of data used for tests makes using parametrize too slow
@@ -66,12 +67,111 @@ def test_clean_item(static_data):
             'Item has an uncleaned link! {}'.format(res)
 
 
+def _random_texts(n):
+    rng = random.Random(0)
+    pieces = ['#', '@', '|', '\uff03', 'R', 'T', 'RT', ':', ' ', '  ', '\n',
+              '\t', '\x00', '\x7f', '\u00e9', '\u2603', '[deleted]', '[removed]',
+              '[not found]', '[', 'r/', '/r/', 'abc', '_', '1', 'http', '://',
+              'https://', '.com', '&amp;', '&lt;', '&', '....', '!?', '-', '/']
+    for _ in range(n):
+        yield ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 25)))
+
+
+@pytest.mark.parametrize('funcs', [
+    [clean_tweet, clean_general],
+    [clean_reddit_comment, clean_general],
+    [clean_general]
+])
+def test_compile_cleaner(static_data, funcs):
+    """Test compiled cleaning functions give the same result as the originals"""
+    cleaner = compile_cleaner(funcs)
+    texts = list(_random_texts(20000)) + \
+        static_data('comments') + random.sample(static_data('tweets'), 1000)
+    for text in texts:
+        expected = text
+        for func in funcs:
+            expected = func(expected)
+        assert cleaner(text) == expected, \
+            'Compiled cleaner gave a different result for {!r}'.format(text)
+
+
 def test_classify_text():
     text = 'apple apple microsoft apple microsoft'
     result = classify_text(text, {'AAPL': ['apple'], 'MS': ['microsoft']})
     assert result == 'AAPL', 'Did not correctly classify text'
 
 
+def test_topic_classifier():
+    rng = random.Random(0)
+    words = ['w%d' % k for k in range(50)]
+    topics = {'t%d' % k: rng.sample(words, 5) for k in range(8)}
+    classifier = TopicClassifier(topics)
+    for _ in range(2000):
+        text = ' '.join(rng.choice(words + ['', '.']) for _ in range(30))
+        assert classifier(text) == classify_text(text, topics), \
+            'Did not give the same topic as classify_text'
+
+
+def test_topic_classifier_phrases():
+    classifier = TopicClassifier({'AAPL': ['apple pie', 'Apple'],
+                                  'MS': ['microsoft', 'micro']})
+    text = 'Apple pie... apple PIE, microsoft micro apple-pie'
+    assert classifier(text) == 'AAPL', 'Did not match phrases'
+    assert classifier('pie apple') == 'AAPL', 'Did not match single word'
+    assert classifier('nothing') == '', 'Classified text without queries'
+
+
+def test_process_batch():
+    items = [Item('apple', '__classify__', 'batch'),
+             Item('pear', 'fruit', 'batch')]
+    assert process_batch(items, -1) is None, \
+        'Classified items without current topics'
+
+    result = process_batch(items, -1, {'batch': {'AAPL': ['apple']}})
+    assert [i.topic for i in result] == ['AAPL', 'fruit'], \
+        'Did not classify items with new topics'
+
+    result = process_batch(items, -1)
+    assert [i.topic for i in result] == ['AAPL', 'fruit'], \
+        'Did not classify items with cached topics'
+
+    result = process_batch(items, -1, classify=TopicClassifier)
+    assert [i.topic for i in result] == ['AAPL', 'fruit'], \
+        'Did not classify items with classifier class'
+
+
+class RawGen(ItemGenerator):
+    def process_text(self, text):
+        return text.get('text')
+
+    def process_time(self, text):
+        return text['time']
+
+
+def test_process_raw_batch():
+    register('raw', lambda t: t + '!')
+    items = [({'text': 'apple', 'time': 1}, RawGen, '__classify__', 'raw'),
+             ({'time': 2}, RawGen, 'fruit', 'raw'),
+             ({'text': 'pear'}, RawGen, 'fruit', 'raw'),
+             ({'text': 'pear', 'time': 3}, RawGen, 'fruit', 'raw')]
+    assert process_raw_batch(items, -2) is None, \
+        'Classified items without current topics'
+
+    result = process_raw_batch(items, -2, {'raw': {'AAPL': ['apple']}})
+    assert result[1] is None, 'Did not skip data without text'
+    assert result[2] is None, 'Did not skip data failing to parse'
+    (apple, apple_digest), (pear, pear_digest) = result[0], result[3]
+    assert (apple.content, apple.topic, apple.created_at) == \
+        ('apple!', 'AAPL', 1), 'Did not parse, clean and classify item'
+    assert (pear.content, pear.topic, pear.source) == \
+        ('pear!', 'fruit', 'raw'), 'Did not parse and clean item'
+    assert apple_digest == text_digest('__classify__|apple'), \
+        'Did not hash text remembered by generator'
+    assert pear_digest == text_digest('fruit|pear'), \
+        'Did not hash text remembered by generator'
+    unregister('raw')
+
+
 def test_register():
     register('test1', lambda t: t.replace('1', '2'))
     result = clean_item(Item('aa1a1a1', source='test1'))
@@ -103,3 +203,60 @@ def test_custom_clean_func():
     item = Item('data @123@ data', '', 'custom')
     cleaned = veryscrape.process.clean_item(item)
     assert cleaned.content == 'data data', 'Did not clean custom item correctly'
+
+
+@pytest.mark.parametrize('url, canonical', [
+    ('HTTP://Example.COM', 'http://example.com/'),
+    ('https://example.com:443/a?b=1#c', 'https://example.com/a?b=1'),
+    ('http://example.com:8080/a', 'http://example.com:8080/a'),
+    ('http://example.com/?utm_source=x&id=1&fbclid=y',
+     'http://example.com/?id=1'),
+    ('../c/d', 'http://example.com/c/d'),
+    ('//cdn.example.com/e', 'http://cdn.example.com/e'),
+    ('mailto:someone@example.com', None),
+    ('javascript:void(0)', None),
+])
+def test_canonicalize_url(url, canonical):
+    assert canonicalize_url(url, 'http://example.com/a/b') == canonical, \
+        'Incorrect canonical url'
+
+
+def test_extract_urls():
+    html = '''<html><head><base href="/base/"></head><body>
+    <a href="page?a=1&amp;utm_medium=b#top">1</a>
+    <A HREF='HTTP://Other.com:80/x'>2</A>
+    <a data-href="ignored" href=third.html>3</a>
+    <a href="mailto:someone@example.com">4</a>
+    </body></html>'''
+    assert extract_urls(html, base_url='http://example.com/dir/page') == {
+        'http://example.com/base/page?a=1',
+        'http://other.com/x',
+        'http://example.com/base/third.html'
+    }, 'Did not extract canonical urls'
+    assert extract_urls('<a href="relative">') == {'relative'}, \
+        'Did not keep relative url without base url'
+    assert extract_urls('') == set(), 'Extracted urls from empty text'
+
+
+@pytest.mark.filterwarnings('ignore::DeprecationWarning')
+def test_parse_html(static_data):
+    for h in static_data('htmls'):
+        text, urls, _ = parse_html(h, 'http://example.com/')
+        assert text == clean_article(h), 'Did not extract article text'
+        # Urls in comments are only found by extract_urls
+        assert urls and urls <= extract_urls(h, 'http://example.com/'), \
+            'Did not extract urls'
+
+    html = '''<html><head>
+    <meta property="article:published_time" content="2018-05-01T10:00:00">
+    <base href="/base/"></head><body>
+    <p>There is some data in the page, and it is brewing</p>
+    <a href="page#top">1</a>
+    </body></html>'''
+    text, urls, published = parse_html(html, 'http://example.com/dir/page')
+    assert text == 'There is some data in the page, and it is brewing', \
+        'Did not extract article text'
+    assert urls == {'http://example.com/base/page'}, 'Did not extract urls'
+    assert published.timetuple()[:4] == (2018, 5, 1, 10), \
+        'Did not extract publish date'
+    assert parse_html('') == ('', set(), None), 'Parsed empty html'
@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 from veryscrape.scrape import SearchEngineScraper
 
@@ -13,6 +14,32 @@ async def test_scrape(scraper):
     await scraper.client.close()
 
 
+@pytest.mark.asyncio
+async def test_scrape_bounded_queue(scraper):
+    scraper = scraper()
+    scraper.queue_size = 2
+    future = asyncio.ensure_future(scraper.scrape('query', topic='topic'))
+    await asyncio.sleep(1e-2)
+    assert not future.done(), 'Did not wait for space in full queue'
+    assert scraper.queues['topic'].qsize() == 2, 'Queue grew past its limit'
+
+    for i in range(5):
+        assert (await scraper.queues['topic'].get()) == 'test%d' % i, \
+            'Did not put correct data in queue'
+    await future
+    await scraper.client.close()
+
+
+@pytest.mark.asyncio
+async def test_scrape_dropping_queue(scraper):
+    scraper = scraper()
+    scraper.queue_size = 2
+    scraper.queue_overflow = 'drop_oldest'
+    await scraper.scrape('query', topic='topic')
+    assert scraper.dropped_items == 3, 'Did not count dropped items'
+    await scraper.client.close()
+
+
 @pytest.mark.asyncio
 async def test_stream(scraper):
     scraper = scraper()
@@ -25,14 +52,28 @@ async def test_stream(scraper):
     await scraper.close()
 
 
+@pytest.mark.asyncio
+async def test_stream_shared_seen_store(scraper):
+    scraper = scraper()
+    gens = []
+    for topic in ('t1', 't2'):
+        gens.append(scraper.stream('query', topic=topic))
+        scraper._stream.cancel()
+    assert gens[0].seen is gens[1].seen, 'Did not share seen store'
+    for gen in gens:
+        assert gen.filter('text'), 'Filtered text seen for another topic'
+        assert not gen.filter('text'), 'Did not filter seen text'
+    await scraper.client.close()
+
+
 @pytest.mark.asyncio
 async def test_html_scrape(html_scraper):
     scraper = html_scraper()
     await scraper.scrape('urls', topic='topic')
-    for i in range(2):
-        item = scraper.queues['topic'].get_nowait()
-        assert item == ('<html>stuff%d</html>' % (i + 2), i), \
-            'Did not put correct data in queue'
+    # Pages are parsed in an executor, so may be put in any order
+    items = sorted(scraper.queues['topic'].get_nowait() for _ in range(2))
+    assert items == [('there is some stuff%d in the page' % (i + 2), i)
+                     for i in range(2)], 'Did not put article text in queue'
     await scraper.client.close()
 
 
@@ -42,10 +83,9 @@ async def test_html_stream(html_scraper):
     scraper.scrape_every = 1e-4
     count = 0
     async for item in scraper.stream('urls', topic='topic'):
-        assert item.content == '<html>stuff%d</html>' % (count + 2), \
-            'Data not correctly wrapped in Item'
-        assert item.created_at == count, \
-            'Time created not correctly wrapped'
+        assert item.content == \
+            'there is some stuff%d in the page' % (item.created_at + 2), \
+            'Data or time created not correctly wrapped in Item'
         if count >= 1:
             break
         count += 1
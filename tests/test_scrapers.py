@@ -1,6 +1,9 @@
 from functools import partial
+import asyncio
+import json
 import pytest
 from veryscrape.scrapers import *
+from veryscrape.scrapers.twitter import KeywordMatcher
 
 SCRAPERS = [
     partial(Twitter, '', '', '', ''),
@@ -33,3 +36,116 @@ async def test_stream(patched_aiohttp, scraper):
         break
     await scraper.close()
     assert got_item, 'Did not get any items from stream'
+
+
+@pytest.mark.asyncio
+async def test_reddit_comment_tree(patched_aiohttp):
+    scraper = Reddit('', '')
+    comments = await scraper.get_comments('data', 'id')
+    await scraper.client.close()
+    assert sorted(comments) == [('some data', 0.0), ('some data more', 2.0),
+                                ('some data reply', 1.0)], \
+        'Did not get nested replies and comments of more stubs'
+
+
+@pytest.mark.asyncio
+async def test_reddit_incremental():
+    listings = {
+        'data/hot.json': {'data': {'children': [
+            {'data': {'id': 'a', 'num_comments': 1}},
+            {'data': {'id': 'b', 'num_comments': 1}}]}},
+        'data/comments.json': {'data': {'children': [
+            {'kind': 't1', 'data': {'name': 't1_c1', 'body': 'some data 1',
+                                    'created_utc': 1.0}}]}},
+        'data/comments/a.json': [0, {'data': {'children': [
+            {'kind': 't1', 'data': {'body': 'some data 0',
+                                    'created_utc': 0.0}}]}}],
+    }
+    urls = []
+
+    async def fetch(method, url, params=None, **kwargs):
+        urls.append((url, (params or {}).get('before')))
+        return json.dumps(listings.get(url, {}))
+
+    scraper = Reddit('', '')
+    scraper.client.fetch = fetch
+    await scraper.scrape('data', topic='topic')
+    assert ('data/comments/a.json', None) in urls, \
+        'Did not fetch comments of new link'
+
+    del urls[:]
+    listings['data/hot.json']['data']['children'][0]['data'][
+        'num_comments'] = 2
+    listings['data/comments.json']['data']['children'] = [
+        {'kind': 't1', 'data': {'name': 't1_c2', 'body': 'some data 2',
+                                'created_utc': 2.0}}]
+    await scraper.scrape('data', topic='topic')
+    await scraper.client.close()
+    assert urls == [('data/hot.json', None), ('data/comments.json', 't1_c1')],\
+        'Did not only fetch new comments of subreddit'
+    items = [scraper.queues['topic'].get_nowait()[0]
+             for _ in range(scraper.queues['topic'].qsize())]
+    assert sorted(items) == ['some data %d' % k for k in range(3)], \
+        'Did not get new comments'
+
+
+def test_keyword_matcher():
+    matcher = KeywordMatcher()
+    assert matcher.add('bitcoin,crypto currency', 'btc'), 'Did not add query'
+    assert matcher.add('Bitcoin', 'money'), 'Did not add topic to phrase'
+    assert not matcher.add('bitcoin', 'btc'), 'Added query twice'
+    assert matcher.track == 'bitcoin,crypto currency', \
+        'Did not merge phrases'
+    assert matcher.match('#BITCOIN is up') == {'btc', 'money'}, \
+        'Did not match phrase of several topics'
+    assert matcher.match('Currency of @crypto') == {'btc'}, \
+        'Did not match words of phrase in any order'
+    assert matcher.match('a crypto, but no bitcoins') == set(), \
+        'Matched text without all words of a phrase'
+
+
+@pytest.mark.asyncio
+async def test_twitter_shared_stream():
+    tweets = [{'text': 'some data on bitcoin', 'timestamp_ms': '0'},
+              {'text': 'some data on ether', 'timestamp_ms': '0'},
+              {'text': 'some data on ether and bitcoin', 'timestamp_ms': '0'}]
+    tracks = []
+
+    async def fetch(method, url, stream_func=None, params=None, **kwargs):
+        tracks.append(params['track'])
+        for tweet in tweets:
+            await stream_func(json.dumps(tweet).encode() + b'\r')
+        await asyncio.sleep(10)
+
+    scraper = Twitter('', '', '', '')
+    scraper.client.fetch = fetch
+    btc = scraper.stream('bitcoin', topic='btc')
+    eth = scraper.stream('ether,ethereum', topic='eth')
+    await asyncio.sleep(0.01)
+    assert tracks == ['bitcoin,ether,ethereum'], \
+        'Did not open one stream for all queries'
+    assert [(await btc.__anext__()).content for _ in range(2)] == \
+        ['some data on bitcoin', 'some data on ether and bitcoin'], \
+        'Did not route tweets to topic'
+    assert (await eth.__anext__()).content == 'some data on ether', \
+        'Did not route tweets to topic'
+
+    scraper.reconnect_delay = 0
+    scraper.stream('doge', topic='doge')
+    await asyncio.sleep(0.01)
+    await scraper.close()
+    assert tracks[-1] == 'bitcoin,ether,ethereum,doge', \
+        'Did not reconnect when queries changed'
+
+
+@pytest.mark.parametrize('fields', [None, ('text', 'timestamp_ms')])
+def test_tweet_gen_fields(fields):
+    gen = Twitter.item_gen(None)
+    gen.fields = fields
+    line = json.dumps({'user': {'text': 'user'}, 'text': 'some data',
+                       'timestamp_ms': '1527352873612'}).encode('utf-8')
+    assert gen.process_text(line) == 'some data', 'Did not decode text'
+    assert gen.process_time(line).year == 2018, 'Did not decode time'
+    assert gen.process_text(b'{"limit": {"track": 1}}') is None, \
+        'Decoded text of message without text'
+    assert gen.process_time(b'') is None, 'Kept time of last tweet'
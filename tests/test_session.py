@@ -1,6 +1,10 @@
+import aiohttp
+import asyncio
 import time
 import pytest
-from veryscrape.session import FetchError
+from functools import partial
+from veryscrape.session import FetchError, RateLimiter, RedisTokenBucket, \
+    Session
 
 
 @pytest.mark.asyncio
@@ -66,6 +70,56 @@ async def test_rate_limited_nested_and_global(assert_rate_limited, patched_sessi
                                   sess.rate_limit_period / sess.rate_limits['/users']['1'], 2)
 
 
+def test_rate_limiter_get_limit():
+    limiter = RateLimiter({'/users': {'1': 5, '2': 10}, '/posts': 3, '*': 20}, 1)
+    assert limiter.get_limit('test/users/1').rate == 5, 'Incorrect nested limit'
+    assert limiter.get_limit('test/users/2?a=1').rate == 10, \
+        'Incorrect nested limit for url with query string'
+    assert limiter.get_limit('test/users/3') is None, \
+        'Limited url matching no nested limit'
+    assert limiter.get_limit('test/other').rate == 20, 'Incorrect global limit'
+    assert limiter.get_limit('test/posts') is limiter.get_limit('test/posts#a'), \
+        'Urls with the same path do not share a limit'
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_waits_in_order():
+    limiter = RateLimiter({'/users': 5}, 0.1)
+    finished = []
+
+    async def request(k):
+        await limiter.wait_limit('test/users')
+        finished.append((k, time.time()))
+
+    start = time.time()
+    await asyncio.gather(*[request(k) for k in range(10)])
+    assert [k for k, _ in finished] == list(range(10)), \
+        'Did not serve waiting requests in order'
+    for k, t in finished:
+        expected = max(0, k - 4) * 0.02
+        assert round(t - start - expected, 2) == 0, \
+            'Waited the wrong amount of time'
+
+
+def test_redis_token_bucket():
+    fakeredis = pytest.importorskip('fakeredis')
+    redis = fakeredis.FakeStrictRedis()
+    backend = partial(RedisTokenBucket, redis=redis)
+    # Two limiters with the same key, like two processes with the same session
+    limiters = [RateLimiter({'/users': 5}, 1, create_bucket=backend, key='k')
+                for _ in range(2)]
+    delays = [limiters[k % 2].get_limit('test/users').reserve()
+              for k in range(10)]
+    assert delays[:5] == [0] * 5, 'Limited requests within rate limit'
+    for k, delay in enumerate(delays[5:], 1):
+        assert abs(delay - k * 0.2) < 0.05, \
+            'Did not share rate limit between limiters'
+
+    other = RateLimiter({'/users': 5}, 1, create_bucket=backend, key='other')
+    assert other.get_limit('test/users').reserve() == 0, \
+        'Shared rate limit between limiters with different keys'
+
+
 @pytest.mark.asyncio
 async def test_overridden_request(assert_rate_limited, patched_session):
     calls = []
@@ -146,6 +200,31 @@ async def test_oauth2_token_exists_expired(patched_oauth2):
             'Incorrect headers returned'
 
 
+@pytest.mark.asyncio
+async def test_oauth2_token_uses_session_pool(patched_oauth2, monkeypatch):
+    async with patched_oauth2(
+        'VbKYA5v77UPooA', 'OZan8kt5EluEZ0pXpMbmtLoPTgk', 'oauth2'
+    ) as client:
+        # A new client session would open new connections
+        monkeypatch.setattr(aiohttp, 'ClientSession', None)
+        headers = await client.patcher.auth_token()
+        assert headers == {'Authorization': 'bearer ' + 'abc_test_abc'}, \
+            'Did not request token with connection pool of session'
+
+
+@pytest.mark.asyncio
+async def test_shared_connector():
+    connector = Session.create_connector()
+    async with Session(connector=connector) as sess:
+        assert sess.connector is connector, 'Did not use shared connector'
+    assert not connector.closed, 'Closed connector shared with other sessions'
+    async with Session() as sess:
+        connector = sess.connector
+        assert connector.limit == Session.connection_limit, \
+            'Did not configure connector of session'
+    assert connector.closed, 'Did not close connector of session'
+
+
 @pytest.mark.asyncio
 async def test_fetch(patched_session):
     async with patched_session() as sess:
@@ -162,6 +241,35 @@ async def test_fetch_stream_func(patched_session):
             "Did not correctly execute stream function with fetch"
 
 
+@pytest.mark.asyncio
+async def test_fetch_awaitable_stream_func(patched_session):
+    q = asyncio.Queue()
+    async with patched_session() as sess:
+        await sess.fetch('GET', 'fstream', stream_func=q.put)
+        assert q.qsize() == 10, \
+            "Did not await result of stream function with fetch"
+
+
+@pytest.mark.asyncio
+async def test_fetch_max_size(patched_session):
+    async with patched_session() as sess:
+        sess.read_chunk_size = 7
+        res = await sess.fetch('GET', 'fpage', max_size=10000)
+        assert res.count('caf\xe9') == 100, \
+            'Did not decode body read in chunks'
+        assert await sess.fetch('GET', 'fpage', max_size=100) is None, \
+            'Read body larger than max size'
+
+
+@pytest.mark.asyncio
+async def test_fetch_content_types(patched_session):
+    async with patched_session() as sess:
+        res = await sess.fetch('GET', 'fbinary', content_types=('text/html',))
+        assert res is None, 'Read body of content type not allowed'
+        res = await sess.fetch('GET', 'fpage', content_types=('text/html',))
+        assert 'caf\xe9' in res, 'Did not read body of allowed content type'
+
+
 # Ignore DeprecationWarning cause by aiohttp in python 3.5
 @pytest.mark.filterwarnings('ignore::DeprecationWarning')
 @pytest.mark.asyncio
@@ -1,7 +1,8 @@
 import asyncio
 import pytest
-from veryscrape.items import ItemGenerator
-from veryscrape.wrappers import GeneratorWrapper, ItemMerger, ItemProcessor, ItemSorter
+from veryscrape.items import ItemGenerator, END_OF_STREAM
+from veryscrape.wrappers import GeneratorWrapper, ItemMerger, ItemProcessor, ItemSorter, \
+    NearDuplicateFilter
 
 
 @pytest.mark.asyncio
@@ -59,6 +60,45 @@ async def test_item_merger_cancelled():
         await items.__anext__()
 
 
+@pytest.mark.asyncio
+async def test_item_merger_cancelled_while_waiting():
+    items = ItemMerger(ItemGenerator(asyncio.Queue())).__aiter__()
+    future = asyncio.ensure_future(items.__anext__())
+    await asyncio.sleep(0)
+    items.cancel()
+    with pytest.raises(StopAsyncIteration):
+        await asyncio.wait_for(future, 1)
+
+
+@pytest.mark.asyncio
+async def test_item_merger_end_of_stream():
+    q1 = asyncio.Queue()
+    q2 = asyncio.Queue()
+    for i in range(5):
+        q1.put_nowait(str(i))
+        q2.put_nowait('pre' + str(i))
+    q1.put_nowait(END_OF_STREAM)
+    q2.put_nowait(END_OF_STREAM)
+
+    count = 0
+    async for _ in ItemMerger(ItemGenerator(q1), ItemGenerator(q2)):
+        count += 1
+    assert count == 10, 'Did not return all items before end of stream'
+
+
+@pytest.mark.asyncio
+async def test_item_merger_bounded():
+    q = asyncio.Queue()
+    for i in range(10):
+        q.put_nowait(str(i))
+
+    items = ItemMerger(ItemGenerator(q), maxsize=2).__aiter__()
+    await asyncio.sleep(1e-2)
+    assert items.q.qsize() == 2, 'Queue grew past its limit'
+    assert q.qsize() == 7, 'Did not stop reading items when full'
+    items.cancel()
+
+
 @pytest.mark.asyncio
 async def test_item_processor(random_item_gen):
     import veryscrape.process
@@ -102,6 +142,42 @@ async def test_item_processor_classify(random_item_gen):
             items.cancel()
 
 
+@pytest.mark.asyncio
+async def test_item_processor_batched(random_item_gen):
+    import veryscrape.process
+    veryscrape.process.register('batched', lambda t: t + 0.5)
+    random_item_gen.source = 'batched'
+    items = ItemProcessor(random_item_gen, batch_size=7)
+    count = 0
+    async for item in items:
+        assert item.content - int(item.content) == 0.5, 'Did not process item'
+        count += 1
+        if count >= 50:
+            items.cancel()
+
+
+@pytest.mark.asyncio
+async def test_item_processor_raw(random_item_gen):
+    import veryscrape.process
+    veryscrape.process.register('raw_gen', lambda t: t + 0.5)
+    items = []
+    while not random_item_gen.q.empty():
+        items.append(random_item_gen.q.get_nowait())
+    # Every item twice, the second time filtered by its generator
+    for item in items + items:
+        random_item_gen.q.put_nowait(item)
+    random_item_gen.q.put_nowait(END_OF_STREAM)
+    random_item_gen.source = 'raw_gen'
+    random_item_gen.raw = True
+
+    contents = []
+    async for item in ItemProcessor(random_item_gen, batch_size=7):
+        assert item.content - int(item.content) == 0.5, 'Did not process item'
+        contents.append(item.content)
+    assert sorted(contents) == [k + 0.5 for k in range(len(items))], \
+        'Did not filter items already seen'
+
+
 # todo fix item sorter tests when building on travis
 @pytest.mark.asyncio
 async def test_item_sorter_amount(random_item_gen):
@@ -117,6 +193,17 @@ async def test_item_sorter_amount(random_item_gen):
             ordered.cancel()
 
 
+@pytest.mark.asyncio
+async def test_item_sorter_end_of_stream(random_item_gen):
+    random_item_gen.q.put_nowait(END_OF_STREAM)
+    ordered = ItemSorter(random_item_gen, max_items=1000, max_age=1000)
+    times = []
+    async for item in ordered:
+        times.append(item.created_at.timestamp())
+    assert len(times) == 100, 'Did not return held items at end of stream'
+    assert times == sorted(times), 'Did not return items ordered by time'
+
+
 @pytest.mark.asyncio
 async def test_item_sorter_age(random_item_gen):
     max_age = 50
@@ -129,3 +216,27 @@ async def test_item_sorter_age(random_item_gen):
         count += 1
         if count >= max_age / 2:
             ordered.cancel()
+
+
+@pytest.mark.asyncio
+async def test_near_duplicate_filter():
+    text = ' '.join('word%d' % k for k in range(100))
+    q = asyncio.Queue()
+    for content in (text, text.upper() + '!', 'other ' + text.replace('1', '2'), text):
+        q.put_nowait(content)
+    q.put_nowait(END_OF_STREAM)
+    q2 = asyncio.Queue()
+    for content in (text, END_OF_STREAM):
+        q2.put_nowait(content)
+
+    items = NearDuplicateFilter(ItemMerger(
+        ItemGenerator(q, topic='topic', source='t'),
+        ItemGenerator(q2, topic='other', source='t')
+    ))
+    contents = []
+    async for item in items:
+        contents.append((item.topic, item.content))
+    assert sorted(contents) == sorted([
+        ('topic', text), ('topic', 'other ' + text.replace('1', '2')), ('other', text)
+    ]), 'Did not drop near-duplicates of the same topic'
+    assert items.dropped == 1, 'Did not count dropped items'
@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from veryscrape.items import Item, decode_item, encode_item
+from veryscrape.writer import RedisWriter, RedisStreamWriter
+
+
+@pytest.mark.asyncio
+async def test_redis_writer_batches(patched_redis):
+    writer = RedisWriter(patched_redis, key='batches', batch_size=10,
+                         flush_interval=1000)
+    for k in range(25):
+        await writer.put(Item(str(k), 'topic', 'source'))
+    await writer.close()
+
+    events = list(patched_redis.data['batches'])
+    assert len(events) == 25, 'Did not write all items'
+    assert [e.split('|')[-1] for e in events] == [str(k) for k in range(25)], \
+        'Did not write items in order'
+    assert writer.flushes == 3, 'Did not write items in batches'
+    assert writer.max_batch_size == 10, 'Wrote batch larger than batch size'
+    assert writer.mean_batch_size == 25 / 3, 'Incorrect batch size metric'
+
+
+@pytest.mark.asyncio
+async def test_redis_writer_flush_interval(patched_redis):
+    writer = RedisWriter(patched_redis, key='interval', batch_size=1000,
+                         flush_interval=0.01)
+    await writer.put(Item('content', 'topic', 'source'))
+    assert not patched_redis.data['interval'], 'Wrote item before interval'
+    await asyncio.sleep(0.1)
+    assert len(patched_redis.data['interval']) == 1, \
+        'Did not write item after interval'
+    assert writer.flush_seconds > 0, 'Did not measure flush time'
+    await writer.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('stream_key, keys', [
+    ('single', {b'events'}),
+    ('source', {b'events:s0', b'events:s1'}),
+    ('topic', {b'events:s0:t0', b'events:s1:t0',
+               b'events:s0:t1', b'events:s1:t1'})
+])
+async def test_redis_stream_writer(stream_key, keys):
+    fakeredis = pytest.importorskip('fakeredis')
+    db = fakeredis.FakeStrictRedis()
+    writer = RedisStreamWriter(db, stream_key=stream_key, group='workers',
+                               encode=encode_item, batch_size=7)
+    for k in range(40):
+        await writer.put(Item(str(k), 't%d' % (k // 2 % 2), 's%d' % (k % 2)))
+    await writer.close()
+
+    assert set(db.keys('events*')) == keys, 'Incorrect stream keys'
+    contents = []
+    for key in sorted(keys):
+        # Consumer group created for every stream reads all entries
+        entries = db.xreadgroup('workers', 'consumer', {key: '>'})[0][1]
+        contents.extend(decode_item(fields[b'item']).content
+                        for _, fields in entries)
+    assert sorted(contents) == sorted(str(k) for k in range(40)), \
+        'Did not write all items to streams'
+
+
+@pytest.mark.asyncio
+async def test_redis_stream_writer_maxlen():
+    fakeredis = pytest.importorskip('fakeredis')
+    db = fakeredis.FakeStrictRedis()
+    writer = RedisStreamWriter(db, stream_key='single', maxlen=10)
+    for k in range(1000):
+        await writer.put(Item(str(k), 'topic', 'source'))
+    await writer.close()
+    # Trimming is approximate so streams may be longer than maxlen
+    assert db.xlen('events') < 1000, 'Did not trim stream'
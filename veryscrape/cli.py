@@ -10,6 +10,9 @@ import click
 
 from redis import Redis
 from . import VeryScrape
+from .metrics import MetricsServer
+from .writer import RedisWriter, RedisStreamWriter, item_formats, \
+    stream_keys
 
 
 @click.command('Run a local redis queue of social media data')
@@ -23,6 +26,54 @@ from . import VeryScrape
               help='The number of cores to use for processing text.'
                    'Pass --cores -1 to disable processing of text.'
                    'Pass --cores 0 to use all available cores.')
+@click.option('--batch-size', default=1,
+              help='The number of items to process together on one core.')
+@click.option('--parse-in-workers/--no-parse-in-workers', default=False,
+              help='Parse and filter data from scrapers on the cores '
+                   'processing text, instead of in the main process.')
+@click.option('--queue-size', default=0,
+              help='Max number of items waiting at each stage of scraping. '
+                   'Pass --queue-size 0 to not limit the number of items.')
+@click.option('--near-duplicate-distance', default=-1,
+              help='Drop items with nearly the same content as an earlier '
+                   'item of the same topic, where the 64 bit simhashes of '
+                   'their content differ in at most this many bits. '
+                   'Pass --near-duplicate-distance -1 to keep all items.')
+@click.option('--near-duplicate-window', default=3600.,
+              help='Seconds an item is compared with later items '
+                   'to find near-duplicates.')
+@click.option('--share-connections/--no-share-connections', default=False,
+              help='Share one connection pool between all scrapers, '
+                   'instead of a pool for each scraper.')
+@click.option('--redis-batch-size', default=500,
+              help='Max number of items pushed to redis in one round trip.')
+@click.option('--redis-flush-interval', default=0.05,
+              help='Max seconds an item waits before it is pushed to redis.')
+@click.option('--item-format', default='text',
+              type=click.Choice(sorted(item_formats)),
+              help='Format of items pushed to redis. '
+                   'text items are "source|topic|created_at|content", '
+                   'binary items can be decoded with '
+                   'veryscrape.items.decode_item.')
+@click.option('--output', default='list',
+              type=click.Choice(['list', 'stream']),
+              help='Push items to the redis list "events", or add them '
+                   'to redis streams named by --stream-key.')
+@click.option('--stream-key', default='source',
+              type=click.Choice(sorted(stream_keys)),
+              help='Add items to one stream "events" (single), '
+                   'a stream for each source "events:source" (source) or '
+                   'a stream for each topic "events:source:topic" (topic).')
+@click.option('--stream-maxlen', default=1000000,
+              help='Approximate max number of items in each stream. '
+                   'Pass --stream-maxlen 0 to never trim streams.')
+@click.option('--stream-group', default=None,
+              help='Consumer group to create for each stream, '
+                   'which reads all items from the start of the stream.')
+@click.option('--metrics-port', default=0,
+              help='Local port to serve metrics on at /metrics, in the '
+                   'Prometheus text format. '
+                   'Pass --metrics-port 0 to not serve metrics.')
 @click.option('--log-level', default='INFO',
               help='Log level for application.')
 @click.option('--log-file', default=None,
@@ -30,13 +81,26 @@ from . import VeryScrape
                    '(logs go to stdout if this is None)')
 @click.option('--max-log-size', default=1024 * 1024,
               help='Max size in bytes for the log file, if one is specified.')
-def main(conf, host, port, cores, log_level, log_file, max_log_size):
+def main(conf, host, port, cores, batch_size, parse_in_workers, queue_size,
+         near_duplicate_distance, near_duplicate_window, share_connections,
+         redis_batch_size, redis_flush_interval, item_format, output,
+         stream_key, stream_maxlen, stream_group, metrics_port, log_level,
+         log_file, max_log_size):
     """Console script for veryscrape"""
     click.echo("Setting up VeryScrape redis queue...")
 
-    queue = asyncio.Queue()
+    queue = asyncio.Queue(queue_size)
     scraper = VeryScrape(queue)
     db = Redis(host=host, port=port)
+    writer_kwargs = dict(batch_size=redis_batch_size,
+                         flush_interval=redis_flush_interval,
+                         encode=item_formats[item_format])
+    if output == 'stream':
+        writer = RedisStreamWriter(db, stream_key=stream_key,
+                                   maxlen=stream_maxlen, group=stream_group,
+                                   **writer_kwargs)
+    else:
+        writer = RedisWriter(db, **writer_kwargs)
 
     # Setup logging
     logger = logging.getLogger('veryscrape')
@@ -54,22 +118,41 @@ def main(conf, host, port, cores, log_level, log_file, max_log_size):
 
     # Scrape and push items to redis
     loop = asyncio.get_event_loop()
+    metrics_server = None
+    if metrics_port:
+        metrics_server = MetricsServer(port=metrics_port, loop=loop)
+        loop.run_until_complete(metrics_server.start())
     loop.run_until_complete(asyncio.gather(
-        scraper.scrape(conf, n_cores=cores),
-        _push_items(scraper, queue, db)
+        scraper.scrape(conf, n_cores=cores, queue_size=queue_size,
+                       batch_size=batch_size,
+                       parse_in_workers=parse_in_workers,
+                       near_duplicate_distance=(
+                           None if near_duplicate_distance < 0
+                           else near_duplicate_distance),
+                       near_duplicate_window=near_duplicate_window,
+                       share_connections=share_connections),
+        _push_items(scraper, queue, writer)
     ))
+    if metrics_server is not None:
+        loop.run_until_complete(metrics_server.close())
     loop.close()
 
     return 0
 
 
-async def _push_items(scraper, queue, db):
-    while not scraper.kill_event.is_set():
-        try:
-            item = queue.get_nowait()
-        except asyncio.QueueEmpty:
-            await asyncio.sleep(1e-3)
-        else:
-            db.rpush("events", "%s|%s|%s|%s" % (
-                item.source, item.topic, item.created_at, item.content
-            ))
+async def _push_items(scraper, queue, writer):
+    # Waits for items and for the scraper to be closed at the same time,
+    # so nothing polls the queue while it is empty
+    killed = asyncio.ensure_future(scraper.kill_event.wait())
+    try:
+        while not killed.done():
+            item = asyncio.ensure_future(queue.get())
+            await asyncio.wait([item, killed],
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not item.done():
+                item.cancel()
+                break
+            await writer.put(item.result())
+    finally:
+        killed.cancel()
+        await writer.close()
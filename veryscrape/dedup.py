@@ -0,0 +1,240 @@
+from array import array
+from collections import deque
+from hashlib import md5
+from math import ceil, log
+import re
+import sys
+import time
+
+
+def text_digest(text):
+    """
+    :param text: text to hash
+    :return: 128 bit md5 digest of text, which seen stores remember
+        with add_digest, e.g. for texts hashed in other processes
+    """
+    return md5(text.encode('utf-8', 'surrogatepass')).digest()
+
+
+class SeenSet:
+    """
+    Remembers 64 bit hashes of the last max_items texts exactly,
+    forgetting the oldest text first
+    :param max_items: number of most recent texts remembered
+    """
+    def __init__(self, max_items=50000):
+        self.max_items = max_items
+        self._seen = set()
+        # Hashes in the order they were added, overwritten oldest first
+        self._order = array('Q')
+        self._next = 0
+
+    def __len__(self):
+        return len(self._seen)
+
+    def add(self, text):
+        """
+        Remembers a text
+        :param text: text to remember
+        :return: True if the text was not seen before, False otherwise
+        """
+        return self.add_digest(text_digest(text))
+
+    def add_digest(self, digest):
+        """
+        Remembers a text by its digest
+        :param digest: digest of text, see text_digest
+        :return: True if the text was not seen before, False otherwise
+        """
+        hsh = int.from_bytes(digest[:8], 'little')
+        if hsh in self._seen:
+            return False
+        self._seen.add(hsh)
+        if len(self._order) < self.max_items:
+            self._order.append(hsh)
+        else:
+            self._seen.discard(self._order[self._next])
+            self._order[self._next] = hsh
+            self._next = (self._next + 1) % self.max_items
+        return True
+
+    @property
+    def memory_usage(self):
+        """Approximate number of bytes used to remember texts"""
+        return (sys.getsizeof(self._seen) + sys.getsizeof(self._order) +
+                len(self._seen) * sys.getsizeof(2 ** 63))
+
+    @property
+    def false_positive_rate(self):
+        """Probability that an unseen text collides with a remembered one"""
+        return len(self._seen) / 2 ** 64
+
+
+class RotatingBloomFilter:
+    """
+    Remembers recently seen texts in two bloom filters of fixed size.
+    Texts are added to the current filter, and once it holds max_items texts
+    it replaces the previous filter and a new empty filter is started,
+    so the last max_items texts are always remembered in constant memory
+    :param max_items: number of most recent texts remembered
+    :param error_rate: max false positive rate of each filter
+    """
+    def __init__(self, max_items=50000, error_rate=0.001):
+        self.max_items = max(1, max_items)
+        self.error_rate = error_rate
+        self.n_bits = int(ceil(
+            -self.max_items * log(error_rate) / log(2) ** 2))
+        self.n_hashes = max(1, int(round(
+            self.n_bits / self.max_items * log(2))))
+        self._current = bytearray((self.n_bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+        self._bits_set = [0, 0]
+
+    def __len__(self):
+        return self._count
+
+    def add(self, text):
+        """
+        Remembers a text
+        :param text: text to remember
+        :return: True if the text was not seen before, False otherwise
+        """
+        return self.add_digest(text_digest(text))
+
+    def add_digest(self, digest):
+        """
+        Remembers a text by its digest
+        :param digest: digest of text, see text_digest
+        :return: True if the text was not seen before, False otherwise
+        """
+        n_bits = self.n_bits
+        h1 = int.from_bytes(digest[:8], 'little') % n_bits
+        # Odd step, so positions do not repeat for any number of bits
+        h2 = (int.from_bytes(digest[8:], 'little') | 1) % n_bits
+        positions = []
+        for _ in range(self.n_hashes):
+            positions.append((h1 >> 3, 1 << (h1 & 7)))
+            h1 += h2
+            if h1 >= n_bits:
+                h1 -= n_bits
+        current = self._current
+        missing = [(i, bit) for i, bit in positions if not current[i] & bit]
+        if not missing:
+            return False
+        previous = self._previous
+        seen = all(previous[i] & bit for i, bit in positions)
+        # Texts seen in the previous filter are added again,
+        # so texts that keep repeating are never forgotten
+        for i, bit in missing:
+            current[i] |= bit
+        self._bits_set[0] += len(missing)
+        self._count += 1
+        if self._count >= self.max_items:
+            self._rotate()
+        return not seen
+
+    def _rotate(self):
+        self._previous = self._current
+        self._current = bytearray(len(self._previous))
+        self._bits_set = [0, self._bits_set[0]]
+        self._count = 0
+
+    @property
+    def memory_usage(self):
+        """Approximate number of bytes used to remember texts"""
+        return sys.getsizeof(self._current) + sys.getsizeof(self._previous)
+
+    @property
+    def false_positive_rate(self):
+        """Estimated probability that an unseen text is reported as seen"""
+        current, previous = [
+            (n / self.n_bits) ** self.n_hashes for n in self._bits_set]
+        return 1 - (1 - current) * (1 - previous)
+
+
+_word_pattern = re.compile(r'\w+')
+_hash_mask = (1 << 64) - 1
+
+
+def simhash(text):
+    """
+    Computes a 64 bit simhash of a text from the words in it,
+    texts with most words in common have hashes with few different bits.
+    Words are hashed with the builtin hash, so simhashes can only be compared
+    with simhashes computed in the same process
+    :param text: text to hash
+    :return: simhash of text
+    """
+    words = _word_pattern.findall(text.lower())
+    if not words:
+        return 0
+    bits = ''.join([format(hash(w) & _hash_mask, '064b') for w in words])
+    # Each bit of the simhash is the bit most words have at its position,
+    # counted for all words at once by slicing every 64th character
+    half = len(words) / 2
+    return int(''.join(['1' if bits[k::64].count('1') > half else '0'
+                        for k in range(64)]), 2)
+
+
+class SimHashIndex:
+    """
+    Remembers recent simhashes and finds hashes differing in
+    at most max_distance bits. Hashes are split into max_distance + 1 bands,
+    two hashes within max_distance bits have at least one band in common,
+    so only hashes with a band in common are compared
+    :param max_distance: max number of different bits of near-duplicates
+    :param window: seconds a hash is remembered
+    :param max_items: max number of hashes remembered
+    """
+    def __init__(self, max_distance=3, window=3600, max_items=100000):
+        self.max_distance = max_distance
+        self.window = window
+        self.max_items = max_items
+        n_bands = max_distance + 1
+        width = 64 // n_bands
+        self._masks = [
+            (k * width, (1 << (64 - k * width if k == n_bands - 1
+                               else width)) - 1)
+            for k in range(n_bands)
+        ]
+        self._bands = [{} for _ in range(n_bands)]
+        self._hashes = deque()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add(self, hsh, key='', now=None):
+        """
+        Remembers a hash unless a near-duplicate is remembered
+        :param hsh: simhash to remember
+        :param key: hashes are only compared with hashes with the same key
+        :param now: time of adding the hash, defaults to time.time()
+        :return: True if no near-duplicate was remembered, False otherwise
+        """
+        now = time.time() if now is None else now
+        self._forget(now - self.window)
+        band_keys = [(key, (hsh >> shift) & mask)
+                     for shift, mask in self._masks]
+        for band, band_key in zip(self._bands, band_keys):
+            for other in band.get(band_key, ()):
+                if bin(hsh ^ other).count('1') <= self.max_distance:
+                    return False
+        for band, band_key in zip(self._bands, band_keys):
+            band.setdefault(band_key, []).append(hsh)
+        self._hashes.append((now, hsh, band_keys))
+        if len(self._hashes) > self.max_items:
+            self._pop()
+        return True
+
+    def _forget(self, before):
+        while self._hashes and self._hashes[0][0] < before:
+            self._pop()
+
+    def _pop(self):
+        _, hsh, band_keys = self._hashes.popleft()
+        for band, band_key in zip(self._bands, band_keys):
+            hashes = band[band_key]
+            hashes.remove(hsh)
+            if not hashes:
+                del band[band_key]
@@ -0,0 +1,102 @@
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # pragma: nocover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: nocover
+    ujson = None
+
+# Backends in order of preference, the fastest installed is used
+BACKENDS = ('orjson', 'ujson', 'json')
+
+_string_pattern = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"')
+_decoder = json.JSONDecoder()
+
+
+def _json_loads(data):
+    # json only decodes bytes since python 3.6
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+_loads = {
+    'orjson': orjson.loads if orjson is not None else None,
+    'ujson': ujson.loads if ujson is not None else None,
+    'json': _json_loads,
+}
+
+backend = None
+loads = None
+
+
+def use_backend(name=None):
+    """
+    Sets the backend used by loads
+    :param name: name of a backend in BACKENDS, or None for the fastest
+        installed backend
+    """
+    global backend, loads
+    if name is None:
+        name = next(b for b in BACKENDS if _loads[b] is not None)
+    if _loads.get(name) is None:
+        raise ImportError('JSON backend %s is not installed' % name)
+    backend = name
+    loads = _loads[name]
+
+
+use_backend()
+
+
+def _depth(text):
+    # Braces opened minus braces closed in text, outside of strings
+    if '"' in text:
+        text = _string_pattern.sub('', text)
+    return text.count('{') - text.count('}')
+
+
+def _skip_whitespace(text, index):
+    while index < len(text) and text[index] in ' \t\r\n':
+        index += 1
+    return index
+
+
+def project(data, fields):
+    """
+    Decodes only some top level fields of a JSON object, which is much
+    faster than decoding the whole object when the fields are small.
+    The rest of the object is not validated
+    :param data: JSON object as bytes or str
+    :param fields: names of fields to decode
+    :return: dict of the fields found in the object and their values
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    result = {}
+    size = len(data)
+    for field in fields:
+        key = '"%s"' % field
+        start = data.find(key)
+        while start >= 0:
+            # Quotes are escaped inside strings, so this is a key if a
+            # colon follows, which is top level if one brace is open
+            # before it, counted from the nearest end of the object
+            index = _skip_whitespace(data, start + len(key))
+            if index < size and data[index] == ':':
+                if start < size - start:
+                    prefix = data[:start]
+                    top_level = prefix.count('{') == 1 or \
+                        _depth(prefix) == 1
+                else:
+                    top_level = _depth(data[start:]) == -1
+                if top_level:
+                    result[field] = _decoder.raw_decode(
+                        data, _skip_whitespace(data, index + 1))[0]
+                    break
+            start = data.find(key, start + len(key))
+    return result
@@ -0,0 +1,262 @@
+from collections import Counter, deque
+from hashlib import md5
+from urllib.parse import urlsplit
+import asyncio
+import heapq
+import sqlite3
+import time
+
+from .dedup import RotatingBloomFilter
+
+
+class URLFrontier:
+    """
+    Urls waiting to be crawled, in a FIFO queue for each host.
+    Hosts take turns to have their next url crawled, and a host is skipped
+    while it has max_per_host urls being crawled or until delay seconds
+    have passed since its last url was started, so no host can use all
+    of the requests of a crawler
+    :param max_per_host: max number of urls of one host crawled at once
+    :param delay: min seconds between starting to crawl urls of one host
+    :param max_urls: max number of urls waiting, new urls are dropped
+        when this many urls are waiting
+    :param max_seen_urls: max number of urls remembered to not crawl a url
+        twice, see seen_store
+    """
+    # Creates the store of seen urls from max_seen_urls,
+    # see dedup.RotatingBloomFilter for the methods a store needs
+    seen_store = RotatingBloomFilter
+
+    def __init__(self, max_per_host=4, delay=0., max_urls=1000000,
+                 max_seen_urls=10000000):
+        self.max_per_host = max_per_host
+        self.delay = delay
+        self.max_urls = max_urls
+        self.seen = self.seen_store(max_seen_urls)
+        self.dropped = 0
+        self._queues = {}
+        self._n_urls = 0
+        self._active = Counter()
+        self._n_active = 0
+        self._next_start = {}
+        # Hosts waiting for their turn, and hosts waiting for delay to pass
+        self._ready = deque()
+        self._delayed = []
+        self._scheduled = set()
+        self._changed = asyncio.Event()
+
+    def __len__(self):
+        return self._n_urls
+
+    @property
+    def active(self):
+        """Number of urls being crawled"""
+        return self._n_active
+
+    def add(self, url):
+        """
+        Adds a url to be crawled if it was not added before
+        :param url: url to add
+        :return: True if the url was added, False otherwise
+        """
+        if not self.seen.add(url):
+            return False
+        if self._n_urls >= self.max_urls:
+            self.dropped += 1
+            return False
+        self._queue(url)
+        return True
+
+    async def get(self):
+        """
+        Waits until the turn of the next url to crawl,
+        which must be passed to done once it has been crawled
+        :return: next url to crawl, or None if no urls are waiting
+            or being crawled
+        """
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                self._ready.append(heapq.heappop(self._delayed)[1])
+            if self._ready:
+                return self._start(self._ready.popleft(), now)
+            if not self._delayed and not self._n_active:
+                return None
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def done(self, url):
+        """
+        Marks a url returned by get as crawled
+        :param url: crawled url
+        """
+        host = urlsplit(url).netloc.lower()
+        self._active[host] -= 1
+        self._n_active -= 1
+        if not self._active[host]:
+            del self._active[host]
+        self._schedule(host)
+        self._changed.set()
+
+    def close(self):
+        """Releases resources of the frontier"""
+        return
+
+    def _queue(self, url):
+        host = urlsplit(url).netloc.lower()
+        queue = self._queues.get(host)
+        if queue is None:
+            queue = self._queues[host] = deque()
+        queue.append(url)
+        self._n_urls += 1
+        self._schedule(host)
+
+    def _start(self, host, now):
+        self._scheduled.discard(host)
+        queue = self._queues[host]
+        url = queue.popleft()
+        if not queue:
+            del self._queues[host]
+        self._n_urls -= 1
+        self._active[host] += 1
+        self._n_active += 1
+        if self.delay:
+            self._next_start[host] = now + self.delay
+            if len(self._next_start) > 2 * len(self._queues) + 1000:
+                self._forget_delays(now)
+        self._schedule(host)
+        return url
+
+    def _schedule(self, host):
+        if (
+            host in self._scheduled
+            or host not in self._queues
+            or self._active[host] >= self.max_per_host
+        ):
+            return
+        self._scheduled.add(host)
+        next_start = self._next_start.get(host, 0.)
+        if next_start > time.monotonic():
+            heapq.heappush(self._delayed, (next_start, host))
+        else:
+            self._ready.append(host)
+        self._changed.set()
+
+    def _forget_delays(self, now):
+        self._next_start = {
+            host: t for host, t in self._next_start.items() if t > now
+        }
+
+
+def _url_hash(url):
+    # Signed, as sqlite integers are signed 64 bit integers
+    return int.from_bytes(md5(url.encode('utf-8', 'surrogatepass'))
+                          .digest()[:8], 'little', signed=True)
+
+
+class SQLiteSeenSet:
+    """
+    Remembers 64 bit hashes of all urls added in a sqlite table
+    :param db: sqlite3 connection
+    """
+    def __init__(self, db):
+        self.db = db
+        self.db.execute('CREATE TABLE IF NOT EXISTS seen '
+                        '(hash INTEGER PRIMARY KEY) WITHOUT ROWID')
+
+    def add(self, url):
+        """
+        Remembers a url
+        :param url: url to remember
+        :return: True if the url was not seen before, False otherwise
+        """
+        return self.db.execute('INSERT OR IGNORE INTO seen VALUES (?)',
+                               (_url_hash(url),)).rowcount == 1
+
+
+class SQLiteFrontier(URLFrontier):
+    """
+    URLFrontier that saves seen and waiting urls in a sqlite database,
+    so a crawl can be resumed from where it stopped. At most max_urls
+    waiting urls are kept in memory, the rest are loaded from the database
+    in the order they were added once there is space. Changes are committed
+    every checkpoint_interval seconds and when the frontier is closed,
+    urls being crawled are only removed from the database once done
+    :param path: path of sqlite database file
+    :param checkpoint_interval: seconds between commits to the database
+    """
+    def __init__(self, path, checkpoint_interval=10., **kwargs):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.db = sqlite3.connect(path)
+        # Commits only wait for the write-ahead log to be written
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS waiting '
+                        '(id INTEGER PRIMARY KEY, url TEXT)')
+        super(SQLiteFrontier, self).__init__(**kwargs)
+        self._ids = {}
+        # Waiting urls with ids after this are only in the database
+        self._loaded_id = 0
+        self._on_disk = self.db.execute(
+            'SELECT COUNT(*) FROM waiting').fetchone()[0]
+        self._last_checkpoint = time.monotonic()
+        self._load()
+
+    def seen_store(self, max_seen_urls):
+        return SQLiteSeenSet(self.db)
+
+    def __len__(self):
+        return self._n_urls + self._on_disk
+
+    def add(self, url):
+        if not self.seen.add(url):
+            return False
+        url_id = self.db.execute('INSERT INTO waiting (url) VALUES (?)',
+                                 (url,)).lastrowid
+        if self._on_disk or self._n_urls >= self.max_urls:
+            self._on_disk += 1
+        else:
+            self._loaded_id = url_id
+            self._queue(url, url_id)
+        return True
+
+    def done(self, url):
+        self.db.execute('DELETE FROM waiting WHERE id = ?',
+                        (self._ids.pop(url),))
+        super(SQLiteFrontier, self).done(url)
+        if self._on_disk and self._n_urls < self.max_urls // 2:
+            self._load()
+        if time.monotonic() - self._last_checkpoint > \
+                self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Commits all changes to the database"""
+        self.db.commit()
+        self._last_checkpoint = time.monotonic()
+
+    def close(self):
+        """Commits all changes and closes the database"""
+        self.checkpoint()
+        self.db.close()
+
+    def _queue(self, url, url_id):
+        self._ids[url] = url_id
+        super(SQLiteFrontier, self)._queue(url)
+
+    def _load(self):
+        limit = self.max_urls - self._n_urls
+        rows = self.db.execute(
+            'SELECT id, url FROM waiting WHERE id > ? ORDER BY id LIMIT ?',
+            (self._loaded_id, limit)).fetchall()
+        for url_id, url in rows:
+            self._queue(url, url_id)
+        if rows:
+            self._loaded_id = rows[-1][0]
+        # All urls are loaded once fewer urls than the limit are found
+        self._on_disk = self._on_disk - len(rows) if len(rows) == limit else 0
@@ -1,10 +1,16 @@
 from datetime import datetime
-from hashlib import md5
 import asyncio
 import logging
 import re
+import struct
+
+from .dedup import RotatingBloomFilter, text_digest
+
 log = logging.getLogger(__name__)
 
+# Put on a queue to signal that no more data will arrive on it
+END_OF_STREAM = object()
+
 
 class Item:
     def __init__(self, content='', topic='', source='', created_at=None):
@@ -19,15 +25,125 @@ class Item:
         )
 
 
+# Binary format of items written to redis: a header with the format version,
+# created_at in milliseconds since the epoch and the lengths of the utf-8
+# encoded source, topic and content, followed by the source, topic and content
+ITEM_FORMAT_VERSION = 1
+_item_header = struct.Struct('!BqHHI')
+
+
+def encode_item(item):
+    """
+    Encodes an item in the binary item format
+    :param item: Item to encode
+    :return: bytes of encoded item
+    """
+    created_at = item.created_at
+    if isinstance(created_at, datetime):
+        created_at = created_at.timestamp()
+    source = item.source.encode('utf-8')
+    topic = item.topic.encode('utf-8')
+    content = item.content.encode('utf-8')
+    return _item_header.pack(
+        ITEM_FORMAT_VERSION, int(created_at * 1000),
+        len(source), len(topic), len(content)
+    ) + source + topic + content
+
+
+def decode_item(data):
+    """
+    Decodes an item encoded with encode_item
+    :param data: bytes of encoded item
+    :return: decoded Item
+    """
+    version, created_at, n_source, n_topic, n_content = \
+        _item_header.unpack_from(data)
+    if version != ITEM_FORMAT_VERSION:
+        raise ValueError('Unsupported item format version: %d' % version)
+    start = _item_header.size
+    end = start + n_source + n_topic + n_content
+    if len(data) != end:
+        raise ValueError('Item is %d bytes, expected %d' % (len(data), end))
+    data = memoryview(data)
+    source = str(data[start:start + n_source], 'utf-8')
+    start += n_source
+    topic = str(data[start:start + n_topic], 'utf-8')
+    start += n_topic
+    content = str(data[start:end], 'utf-8')
+    return Item(content, topic, source,
+                datetime.fromtimestamp(created_at / 1000))
+
+
+class DroppingQueue(asyncio.Queue):
+    """
+    Bounded queue for sources that can't be paused, which drops items
+    instead of waiting for free space when it is full
+    :param maxsize: max number of items in the queue
+    :param overflow: which item to drop when the queue is full,
+        either 'drop_oldest' or 'drop_newest'
+    """
+    def __init__(self, maxsize=0, overflow='drop_oldest', **kwargs):
+        assert overflow in ('drop_oldest', 'drop_newest'), \
+            'Overflow must be one of "drop_oldest" or "drop_newest"'
+        super(DroppingQueue, self).__init__(maxsize, **kwargs)
+        self.overflow = overflow
+        self.dropped = 0
+
+    async def put(self, item):
+        self.put_nowait(item)
+
+    def put_nowait(self, item):
+        if self.full():
+            # End of stream is never dropped so consumers always stop
+            items = self._queue
+            oldest = next((k for k, queued in enumerate(items)
+                           if queued is not END_OF_STREAM), None)
+            if item is END_OF_STREAM and oldest is None:
+                # The queue is already ended
+                return
+            self.dropped += 1
+            if item is not END_OF_STREAM and (
+                    self.overflow == 'drop_newest' or oldest is None):
+                return
+            del items[oldest]
+        super(DroppingQueue, self).put_nowait(item)
+
+
+class RawItem:
+    """
+    Raw data read by an item generator in raw mode, which is parsed into
+    an item with the methods of the generator in a worker process
+    of ItemProcessor instead of on the event loop
+    :param data: raw data put on the queue of a scraper
+    :param generator: ItemGenerator that read the data
+    """
+    __slots__ = ('data', 'generator')
+
+    def __init__(self, data, generator):
+        self.data = data
+        self.generator = generator
+
+
 class ItemGenerator:
     max_seen_items = 50000
+    # Creates the store of seen texts from max_seen_items,
+    # see dedup.RotatingBloomFilter for the methods a store needs
+    seen_store = RotatingBloomFilter
+    # Generators in raw mode return RawItems, which ItemProcessor
+    # parses, filters and cleans in worker processes, so subclasses must
+    # be importable by the workers and only parse in process_text and
+    # process_time
+    raw = False
 
-    def __init__(self, q, topic='', source=''):
+    def __init__(self, q, topic='', source='', seen=None):
         self.q = q
         self.topic = topic
         self.source = source
-        self.seen = set()
+        # Stores can be shared by generators, texts are stored with topics
+        # so the same text is still generated once for each topic
+        self.seen = seen
         self.cancelled = False
+        self._getter = None
 
     def __aiter__(self):
         return self
@@ -38,18 +154,55 @@ class ItemGenerator:
         while text is None:
             if self.cancelled:
                 raise StopAsyncIteration
-            try:
-                unclean_text = self.q.get_nowait()
-            except asyncio.QueueEmpty:
-                await asyncio.sleep(1e-2)
-                continue
-            text = self.process_text(unclean_text)
-            created_at = self.process_time(unclean_text)
+            unclean_text = await self.get()
+            if self.cancelled:
+                raise StopAsyncIteration
+            elif unclean_text is END_OF_STREAM:
+                # Other generators may be reading from the same queue,
+                # which a scraper may have filled since this one read it
+                try:
+                    self.q.put_nowait(END_OF_STREAM)
+                except asyncio.QueueFull:
+                    asyncio.ensure_future(self.q.put(END_OF_STREAM))
+                self.cancelled = True
+                raise StopAsyncIteration
+            if self.raw:
+                return RawItem(unclean_text, self)
+            text, created_at = self.parse(unclean_text)
             if not self.filter(text):
                 text = None
         return Item(content=text, topic=self.topic,
                     source=self.source, created_at=created_at)
 
+    def parse(self, data):
+        """
+        Parses raw data with process_text and process_time
+        :param data: raw data put on the queue of a scraper
+        :return: tuple of text, or None to skip the data, and created_at
+        """
+        return self.process_text(data), self.process_time(data)
+
+    async def get(self):
+        """
+        Waits for the next raw item in the queue
+        :return: raw item, or END_OF_STREAM if cancelled while waiting
+        """
+        try:
+            return self.q.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        # The queue belongs to the scraper, so cancel wakes a waiting
+        # generator by cancelling the pending read, not with a sentinel
+        self._getter = asyncio.ensure_future(self.q.get())
+        try:
+            return await self._getter
+        except asyncio.CancelledError:
+            if self.cancelled:
+                return END_OF_STREAM
+            raise
+        finally:
+            self._getter = None
+
     def process_text(self, text):
         return text
 
@@ -59,15 +212,31 @@ class ItemGenerator:
     def filter(self, text):
         if text is None:
             return False
-        hsh = md5(str(text).encode()).hexdigest()
-        if hsh not in self.seen:
-            self.seen.add(hsh)
-            if len(self.seen) >= self.max_seen_items:
-                self.seen.pop()
+        if self.filter_digest(text_digest(self.seen_key(text))):
             return True
         log.debug('Filtering already seen item: %s',
                   text[:50].replace('\n', ''))
         return False
 
+    def seen_key(self, text):
+        """
+        :param text: text of item
+        :return: text remembered by the seen store, which includes the
+            topic so the same text is still generated once for each topic
+        """
+        return '%s|%s' % (self.topic, text)
+
+    def filter_digest(self, digest):
+        """
+        Remembers a text by its digest, e.g. hashed in a worker process
+        :param digest: dedup.text_digest of seen_key of text
+        :return: True if the text was not seen before, False otherwise
+        """
+        if self.seen is None:
+            self.seen = type(self).seen_store(self.max_seen_items)
+        return self.seen.add_digest(digest)
+
     def cancel(self):
         self.cancelled = True
+        if self._getter is not None:
+            self._getter.cancel()
@@ -0,0 +1,318 @@
+from bisect import bisect_left
+from collections import OrderedDict
+import asyncio
+import logging
+import math
+
+log = logging.getLogger(__name__)
+
+# Upper bounds of histogram buckets in seconds, from 1 ms to 1 minute
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5,
+                   1., 2.5, 5., 10., 30., 60.)
+
+
+class _CounterValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.
+
+    def inc(self, amount=1.):
+        self.value += amount
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Counts of values in each bucket, the last bucket is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1.):
+        self.value -= amount
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name, help='', labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        # Metrics without labels have one value, used by their methods
+        self._value = self.labels() if not self.label_names else None
+
+    def labels(self, *values):
+        """
+        Returns the value of the metric with the given label values,
+        which can be kept to update the metric without looking it up
+        :param values: value of each label of the metric
+        """
+        value = self._values.get(values)
+        if value is None:
+            assert len(values) == len(self.label_names), \
+                'Metric %s has labels %s' % (self.name, self.label_names)
+            value = self._values[values] = self._create_value()
+        return value
+
+    def samples(self):
+        """
+        Yields samples of the metric as tuples of name suffix,
+        label names and values, and value
+        """
+        for values, value in list(self._values.items()):
+            pairs = tuple(zip(self.label_names, values))
+            yield '', pairs, value.value
+
+    def _create_value(self):
+        raise NotImplementedError  # pragma: nocover
+
+
+class Counter(_Metric):
+    """
+    Total that only increases, e.g. number of requests
+    :param name: name of the metric
+    :param help: description of the metric
+    :param labels: names of labels the metric is split by
+    """
+    type = 'counter'
+
+    def inc(self, amount=1.):
+        self._value.inc(amount)
+
+    def _create_value(self):
+        return _CounterValue()
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down, e.g. number of items in a queue
+    :param name: name of the metric
+    :param help: description of the metric
+    :param labels: names of labels the metric is split by
+    :param function: function called when the metric is collected,
+        returning the value, or a dict of label values and values
+        for metrics with labels, instead of values being set
+    """
+    type = 'gauge'
+
+    def __init__(self, name, help='', labels=(), function=None):
+        super(Gauge, self).__init__(name, help=help, labels=labels)
+        self.function = function
+
+    def set(self, value):
+        self._value.set(value)
+
+    def inc(self, amount=1.):
+        self._value.inc(amount)
+
+    def dec(self, amount=1.):
+        self._value.dec(amount)
+
+    def samples(self):
+        if self.function is None:
+            yield from super(Gauge, self).samples()
+            return
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            yield '', tuple(zip(self.label_names, label_values)), value
+
+    def _create_value(self):
+        return _GaugeValue()
+
+
+class Histogram(_Metric):
+    """
+    Counts of values in buckets, e.g. durations of requests
+    :param name: name of the metric
+    :param help: description of the metric
+    :param labels: names of labels the metric is split by
+    :param buckets: sorted upper bounds of buckets
+    """
+    type = 'histogram'
+
+    def __init__(self, name, help='', labels=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super(Histogram, self).__init__(name, help=help, labels=labels)
+
+    def observe(self, value):
+        self._value.observe(value)
+
+    def samples(self):
+        for values, value in list(self._values.items()):
+            pairs = tuple(zip(self.label_names, values))
+            counts = list(value.counts)
+            total = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                total += count
+                yield '_bucket', pairs + (('le', _format_value(bound)),), \
+                    total
+            yield '_sum', pairs, value.sum
+            yield '_count', pairs, total
+
+    def _create_value(self):
+        return _HistogramValue(self.buckets)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n') \
+        .replace('"', r'\"')
+
+
+class Registry:
+    """
+    Metrics by name, which can be exposed in the Prometheus text format.
+    Metrics are created by the methods of the registry, which return the
+    existing metric when a metric of the same name and type is created
+    """
+    def __init__(self):
+        self._metrics = OrderedDict()
+
+    def __iter__(self):
+        return iter(list(self._metrics.values()))
+
+    def get(self, name):
+        """
+        :param name: name of the metric
+        :return: metric of the name, or None if there is no such metric
+        """
+        return self._metrics.get(name)
+
+    def register(self, metric):
+        """
+        Adds a metric to the registry
+        :param metric: metric to add
+        :return: metric, or the existing metric of the same name
+        """
+        existing = self._metrics.get(metric.name)
+        if existing is None:
+            self._metrics[metric.name] = metric
+            return metric
+        if type(existing) is not type(metric) or \
+                existing.label_names != metric.label_names:
+            raise ValueError('Metric %s already exists with another type '
+                             'or labels' % metric.name)
+        return existing
+
+    def counter(self, name, help='', labels=()):
+        return self.register(Counter(name, help=help, labels=labels))
+
+    def gauge(self, name, help='', labels=(), function=None):
+        gauge = self.register(Gauge(name, help=help, labels=labels))
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name, help='', labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help=help, labels=labels,
+                                       buckets=buckets))
+
+    def exposition(self):
+        """
+        :return: all metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for metric in self:
+            lines.append('# HELP %s %s' % (
+                metric.name, metric.help.replace('\\', r'\\')
+                .replace('\n', r'\n')))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type))
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                log.exception('Failed to collect metric %s', metric.name)
+                continue
+            for suffix, labels, value in samples:
+                if labels:
+                    lines.append('%s%s{%s} %s' % (
+                        metric.name, suffix, ','.join(
+                            '%s="%s"' % (k, _escape(v)) for k, v in labels),
+                        _format_value(value)))
+                else:
+                    lines.append('%s%s %s' % (
+                        metric.name, suffix, _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+# Registry of the metrics of veryscrape
+registry = Registry()
+
+
+class MetricsServer:
+    """
+    Serves the metrics of a registry to Prometheus over http at /metrics
+    :param registry: registry of metrics to serve
+    :param host: interface to bind the server to
+    :param port: port to bind the server to
+    """
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, registry=registry, host='127.0.0.1', port=9100,
+                 loop=None):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.loop = loop or asyncio.get_event_loop()
+        self._server = None
+
+    async def start(self):
+        """Starts serving metrics"""
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port)
+        log.info('Serving metrics on http://%s:%d/metrics',
+                 self.host, self.port)
+
+    async def close(self):
+        """Stops serving metrics"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = (await reader.readline()).split()
+            # Headers are read until the blank line ending them
+            while (await reader.readline()).strip():
+                pass
+            path = request[1].split(b'?', 1)[0] if len(request) > 1 else b''
+            if request and request[0] == b'GET' and path == b'/metrics':
+                status = '200 OK'
+                body = self.registry.exposition().encode('utf-8')
+            else:
+                status = '404 Not Found'
+                body = b'Metrics are served at /metrics\n'
+            writer.write((
+                'HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n'
+                'Connection: close\r\n\r\n' % (
+                    status, self.content_type, len(body))
+            ).encode('ascii') + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
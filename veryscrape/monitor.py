@@ -0,0 +1,68 @@
+import asyncio
+import logging
+
+from .metrics import registry
+
+log = logging.getLogger(__name__)
+
+_loop_lag_seconds = registry.histogram(
+    'veryscrape_loop_lag_seconds',
+    'Seconds the event loop was late to wake up, as it was blocked')
+
+
+class LoopLagMonitor:
+    """
+    Measures how long the event loop is blocked by callbacks, by sleeping
+    for interval seconds and recording how much later than that it wakes
+    up. Lags longer than threshold seconds are logged, as they delay every
+    scraper, rate limit and write waiting on the loop
+    :param interval: seconds between measurements
+    :param threshold: min lag in seconds counted and logged as slow
+    """
+    def __init__(self, interval=0.1, threshold=0.1, loop=None):
+        self.interval = interval
+        self.threshold = threshold
+        self.loop = loop or asyncio.get_event_loop()
+        self._future = None
+
+        # Metrics
+        self.samples = 0
+        self.lag = 0.
+        self.total_lag = 0.
+        self.max_lag = 0.
+        self.slow = 0
+
+    @property
+    def mean_lag(self):
+        return self.total_lag / max(1, self.samples)
+
+    def start(self):
+        """Starts measuring lag of the loop in the background"""
+        if self._future is None:
+            self._future = asyncio.ensure_future(self._run(), loop=self.loop)
+
+    def stop(self):
+        """Stops measuring lag of the loop"""
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+
+    def record(self, lag):
+        """
+        Records one measurement of lag
+        :param lag: seconds the loop was late to wake up
+        """
+        _loop_lag_seconds.observe(lag)
+        self.samples += 1
+        self.lag = lag
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        if lag >= self.threshold:
+            self.slow += 1
+            log.warning('Event loop was blocked for %.0f ms', lag * 1e3)
+
+    async def _run(self):
+        while True:
+            start = self.loop.time()
+            await asyncio.sleep(self.interval)
+            self.record(max(0., self.loop.time() - start - self.interval))
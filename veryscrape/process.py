@@ -1,14 +1,28 @@
 from collections import defaultdict, Counter
+from functools import partial
+from html import unescape as _html_unescape
 from newspaper import fulltext
+from newspaper.cleaners import DocumentCleaner
+from newspaper.configuration import Configuration
+from newspaper.extractors import ContentExtractor
+from newspaper.outputformatters import OutputFormatter
+from urllib.parse import urljoin, urlsplit, urlunsplit
 from xml.sax.saxutils import unescape
-import lxml.html
 import re
 import threading
 
+from .dedup import text_digest
 from .items import Item
 
 _clean_functions = defaultdict(list)
+_cleaners = {}
 _mutex = threading.Lock()
+# (version, topics_by_source, classifiers by source) last sent
+# to this worker process by process_batch
+_worker_topics = (None, {}, {})
+# Item generators of this worker process used by process_raw_batch,
+# by generator class, topic and source
+_worker_generators = {}
 
 
 def register(name, *funcs):
@@ -20,6 +34,7 @@ def register(name, *funcs):
     """
     with _mutex:
         _clean_functions[name].extend(funcs)
+        _cleaners.clear()
 
 
 def unregister(name, *funcs):
@@ -36,6 +51,7 @@ def unregister(name, *funcs):
         else:
             for func in funcs:
                 _clean_functions[name].remove(func)
+        _cleaners.clear()
 
 
 def clean_article(content):
@@ -99,13 +115,100 @@ def clean_item(item):
     :param item: item to clean with all functions registered to item.source
     :return: cleaned item
     """
-    content = item.content
-    for func in _clean_functions[item.source]:
-        content = func(content)
+    content = _get_cleaner(item.source)(item.content)
     return Item(content, topic=item.topic,
                 source=item.source, created_at=item.created_at)
 
 
+def compile_cleaner(funcs):
+    """
+    Compile a chain of cleaning functions into a single cleaning function
+    Built-in cleaning functions are replaced by precompiled steps which
+    only scan a text when it contains something they could replace
+    :param funcs: cleaning functions to apply in order
+    :return: function giving the same result as applying funcs in order
+    """
+    steps = []
+    for func in funcs:
+        steps.extend(_compiled_steps.get(func, (func,)))
+    steps = tuple(steps)
+
+    def clean(content):
+        for step in steps:
+            content = step(content)
+        return content
+    return clean
+
+
+def _get_cleaner(name):
+    try:
+        return _cleaners[name]
+    except KeyError:
+        with _mutex:
+            cleaner = compile_cleaner(_clean_functions[name])
+            _cleaners[name] = cleaner
+        return cleaner
+
+
+def _compile_sub(pattern, repl, *triggers):
+    """
+    Precompiles re.sub(pattern, repl, content) as a function of content,
+    which returns content unchanged if it contains none of triggers
+    """
+    sub = partial(re.compile(pattern).sub, repl)
+    if not triggers:
+        return sub
+
+    def step(content):
+        for trigger in triggers:
+            if trigger in content:
+                return sub(content)
+        return content
+    return step
+
+
+def _unescape(content):
+    return unescape(content) if '&' in content else content
+
+
+def _replace_hashtag_or_mention(match):
+    hashtag = match.group(1)
+    return ' MENTION ' if hashtag is None else ' %s ' % hashtag
+
+
+def _remove_non_printable(content):
+    # Removes everything outside of \x20-\x7f in one pass over the text
+    return content.encode('ascii', 'ignore') \
+        .translate(None, _control_characters).decode('ascii')
+
+
+_user_string = r'[A-Za-z0-9_\u00c0-\u00d6\u00d8-\u00f6\u00f8-\u00ff]'
+_control_characters = bytes(range(0x20))
+_compiled_steps = {
+    clean_tweet: (
+        _unescape,
+        # Hashtags and mentions never overlap, and their replacements
+        # can't create new matches, so both are replaced in one pass
+        _compile_sub(r'[#|\uff03](%s+)|@%s{2,}' % (_user_string, _user_string),
+                     _replace_hashtag_or_mention, '#', '|', '@', '\uff03'),
+        _compile_sub(r'RT\x20?:?', '', 'RT'),
+    ),
+    clean_reddit_comment: (
+        _unescape,
+        _compile_sub(r'\[(?:deleted|removed|not found)\]', '', '['),
+        _compile_sub(r'/?r/[0-9a-zA-Z_]{3,}', '', 'r/'),
+    ),
+    clean_general: (
+        _compile_sub(
+            r'(http|https):/?/?[\w_-]*(?:\.[\w_-]*)?[\d\w.,@?^=%&:/~+#-]*',
+            '', 'http'),
+        _remove_non_printable,
+        _compile_sub(r'[.,@?^=*%$\'";{}[\]<>|\\!&:/~+#-]{4,}', ' fucking '),
+        _compile_sub(r'\x20{2,}', ' ', '  '),
+    ),
+}
+
+
 def classify_text(text, topic_query_dict):
     """
     Attempts to classify a text based on query strings organized by topic
@@ -126,20 +229,312 @@ def classify_text(text, topic_query_dict):
     return topic
 
 
-def extract_urls(text):
+class TopicClassifier:
+    """
+    Classifies texts by the topic of the queries they contain the most,
+    like classify_text, but with queries indexed by word when created,
+    so classifying a text takes one pass over its words however many
+    queries there are. Queries of multiple words are matched as phrases
+    :param topic_query_dict: dict of topics and queries:
+        e.g. {'t1': ['q1', 'q2'], 't2': ['q3 q4'], ...
+    """
+    def __init__(self, topic_query_dict):
+        self.topics = list(topic_query_dict)
+        # word -> {topic index: number of queries of topic equal to word}
+        self._word_topics = defaultdict(Counter)
+        # first word of phrase -> [(other words of phrase, topic index)]
+        self._phrase_topics = defaultdict(list)
+        for i, queries in enumerate(topic_query_dict.values()):
+            for query in queries:
+                words = _split_words(query.lower())
+                if len(words) == 1:
+                    self._word_topics[words[0]][i] += 1
+                elif words:
+                    self._phrase_topics[words[0]].append((words[1:], i))
+        self._word_topics = dict(self._word_topics)
+        self._phrase_topics = dict(self._phrase_topics)
+
+    def __call__(self, text):
+        """
+        :param text: text to classify
+        :return: which topic does the text belong to
+        """
+        words = _split_words(text.lower())
+        word_counts = Counter(words)
+        counts = [0] * len(self.topics)
+        for word in word_counts.keys() & self._word_topics.keys():
+            for i, k in self._word_topics[word].items():
+                counts[i] += word_counts[word] * k
+        for word in word_counts.keys() & self._phrase_topics.keys():
+            self._count_phrases(words, word, counts)
+
+        topic = ''
+        max_count = 0
+        for t, c in zip(self.topics, counts):
+            if c > max_count:
+                max_count = c
+                topic = t
+        return topic
+
+    def _count_phrases(self, words, first, counts):
+        phrases = self._phrase_topics[first]
+        for start, word in enumerate(words):
+            if word == first:
+                for rest, i in phrases:
+                    end = start + 1 + len(rest)
+                    if words[start + 1:end] == rest:
+                        counts[i] += 1
+
+
+def _split_words(text):
+    return tuple(_word_pattern.findall(text))
+
+
+_word_pattern = re.compile(r'\w+')
+
+
+def process_batch(items, version, topics_by_source=None,
+                  classify=classify_text):
     """
-    Extract urls in a given text and return the urls
+    Clean a batch of items and classify the items with topic '__classify__'
+    (Note, this is meant to be run in a worker process, where topics are
+    cached so they only need to be sent to each worker when they change)
+    :param items: items to process
+    :param version: version of the topics used to classify items
+    :param topics_by_source: topics to cache in this worker for classifying,
+        pass None if the worker should already have topics of this version
+    :param classify: function taking text and topic_query_dict returning
+        the text's topic (see classify_text), or a class created from
+        topic_query_dict whose instances are called with text
+        (see TopicClassifier), which is only created once per topics
+    :return: list of processed items,
+        or None if this worker does not have topics of this version
+    """
+    if not _cache_topics(version, topics_by_source,
+                         (item.topic for item in items)):
+        return None
+
+    result = []
+    for item in items:
+        try:
+            item = clean_item(item)
+            if item.topic == '__classify__':
+                item.topic = _classify_item(item, classify)
+        except Exception:
+            # One broken item must not discard the rest of its batch
+            continue
+        result.append(item)
+    return result
+
+
+def process_raw_batch(items, version, topics_by_source=None,
+                      classify=classify_text):
+    """
+    Parse, hash, clean and classify a batch of raw data read by item
+    generators in raw mode, in one pass in a worker process
+    (see process_batch for how topics are cached)
+    :param items: tuples of raw data, item generator class, topic and
+        source of the generator which read the data
+    :param version: version of the topics used to classify items
+    :param topics_by_source: topics to cache in this worker for classifying,
+        pass None if the worker should already have topics of this version
+    :param classify: see process_batch
+    :return: list with, for each raw data in order, None if the data was
+        skipped, else a tuple of the processed item and dedup.text_digest
+        of the text the generator remembers in its seen store,
+        or None if this worker does not have topics of this version
+    """
+    if not _cache_topics(version, topics_by_source,
+                         (topic for _, _, topic, _ in items)):
+        return None
+
+    result = []
+    for data, generator_class, topic, source in items:
+        key = generator_class, topic, source
+        if key not in _worker_generators:
+            _worker_generators[key] = generator_class(None, topic, source)
+        generator = _worker_generators[key]
+        try:
+            text, created_at = generator.parse(data)
+            if text is None:
+                result.append(None)
+                continue
+            # Generators hash texts before cleaning
+            digest = text_digest(generator.seen_key(text))
+            item = clean_item(Item(content=text, topic=generator.topic,
+                                   source=source, created_at=created_at))
+            if item.topic == '__classify__':
+                item.topic = _classify_item(item, classify)
+        except Exception:
+            # One broken item must not discard the rest of its batch
+            result.append(None)
+            continue
+        result.append((item, digest))
+    return result
+
+
+def _cache_topics(version, topics_by_source, topics):
+    # Caches topics sent to this worker, returns False if the worker does
+    # not have topics of this version and any of topics is classified
+    global _worker_topics
+    if topics_by_source is not None:
+        _worker_topics = (version, topics_by_source, {})
+    elif _worker_topics[0] != version and '__classify__' in topics:
+        return False
+    return True
+
+
+def _classify_item(item, classify):
+    _, topics_by_source, classifiers = _worker_topics
+    topics = topics_by_source.get(item.source, {})
+    if not isinstance(classify, type):
+        return classify(item.content, topics)
+
+    key = classify, item.source
+    if key not in classifiers:
+        classifiers[key] = classify(topics)
+    return classifiers[key](item.content)
+
+
+# Values of href attributes in double, single or no quotes. Case-insensitive
+# patterns are much slower, so are only used for pages with uppercase hrefs
+_href_value = r'''\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))'''
+_href_pattern = re.compile(r'href' + _href_value)
+_href_pattern_ignorecase = re.compile(r'href' + _href_value, re.IGNORECASE)
+_base_pattern = re.compile(
+    r'''<base\s[^>]*?href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''',
+    re.IGNORECASE
+)
+_tracking_params = re.compile(
+    r'(utm_\w+|fbclid|gclid|dclid|msclkid|yclid|igshid|mc_cid|mc_eid)$'
+)
+_reference_pattern = re.compile(r'&#?\w+;')
+_absolute_pattern = re.compile(r'https?://[^/]', re.IGNORECASE)
+_default_ports = {'http': '80', 'https': '443'}
+
+
+def canonicalize_url(url, base_url=None):
+    """
+    Canonicalizes a url, so different ways of writing a url are the same.
+    The url is resolved relative to base_url, the scheme and host are
+    lowercased and default ports, fragments and tracking parameters removed
+    :param url: url to canonicalize
+    :param base_url: url of the page the url was found on
+    :return: canonical url, or None if the url is not a http(s) url
+    """
+    url = url.strip()
+    try:
+        # Absolute urls are returned unchanged by urljoin
+        if base_url is not None and not _absolute_pattern.match(url):
+            url = urljoin(base_url, url)
+        scheme, netloc, path, query, _ = urlsplit(url)
+    except ValueError:
+        return None
+    scheme = scheme.lower()
+    if scheme and scheme not in _default_ports:
+        return None
+    if netloc:
+        netloc = netloc.lower()
+        host, _, port = netloc.rpartition(':')
+        if port == _default_ports.get(scheme):
+            netloc = host
+        path = path or '/'
+    if query:
+        query = '&'.join(
+            param for param in query.split('&')
+            if param and not _tracking_params.match(param.split('=', 1)[0])
+        )
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def extract_urls(text, base_url=None):
+    """
+    Extract urls in a given text and return the canonical urls
     :param text: text to extract urls from
+    :param base_url: url of the page, relative urls are resolved
+        relative to this or to the url of a base tag in the page
     :return: set of urls
     """
+    if not text:
+        return set()
+    base = _base_pattern.search(text)
+    base_end = -1
+    if base is not None:
+        base_url = urljoin(base_url or '', _unescape_attribute(
+            next(g for g in base.groups() if g is not None)))
+        base_end = base.end()
+    pattern = _href_pattern
+    if 'HREF' in text or 'Href' in text:
+        pattern = _href_pattern_ignorecase
+    hrefs = set()
+    for match in pattern.finditer(text):
+        start = match.start()
+        # Attribute names follow whitespace, quotes or a slash in a tag
+        if start and text[start - 1] in ' \t\n\r\f"\'/' \
+                and match.end() != base_end:
+            hrefs.add(match.group(match.lastindex))
+    return _canonical_urls(
+        (_unescape_attribute(h) if '&' in h else h for h in hrefs), base_url)
+
+
+def _unescape_attribute(value):
+    # Like browsers, references without a semicolon are not replaced
+    # in attributes, so '&region=' in a url stays as it is
+    return _reference_pattern.sub(
+        lambda m: _html_unescape(m.group()), value)
+
+
+def _canonical_urls(hrefs, base_url):
     urls = set()
+    # Pages link to the same urls many times, so hrefs are given
+    # as a set and each is canonicalized once
+    for href in hrefs:
+        url = canonicalize_url(href, base_url)
+        if url:
+            urls.add(url)
+    return urls
+
+
+def parse_html(html, url=None):
+    """
+    Parses html once and extracts its article text, the canonical urls
+    it links to and its publish date from the same tree, like clean_article,
+    extract_urls and newspaper together but without parsing html three times
+    (Note, this is meant to be run in a worker process, so only these
+    results and not the html tree are sent back to the event loop)
+    :param html: html to parse
+    :param url: url of the page, relative urls are resolved relative to
+        this or to the url of a base tag in the page
+    :return: tuple of article text, set of urls and publish datetime or
+        None, with empty text if the html could not be parsed
+    """
+    config = Configuration()
+    doc = config.get_parser().fromstring(html) if html else None
+    if doc is None:
+        return '', set(), None
+
+    base = doc.find('.//base[@href]')
+    base_url = url
+    if base is not None:
+        base_url = urljoin(url or '', base.get('href'))
+    # Links and dates are found first, as cleaning removes elements
+    urls = _canonical_urls(
+        set(doc.xpath('//*[not(self::base)]/@href')), base_url)
+    extractor = ContentExtractor(config)
+    try:
+        published = extractor.get_publishing_date(url or '', doc)
+    except Exception:
+        published = None
+
+    text = ''
     try:
-        result = lxml.html.fromstring(text)
-        for e in result.xpath('//*[@href]'):
-            if e.get('href') is not None:
-                urls.add(e.get('href'))
-    finally:
-        return urls
+        doc = DocumentCleaner(config).clean(doc)
+        top_node = extractor.post_cleanup(extractor.calculate_best_node(doc))
+        text, _ = OutputFormatter(config).get_formatted(top_node)
+    except Exception:
+        # Broken html is discarded, like in clean_article
+        pass
+    return text, urls, published
 
 
 def remove_urls(text, remove=set(' )({}[];:')):
@@ -164,12 +559,16 @@ def remove_urls(text, remove=set(' )({}[];:')):
 
 register('twitter', clean_tweet, clean_general)
 register('reddit', clean_reddit_comment, clean_general)
-register('article', clean_article, clean_general)
-register('blog', clean_article, clean_general)
-register('spider', clean_article, clean_general)
+# Article text is extracted from html by scrapers with parse_html
+register('article', clean_general)
+register('blog', clean_general)
+register('spider', clean_general)
 
 __all__ = [
     'clean_article', 'clean_tweet', 'clean_reddit_comment', 'clean_general',
-    'clean_item', 'register', 'unregister',
-    'classify_text', 'extract_urls', 'remove_urls'
+    'clean_item', 'compile_cleaner', 'register', 'unregister',
+    'process_batch', 'process_raw_batch',
+    'classify_text', 'TopicClassifier', 'canonicalize_url', 'extract_urls',
+    'parse_html',
+    'remove_urls'
 ]
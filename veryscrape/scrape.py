@@ -4,12 +4,41 @@ from functools import partial
 import asyncio
 import logging
 import time
+import weakref
 
-from .items import ItemGenerator
+from .items import ItemGenerator, DroppingQueue
+from .metrics import registry
+from .process import parse_html
 from .session import Session
 
 log = logging.getLogger(__name__)
 
+# Scrapers whose queues are measured when metrics are collected
+_scrapers = weakref.WeakSet()
+
+
+def _sum_by_source(value):
+    totals = defaultdict(int)
+    for scraper in list(_scrapers):
+        totals[(scraper.source,)] += value(scraper)
+    return dict(totals)
+
+
+registry.gauge(
+    'veryscrape_scraper_queue_items',
+    'Raw items waiting in the queues of scrapers', labels=('source',),
+    function=partial(_sum_by_source, lambda scraper: sum(
+        q.qsize() for q in list(scraper.queues.values()))))
+registry.gauge(
+    'veryscrape_scraper_dropped_items',
+    'Raw items dropped because a queue of a scraper was full',
+    labels=('source',),
+    function=partial(_sum_by_source, lambda scraper: scraper.dropped_items))
+_parse_seconds = registry.histogram(
+    'veryscrape_parse_seconds',
+    'Seconds to parse a page with Scraper.parse, including waiting '
+    'for the executor', labels=('source',))
+
 
 class Scraper(ABC):
     source = ''
@@ -17,12 +46,62 @@ class Scraper(ABC):
     item_gen = ItemGenerator
     session_class = Session
 
+    # Max number of raw items waiting in each queue, 0 for no limit
+    queue_size = 0
+    # Set to 'drop_oldest' or 'drop_newest' for sources that can't be paused,
+    # so items are dropped when a queue is full instead of waiting for space
+    queue_overflow = None
+    # Max number of texts remembered to filter repeated items,
+    # shared by the item generators of all topics of the scraper
+    max_seen_items = 500000
+    # Executor fetched html is parsed in with process.parse_html, None for
+    # the default executor of the loop, which ItemProcessor sets to its
+    # process pool so pages are never parsed on the loop thread
+    parse_executor = None
+    # Max number of pages sent to parse_executor at once, further pages
+    # wait with their fetches counting towards any request limits
+    concurrent_parses = 8
+    # Pages fetched to be parsed are skipped without reading their body
+    # when it is larger than max_page_size bytes or not of a content type
+    # in page_content_types, None reads every page
+    max_page_size = 2 * 1024 ** 2
+    page_content_types = ('text/html', 'application/xhtml+xml')
+
     def __init__(self, *args, proxy_pool=None, **kwargs):
         self.client = self.session_class(
             *args, proxy_pool=proxy_pool, **kwargs
         )
-        self.queues = defaultdict(asyncio.Queue)
+        self.queues = defaultdict(self._create_queue)
+        self.seen = self.item_gen.seen_store(self.max_seen_items)
         self._stream = None
+        self._parses = asyncio.Semaphore(self.concurrent_parses)
+        self._parse_seconds = _parse_seconds.labels(self.source)
+        _scrapers.add(self)
+
+    @property
+    def dropped_items(self):
+        """Number of raw items dropped because a queue was full"""
+        return sum(getattr(q, 'dropped', 0)
+                   for q in list(self.queues.values()))
+
+    def _create_queue(self):
+        if self.queue_size and self.queue_overflow:
+            return DroppingQueue(self.queue_size, overflow=self.queue_overflow)
+        return asyncio.Queue(self.queue_size)
+
+    async def parse(self, html, url=None):
+        """
+        Parses html with process.parse_html in parse_executor
+        :param html: html to parse
+        :param url: url the html was fetched from
+        :return: tuple of article text, set of urls and publish datetime
+        """
+        start = time.monotonic()
+        async with self._parses:
+            result = await asyncio.get_event_loop().run_in_executor(
+                self.parse_executor, parse_html, html, url)
+        self._parse_seconds.observe(time.monotonic() - start)
+        return result
 
     @abstractmethod
     async def scrape(self, query, topic='', **kwargs):
@@ -43,8 +122,8 @@ class Scraper(ABC):
         self._stream = asyncio.ensure_future(
             self.scrape_continuously(query, topic=topic, **kwargs)
         )
-        return self.item_gen(self.queues[topic],
-                             topic=topic, source=self.source)
+        return self.item_gen(self.queues[topic], topic=topic,
+                             source=self.source, seen=self.seen)
 
     async def close(self):
         self._stream.cancel()
@@ -85,19 +164,22 @@ class SearchEngineScraper(Scraper):
         links, created_times = self.extract_urls(_html)
         links = list(links)
 
-        futures = []
-        for link in self.clean_urls(links):
-            future = asyncio.ensure_future(
-                self.client.fetch('GET', link, **kwargs))
-            cb = partial(self._put_future,
-                         topic=topic,
-                         created_at=created_times[links.index(link)])
-            future.add_done_callback(cb)
-            futures.append(future)
-        await asyncio.gather(*futures)
-
-    def _put_future(self, future, topic='', created_at=None):
-        if not future.cancelled() and not future.exception():
-            res = future.result()
-            if res is not None:
-                self.queues[topic].put_nowait((res, created_at))
+        await asyncio.gather(*[
+            self._fetch_and_put(link, topic=topic,
+                                created_at=created_times[links.index(link)],
+                                **kwargs)
+            for link in self.clean_urls(links)
+        ])
+
+    async def _fetch_and_put(self, link, topic='', created_at=None, **kwargs):
+        kwargs.setdefault('max_size', self.max_page_size)
+        kwargs.setdefault('content_types', self.page_content_types)
+        res = await self.client.fetch('GET', link, **kwargs)
+        if res is None:
+            return
+        text, _, published = await self.parse(res, link)
+        if text:
+            if created_at is None:
+                created_at = published
+            # Waiting for space in the queue stops new fetches when full
+            await self.queues[topic].put((text, created_at))
@@ -6,6 +6,8 @@ from ..session import Session
 class GoogleSession(Session):
     error_on_failure = False
     retries_to_error = 2
+    # Articles of one search are fetched at once, mostly from a few sites
+    connection_limit_per_host = 8
 
 
 class ArticleGen(ItemGenerator):
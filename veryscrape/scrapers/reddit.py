@@ -1,6 +1,8 @@
+from collections import OrderedDict
 from datetime import datetime
-import json
+import asyncio
 
+from .. import fastjson
 from ..items import ItemGenerator
 from ..session import OAuth2Session
 from ..scrape import Scraper
@@ -10,6 +12,8 @@ class RedditSession(OAuth2Session):
     base_url = 'https://oauth.reddit.com/r/'
     user_agent = 'python:veryscrape:v0.1.0 (by /u/jayjay)'
     persist_user_agent = True
+    # Requests allowed per minute for each OAuth client
+    rate_limits = {'*': 100}
 
 
 class CommentGen(ItemGenerator):
@@ -24,42 +28,203 @@ class CommentGen(ItemGenerator):
         return datetime.fromtimestamp(float(text[1]))
 
 
+class SubredditState:
+    """
+    What previous scrapes of a subreddit have seen, so later scrapes
+    only fetch comments that are new since then
+    """
+    def __init__(self):
+        # Fullname and creation time of the newest comment seen
+        self.cursor = None
+        self.newest = 0.
+        # Number of comments of each hot link when it was last scraped
+        self.counts = {}
+
+
 class Reddit(Scraper):
     source = 'reddit'
     scrape_every = 600
     item_gen = CommentGen
     session_class = RedditSession
+    # Max number of links whose comments are fetched at once,
+    # all requests still wait for the rate limits of RedditSession
+    concurrent_requests = 8
+    # Max depth of replies in comment trees, deeper replies are not fetched
+    comment_depth = 10
+    # Max number of comments hidden behind 'more' stubs expanded in one
+    # request to /api/morechildren, which allows at most 100
+    morechildren_batch = 100
+    # Max number of requests to /api/morechildren for each link
+    max_morechildren_requests = 10
+    # Max number of pages of 100 new comments of a subreddit fetched in
+    # one scrape, the rest are fetched by the next scrapes
+    max_comment_pages = 10
 
-    def __init__(self, key, secret, *, proxy_pool=None):
+    def __init__(self, key, secret, *, proxy_pool=None, connector=None):
         super(Reddit, self).__init__(
             key, secret, 'https://www.reddit.com/api/v1/access_token',
-            proxy_pool=proxy_pool
+            proxy_pool=proxy_pool, connector=connector
         )
+        self._requests = asyncio.Semaphore(self.concurrent_requests)
+        # Reddit only allows one request to /api/morechildren at a time
+        self._morechildren = asyncio.Lock()
+        self.subreddits = {}
 
     async def get_links(self, query):
+        """
+        Fetches the hot links of a subreddit
+        :param query: subreddit
+        :return: OrderedDict of link ids and their numbers of comments
+        """
         res = await self.client.fetch(
             'GET', '%s/hot.json' % query,
             params={'raw_json': 1, 'limit': 100}
         )
-        res = json.loads(res or '[]')
+        res = fastjson.loads(res or '[]')
         if isinstance(res, dict) and 'data' in res:
-            return [i['data']['id'] for i in res['data']['children']]
-        return []
+            return OrderedDict((i['data']['id'],
+                                i['data'].get('num_comments', 0))
+                               for i in res['data']['children'])
+        return OrderedDict()
+
+    async def get_new_comments(self, query, state):
+        """
+        Fetches comments of a subreddit newer than the newest comment
+        seen, following the before cursor of the /comments listing,
+        or only the newest page of comments if there is no cursor
+        :param query: subreddit
+        :param state: SubredditState of subreddit, which is updated
+        :return: list of tuples of comment body and creation timestamp,
+            and True if all new comments were fetched
+        """
+        comments = []
+        newest = state.newest
+        for _ in range(self.max_comment_pages):
+            params = {'raw_json': 1, 'limit': 100}
+            if state.cursor is not None:
+                params['before'] = state.cursor
+            res = await self.client.fetch(
+                'GET', '%s/comments.json' % query, params=params)
+            res = fastjson.loads(res or '{}')
+            children = [c['data'] for c in res.get('data', {})
+                        .get('children', []) if c.get('kind') == 't1']
+            if 'before' not in params:
+                # Without a cursor the newest comments are fetched, of
+                # which only those newer than the newest seen are new
+                caught_up = len(children) < 100 or \
+                    children[-1]['created_utc'] <= newest
+                children = [c for c in children
+                            if c['created_utc'] >= newest]
+            else:
+                caught_up = len(children) < 100
+            comments.extend((c['body'], c['created_utc']) for c in children)
+            if children:
+                # Listings are sorted from newest to oldest comment
+                state.cursor = children[0]['name']
+                state.newest = max(state.newest, children[0]['created_utc'])
+            if caught_up or 'before' not in params:
+                return comments, caught_up
+        return comments, False
 
     async def get_comments(self, query, link):
+        """
+        Fetches all comments of a link, including nested replies
+        and comments hidden behind 'more' stubs
+        :param query: subreddit of link
+        :param link: id of link
+        :return: list of tuples of comment body and creation timestamp
+        """
         res = await self.client.fetch(
             'GET', '%s/comments/%s.json' % (query, link),
-            params={'raw_json': 1, 'limit': 10000, 'depth': 10}
+            params={'raw_json': 1, 'limit': 10000,
+                    'depth': self.comment_depth}
         )
-        res = json.loads(res or '[]')
-        if isinstance(res, list):
-            return [(c['data']['body'], c['data']['created_utc'])
-                    for c in res[1]['data']['children'] if c['kind'] == 't1']
-        return []
+        res = fastjson.loads(res or '[]')
+        comments = []
+        if isinstance(res, list) and len(res) > 1:
+            more = _walk_comments(res[1]['data']['children'], comments)
+            await self._expand_more(link, more, comments)
+        return comments
+
+    async def _expand_more(self, link, more, comments):
+        requests = 0
+        while more and requests < self.max_morechildren_requests:
+            batch = more[:self.morechildren_batch]
+            del more[:self.morechildren_batch]
+            requests += 1
+            async with self._morechildren:
+                res = await self.client.fetch(
+                    'GET', '/api/morechildren',
+                    params={'api_type': 'json', 'raw_json': 1,
+                            'link_id': 't3_%s' % link,
+                            'children': ','.join(batch)}
+                )
+            res = fastjson.loads(res or '{}')
+            things = res.get('json', {}).get('data', {}).get('things', [])
+            # Things are returned as a flat list, with stubs of any
+            # comments still hidden added to the comments left to expand
+            more.extend(_walk_comments(things, comments))
+
+    async def _scrape_link(self, query, link, topic):
+        async with self._requests:
+            comments = await self.get_comments(query, link)
+        await self._put_comments(comments, topic)
+
+    async def _put_comments(self, comments, topic):
+        for comment, timestamp in comments:
+            await self.queues[topic].put((comment, str(timestamp)))
 
     async def scrape(self, query, topic='', **kwargs):
         links = await self.get_links(query)
-        for link in links:
-            comments = await self.get_comments(query, link)
-            for comment, timestamp in comments:
-                await self.queues[topic].put((comment, str(timestamp)))
+        state = self.subreddits.get(query)
+        if state is None:
+            state = self.subreddits[query] = SubredditState()
+            comments, _ = await self.get_new_comments(query, state)
+            changed = list(links)
+        else:
+            comments, caught_up = await self.get_new_comments(query, state)
+            changed = [link for link, count in links.items()
+                       if state.counts.get(link) != count]
+            if not comments and state.cursor is not None and any(
+                    count > state.counts.get(link, count)
+                    for link, count in links.items()):
+                # Listings before a deleted comment are empty, so the
+                # cursor is dropped when links have new comments regardless
+                state.cursor = None
+                comments, caught_up = await self.get_new_comments(
+                    query, state)
+            # New comments of changed links are in the listing, unless
+            # it had more new comments than were fetched
+            if caught_up:
+                changed = [link for link in changed
+                           if link not in state.counts]
+        state.counts = dict(links)
+        await self._put_comments(comments, topic)
+        await asyncio.gather(*[self._scrape_link(query, link, topic)
+                               for link in changed])
+
+
+def _walk_comments(children, comments):
+    """
+    Adds comments of a listing and their replies to comments
+    :param children: children of a listing of comments
+    :param comments: list comments are added to as tuples of body and
+        creation timestamp
+    :return: list of ids of comments hidden behind 'more' stubs
+    """
+    more = []
+    stack = list(reversed(children))
+    while stack:
+        child = stack.pop()
+        data = child.get('data', {})
+        if child.get('kind') == 't1':
+            comments.append((data['body'], data['created_utc']))
+            # Replies are an empty string for comments without replies
+            replies = data.get('replies')
+            if isinstance(replies, dict):
+                stack.extend(reversed(replies['data']['children']))
+        elif child.get('kind') == 'more':
+            # Stubs of deep threads have no children, only a link
+            # to continue the thread, which is not followed
+            more.extend(data.get('children', ()))
+    return more
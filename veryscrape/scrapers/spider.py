@@ -1,8 +1,19 @@
+from functools import partial
 import asyncio
 
-from .google import extract_urls
+from ..frontier import SQLiteFrontier, URLFrontier
 from ..items import ItemGenerator
 from ..scrape import Scraper
+from ..session import Session
+
+
+class SpiderSession(Session):
+    # Open connections are limited by Spider.concurrent_requests,
+    # and connections to one host by Spider.requests_per_host
+    connection_limit = 0
+    # Crawls move on from hosts quickly, but resolve the same hosts often
+    keepalive_timeout = 15
+    dns_cache_ttl = 600
 
 
 class SpiderItemGen(ItemGenerator):
@@ -10,27 +21,53 @@ class SpiderItemGen(ItemGenerator):
         super(SpiderItemGen, self).__init__(*args, **kwargs)
         self.topic = '__classify__'
 
+    def process_text(self, text):
+        return text[0]
+
+    def process_time(self, text):
+        return text[1]
+
 
 class Spider(Scraper):
     source = 'spider'
     scrape_every = 0
     item_gen = SpiderItemGen
+    session_class = SpiderSession
     concurrent_requests = 200
+    # Max concurrent requests to one host and min seconds between them
+    requests_per_host = 4
+    host_delay = 0.
+    # Max number of urls waiting to be crawled, and remembered once crawled
+    max_queued_urls = 1000000
+    max_seen_urls = 10000000
 
-    def __init__(self, *args, source_urls=(), proxy_pool=None, **kwargs):
+    def __init__(self, *args, source_urls=(), crawl_state=None,
+                 proxy_pool=None, **kwargs):
         super(Spider, self).__init__(*args, proxy_pool=proxy_pool, **kwargs)
         self.loop = asyncio.get_event_loop()
         self.source_urls = source_urls
-        self.seen_urls = set()
-        self.urls = set()
+        frontier_kwargs = dict(
+            max_per_host=self.requests_per_host, delay=self.host_delay,
+            max_urls=self.max_queued_urls, max_seen_urls=self.max_seen_urls
+        )
+        # With a path to a crawl state database the crawl resumes from
+        # where it stopped, and waiting urls past max_queued_urls are kept
+        # in the database instead of being dropped
+        if crawl_state is None:
+            self.frontier = URLFrontier(**frontier_kwargs)
+        else:
+            self.frontier = SQLiteFrontier(crawl_state, **frontier_kwargs)
 
         self._futures = set()
-        self._max_seen_urls = 1e7
+        self._requests = asyncio.Semaphore(self.concurrent_requests)
         self._scrape_future = None
 
     async def close(self):
         if self._scrape_future is not None:
             self._scrape_future.cancel()
+        for future in self._futures:
+            future.cancel()
+        self.frontier.close()
         await super(Spider, self).close()
 
     def scrape(self, query, topic='', **kwargs):
@@ -38,32 +75,41 @@ class Spider(Scraper):
             self._scrape_future = asyncio.ensure_future(self._scrape())
         return self._scrape_future
 
-    async def _create_scrape_future(self, url):
-        while len(self._futures) > self.concurrent_requests:
-            await asyncio.sleep(1e-3)
-
-        future = asyncio.ensure_future(self.client.fetch('GET', url))
-        future.add_done_callback(self._fetch_callback)
-        self._futures.add(future)
-
-    def _fetch_callback(self, future):
-        self._futures.remove(future)
-        if not future.cancelled() and not future.exception():
-
-            html = future.result()
-            if html is not None:
-                # Topic of data gathered by spider is classified later
-                self.queues['__classify__'].put_nowait(html)
+    async def _fetch(self, url):
+        html = await self.client.fetch(
+            'GET', url, max_size=self.max_page_size,
+            content_types=self.page_content_types)
+        if html is None:
+            return ()
+        # Parsed once in a worker, which only sends back text and links
+        text, urls, published = await self.parse(html, url)
+        if text:
+            # Topic of data gathered by spider is classified later
+            # Requests count towards concurrent_requests until their text
+            # fits in the queue, so a full queue stops new requests
+            await self.queues['__classify__'].put((text, published))
+        return urls
 
-                for url in extract_urls(html):
-                    if url not in self.seen_urls:
-                        self.urls.add(url)
-                        self.seen_urls.add(url)
+    def _fetch_callback(self, url, future):
+        self._futures.discard(future)
+        self._requests.release()
+        if future.cancelled():
+            # Cancelled when closing, so the url is crawled after a restart
+            return
+        if not future.exception():
+            for new_url in future.result():
+                self.frontier.add(new_url)
+        self.frontier.done(url)
 
     async def _scrape(self):
-        self.urls.update(set(self.source_urls))
-        while self._futures or self.urls:
-            await asyncio.sleep(1e-2)
-            for url in self.urls.copy():
-                await self._create_scrape_future(url)
-                self.urls.remove(url)
+        for url in self.source_urls:
+            self.frontier.add(url)
+        while True:
+            await self._requests.acquire()
+            url = await self.frontier.get()
+            if url is None:
+                break
+            future = asyncio.ensure_future(self._fetch(url))
+            future.add_done_callback(partial(self._fetch_callback, url))
+            self._futures.add(future)
+        self._requests.release()
@@ -16,8 +16,9 @@ class Twingly(SearchEngineScraper):
     source = 'blog'
     item_gen = BlogGen
 
-    def __init__(self, api_key, *, proxy_pool=None):
-        super(Twingly, self).__init__(proxy_pool=proxy_pool)
+    def __init__(self, api_key, *, proxy_pool=None, connector=None):
+        super(Twingly, self).__init__(proxy_pool=proxy_pool,
+                                      connector=connector)
         self.api_key = api_key
         self.parser = Parser()
 
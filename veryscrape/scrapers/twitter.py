@@ -1,49 +1,236 @@
+from collections import OrderedDict
 from datetime import datetime
-import json
+import asyncio
+import logging
+import re
 
+from .. import fastjson
 from ..items import ItemGenerator
+from ..metrics import registry
 from ..process import remove_urls
 from ..scrape import Scraper
 from ..session import OAuth1Session
 
+log = logging.getLogger(__name__)
+
+_unmatched_tweets = registry.counter(
+    'veryscrape_twitter_unmatched_tweets_total',
+    'Tweets of shared Twitter streams not matching the queries of any topic')
+
+_word_pattern = re.compile(r'\w+')
+
 
 class TwitterSession(OAuth1Session):
     base_url = 'https://stream.twitter.com/1.1/'
 
 
 class TweetGen(ItemGenerator):
-    last_item = None
+    # Top level fields of tweets decoded with fastjson.project, or None to
+    # decode whole tweets. Shared streams of Twitter only match queries to
+    # text of retweets, quotes and extended tweets if their fields are
+    # decoded, e.g. ('text', 'timestamp_ms', 'extended_tweet')
+    fields = None
+    _timestamp_ms = None
 
     def process_text(self, text):
+        self._timestamp_ms = None
         try:
-            self.last_item = json.loads(text.decode('utf-8'))
-            text = self.last_item['text']
-            return remove_urls(text)
-        except (ValueError, KeyError):
+            # Tweets of shared streams are decoded once when routed
+            if isinstance(text, bytes):
+                text = decode_tweet(text, self.fields)
+            self._timestamp_ms = text.get('timestamp_ms')
+            return remove_urls(text['text'])
+        except (ValueError, KeyError, AttributeError):
             return
 
     def process_time(self, text):
-        # Last json item is cached to avoid decoding more than once
-        # process_time is always called immediately after process_text
-        if self.last_item and self.last_item.get('timestamp_ms', None):
-            return datetime.fromtimestamp(
-                int(self.last_item['timestamp_ms']) / 1000)
+        # Only the timestamp of the last tweet is kept to avoid decoding
+        # more than once, as process_time is always called immediately
+        # after process_text
+        if self._timestamp_ms:
+            return datetime.fromtimestamp(int(self._timestamp_ms) / 1000)
+
+
+def decode_tweet(line, fields=None):
+    """
+    Decodes a tweet of a stream
+    :param line: JSON of tweet
+    :param fields: top level fields of tweet decoded, None for all fields
+    :return: dict of tweet
+    """
+    if fields is None:
+        return fastjson.loads(line)
+    return fastjson.project(line, fields)
+
+
+class KeywordMatcher:
+    """
+    Matches texts to the topics of queries like the track parameter of
+    Twitter's filter stream: queries are phrases separated by commas,
+    and a phrase matches texts containing all of its words in any order,
+    ignoring case and punctuation like '#' and '@'
+    """
+    def __init__(self):
+        self._topics = OrderedDict()
+        # Phrases by one of their words, the longest as it is the rarest
+        self._index = {}
+
+    def __len__(self):
+        return len(self._topics)
+
+    @property
+    def track(self):
+        """All phrases, as the track parameter of a filter stream"""
+        return ','.join(self._topics)
+
+    def add(self, query, topic):
+        """
+        Adds the phrases of a query matching a topic
+        :param query: phrases separated by commas
+        :param topic: topic of texts matching the query
+        :return: True if any phrase was not matching the topic before
+        """
+        added = False
+        for phrase in query.split(','):
+            words = frozenset(_word_pattern.findall(phrase.lower()))
+            if not words:
+                continue
+            phrase = ' '.join(sorted(words))
+            topics = self._topics.setdefault(phrase, set())
+            if topic not in topics:
+                topics.add(topic)
+                added = True
+                if len(topics) == 1:
+                    self._index.setdefault(max(words, key=len), []).append(
+                        (words, topics))
+        return added
+
+    def match(self, text):
+        """
+        :param text: text to match
+        :return: set of topics of phrases matching the text
+        """
+        words = set(_word_pattern.findall(text.lower()))
+        topics = set()
+        for word in words:
+            for phrase_words, phrase_topics in self._index.get(word, ()):
+                if phrase_words <= words:
+                    topics |= phrase_topics
+        return topics
+
+
+def _tweet_text(tweet):
+    # Text the filter stream matches, including text of retweeted and
+    # quoted tweets and the full text of extended tweets
+    texts = []
+    for t in (tweet, tweet.get('retweeted_status'),
+              tweet.get('quoted_status')):
+        if t:
+            extended = t.get('extended_tweet') or {}
+            texts.append(extended.get('full_text') or t.get('text') or '')
+            texts.extend(u.get('expanded_url') or '' for u in
+                         (t.get('entities') or {}).get('urls', ()))
+    return '\n'.join(texts)
 
 
 class Twitter(Scraper):
     source = 'twitter'
     item_gen = TweetGen
     session_class = TwitterSession
+    # Twitter disconnects clients that stop reading from the stream
+    queue_overflow = 'drop_oldest'
+    # Seconds waited before reconnecting when the queries change or the
+    # stream ends, doubled after each connection that got no tweets
+    reconnect_delay = 5.
+    max_reconnect_delay = 320.
+    # Max number of phrases Twitter allows in the track parameter
+    max_track_phrases = 400
 
-    def __init__(self, key, secret, token, token_secret, *, proxy_pool=None):
+    def __init__(self, key, secret, token, token_secret, *, proxy_pool=None,
+                 connector=None):
         super(Twitter, self).__init__(
             key, secret, token, token_secret,
-            proxy_pool=proxy_pool
+            proxy_pool=proxy_pool, connector=connector
         )
+        # Queries of all streams share one connection of the credentials
+        self.matcher = KeywordMatcher()
+        self._changed = asyncio.Event()
+        self.tweets = 0
+
+    def stream(self, query, topic='', **kwargs):
+        """
+        Adds a query to the shared stream of the scraper,
+        which reconnects with every query once queries are added
+        :param query: phrases to track, separated by commas
+        :param topic: topic of tweets matching the query
+        """
+        if self.matcher.add(query, topic):
+            self._changed.set()
+        if self._stream is None:
+            self._stream = asyncio.ensure_future(self._stream_tracks())
+        return self.item_gen(self.queues[topic], topic=topic,
+                             source=self.source, seen=self.seen)
+
+    async def _route(self, line):
+        line = line.strip()
+        if not line:
+            # Keep alive messages
+            return
+        try:
+            tweet = decode_tweet(line, self.item_gen.fields)
+        except ValueError:
+            return
+        if not isinstance(tweet, dict) or 'text' not in tweet:
+            # Limit, delete and other messages
+            return
+        topics = self.matcher.match(_tweet_text(tweet))
+        if not topics:
+            _unmatched_tweets.inc()
+        self.tweets += 1
+        for topic in topics:
+            await self.queues[topic].put(tweet)
+
+    async def _stream_tracks(self):
+        delay = self.reconnect_delay
+        while True:
+            self._changed.clear()
+            if len(self.matcher) > self.max_track_phrases:
+                log.warning('Twitter tracks at most %d phrases, '
+                            'tracking the first of %d phrases',
+                            self.max_track_phrases, len(self.matcher))
+            track = ','.join(self.matcher.track.split(',')
+                             [:self.max_track_phrases])
+            tweets = self.tweets
+            fetch = asyncio.ensure_future(self.client.fetch(
+                'POST', 'statuses/filter.json', stream_func=self._route,
+                params={'language': 'en', 'track': track}, timeout=None
+            ))
+            changed = asyncio.ensure_future(self._changed.wait())
+            try:
+                await asyncio.wait([fetch, changed],
+                                   return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                fetch.cancel()
+                changed.cancel()
+
+            if changed.done() and not changed.cancelled():
+                log.info('Reconnecting Twitter stream with %d phrases',
+                         len(self.matcher))
+                wait = self.reconnect_delay
+            else:
+                if not fetch.cancelled() and fetch.exception() is not None:
+                    log.error('Twitter stream failed: %r', fetch.exception())
+                # Connections that got tweets are not failures
+                if self.tweets > tweets:
+                    delay = self.reconnect_delay
+                wait = delay
+                delay = min(2 * delay, self.max_reconnect_delay)
+                log.info('Twitter stream ended, reconnecting in %.0f s', wait)
+            await asyncio.sleep(wait)
 
     async def scrape(self, query, topic='', **kwargs):
         await self.client.fetch(
             'POST', 'statuses/filter.json',
-            stream_func=lambda l: self.queues[topic].put_nowait(l),
+            stream_func=self.queues[topic].put,
             params={'language': 'en', 'track': query}, timeout=None, **kwargs
         )
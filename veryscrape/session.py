@@ -1,16 +1,21 @@
 from aioauth_client import HmacSha1Signature
 from aiohttp.client import _RequestContextManager
 from collections import OrderedDict
+from functools import lru_cache, partial
 from fake_useragent import UserAgent, settings
 from hashlib import sha1
-from time import time
+from time import monotonic, time
 from random import SystemRandom
 from urllib.parse import urljoin, urlparse
 import asyncio
 import aiohttp
+import codecs
+import inspect
 import logging
 import re
 
+from . import fastjson
+from .metrics import registry
 
 log = logging.getLogger(__name__)
 random = SystemRandom().random
@@ -20,19 +25,155 @@ settings.HTTP_RETRIES = 1
 settings.HTTP_TIMEOUT = 0.1
 _agent_factory = UserAgent(fallback='python:veryscrape')
 
+_fetch_seconds = registry.histogram(
+    'veryscrape_fetch_seconds',
+    'Seconds to fetch a url with Session.fetch, including retries',
+    labels=('session',))
+_fetch_retries = registry.counter(
+    'veryscrape_fetch_retries_total',
+    'Requests of Session.fetch retried after failing', labels=('session',))
+_fetch_failures = registry.counter(
+    'veryscrape_fetch_failures_total',
+    'Fetches of Session.fetch failed after all retries', labels=('session',))
+_fetch_skipped = registry.counter(
+    'veryscrape_fetch_skipped_total',
+    'Responses of Session.fetch not read, as they were too large or of a '
+    'content type not allowed', labels=('session', 'reason'))
+_rate_limit_wait_seconds = registry.histogram(
+    'veryscrape_rate_limit_wait_seconds',
+    'Seconds requests waited for a token of their rate limit',
+    labels=('limiter',))
+
+
+class TokenBucket:
+    """
+    Allows bursts of up to rate requests, with tokens for new requests
+    refilled evenly over the period (implemented as GCRA).
+    Tokens are reserved in the order they are requested,
+    so waiting requests are served first in, first out
+    :param rate: max number of requests in each period
+    :param period: period in seconds
+    :param key: name of the rate limit (unused, as this bucket is only
+        shared by requests of one process)
+    """
+    def __init__(self, rate, period, key=''):
+        self.rate = rate
+        self.period = period
+        self.interval = period / rate
+        # Theoretical arrival time of the next request at the refill rate
+        self._tat = 0.
+
+    def reserve(self):
+        """
+        Reserves the next token
+        :return: time in seconds to wait before the token can be used
+        """
+        now = monotonic()
+        tat = max(self._tat, now)
+        self._tat = tat + self.interval
+        return max(0., tat - (self.period - self.interval) - now)
+
+
+class RedisTokenBucket:
+    """
+    Token bucket like TokenBucket, which is shared by all processes
+    using the same redis server and key for the bucket
+    (e.g. to share the rate limits of an API between processes
+    using the same credentials). Each reservation is one script call
+    :param rate: max number of requests in each period
+    :param period: period in seconds
+    :param key: name of the rate limit
+    :param redis: redis client, e.g. redis.Redis()
+    :param prefix: prefix for keys of buckets in redis
+    """
+    script = """
+    -- Server time is used so all processes share the same clock
+    if redis.replicate_commands then redis.replicate_commands() end
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local interval = tonumber(ARGV[1])
+    local period = tonumber(ARGV[2])
+    local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or 0), now)
+    redis.call('SET', KEYS[1], tostring(tat + interval),
+               'PX', math.ceil((tat + interval - now) * 1000) + 1)
+    return tostring(math.max(0, tat - (period - interval) - now))
+    """
+
+    def __init__(self, rate, period, key='', redis=None,
+                 prefix='veryscrape:rate_limit:'):
+        assert redis is not None, 'RedisTokenBucket requires a redis client'
+        self.rate = rate
+        self.period = period
+        self.interval = period / rate
+        self.key = prefix + key
+        self._reserve = redis.register_script(self.script)
+
+    def reserve(self):
+        """
+        Reserves the next token
+        :return: time in seconds to wait before the token can be used
+        """
+        return float(self._reserve(keys=[self.key],
+                                   args=[self.interval, self.period]))
 
-def _create_nested_metadata(parent):
-    request_metadata = {}
-    for path, limit in parent.items():
+
+def _compile_limits(rate_limits, period, create_bucket, key):
+    compiled = []
+    for path, limit in rate_limits.items():
+        match = _match_any if path == '*' else re.compile(path).search
+        path_key = '%s|%s' % (key, path)
         if isinstance(limit, dict):
-            request_metadata[path] = _create_nested_metadata(limit)
+            compiled.append((match, _compile_limits(
+                limit, period, create_bucket, path_key)))
         else:
-            request_metadata[path] = {'n': 0, 'last': time()}
-    return request_metadata
+            compiled.append((match, create_bucket(limit, period, path_key)))
+    return compiled
+
+
+_meta_charset_pattern = re.compile(
+    br'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+
+
+def _incremental_decoder(charset, chunk):
+    # The charset of the Content-Type header, or else of a meta tag at the
+    # start of the body, as detecting it would need the whole body
+    if charset is None:
+        match = _meta_charset_pattern.search(chunk, 0, 4096)
+        charset = match.group(1).decode('ascii') if match else 'utf-8'
+    try:
+        decoder = codecs.getincrementaldecoder(charset)
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')
+    return decoder(errors='replace')
+
+
+def _match_any(url):
+    return True
+
+
+def _find_limit(limits, url):
+    for match, limit in limits:
+        if match(url):
+            if isinstance(limit, list):
+                return _find_limit(limit, url)
+            return limit
+    return None
 
 
 class RateLimiter:
-    def __init__(self, rate_limits, period):
+    """
+    Limits the rate of requests to urls matching configured paths
+    :param rate_limits: dict of path regexes and max requests per period
+    :param period: period in seconds
+    :param create_bucket: class or function creating a bucket for each
+        rate limit from rate, period and key (see TokenBucket)
+    :param key: name of the rate limits, keys of buckets start with this
+    """
+    # Number of urls whose rate limit is remembered
+    cache_size = 4096
+
+    def __init__(self, rate_limits, period, create_bucket=TokenBucket,
+                 key=''):
         self.rate_limit_period = period
         self.rate_limits = OrderedDict()
         defined_limits = rate_limits.copy()
@@ -45,38 +186,30 @@ class RateLimiter:
             assert isinstance(global_limit, int), \
                 'Global rate limit must be defined directly with an integer'
             self.rate_limits['*'] = global_limit
-        self._rl_meta = _create_nested_metadata(self.rate_limits)
-
-    def get_limit(self, url, parent=None, metadata=None):
-        parent = parent or self.rate_limits
-        metadata = metadata or self._rl_meta
-        for path, limit in parent.items():
-            if re.search(path, url):
-                if isinstance(limit, dict):
-                    return self.get_limit(url, parent=limit,
-                                          metadata=metadata[path])
-                return limit, metadata[path]
-        else:
-            return False, {}
-
-    def refresh_limits(self, rate_limit, metadata):
-        time_since = time() - metadata['last']
-        metadata['n'] = max(0, metadata['n'] - int(
-            time_since * rate_limit / self.rate_limit_period))
-
-    async def _wait_limit(self, rate_limit, metadata):
-        while metadata['n'] >= rate_limit:
-            self.refresh_limits(rate_limit, metadata)
-            # wait 1/1000 the time of one request to try again
-            await asyncio.sleep(self.rate_limit_period / rate_limit / 1000)
+        self._find_limit = lru_cache(self.cache_size)(partial(
+            _find_limit,
+            _compile_limits(self.rate_limits, period, create_bucket, key)
+        ))
+        # Limiters are labelled by session class, not by credentials
+        self._wait_seconds = _rate_limit_wait_seconds.labels(
+            key.split(':', 1)[0])
+
+    def get_limit(self, url):
+        """
+        Returns the token bucket limiting requests to url,
+        or None if requests to url are not rate limited
+        """
+        # Limits are found by host and path, so urls with different
+        # query strings or fragments share a cached lookup
+        return self._find_limit(url.split('?', 1)[0].split('#', 1)[0])
 
     async def wait_limit(self, url):
-        rate_limit, metadata = self.get_limit(url)
-        if rate_limit:
-            self.refresh_limits(rate_limit, metadata)
-            await self._wait_limit(rate_limit, metadata)
-            metadata['last'] = time()
-            metadata['n'] += 1
+        bucket = self.get_limit(url)
+        if bucket is not None:
+            delay = bucket.reserve()
+            self._wait_seconds.observe(delay)
+            if delay > 0:
+                await asyncio.sleep(delay)
 
 
 class OAuth1:
@@ -117,6 +250,10 @@ class OAuth2:
         self.auth = aiohttp.BasicAuth(self.client, self.secret)
         self.token = None
         self.token_expiry = 0
+        # Function sending token requests like ClientSession._request,
+        # e.g. with the connection pool of a session, or None to
+        # send each token request with a new client session
+        self.request = None
 
     @property
     def oauth2_token_expired(self):
@@ -135,13 +272,11 @@ class OAuth2:
         required for oauth2 signed http request
         """
         if self.oauth2_token_expired:
-            async with aiohttp.ClientSession() as sess:
-                async with sess.post(
-                        self.token_url,
-                        data={'grant_type': 'client_credentials'},
-                        auth=self.auth
-                ) as resp:
-                    auth = await resp.json()
+            if self.request is None:
+                async with aiohttp.ClientSession() as sess:
+                    auth = await self._request_token(sess._request)
+            else:
+                auth = await self._request_token(self.request)
             self.token = auth['access_token']
             try:
                 self.token_expiry = int(time()) + int(auth['expires_in'])
@@ -149,6 +284,13 @@ class OAuth2:
                 self.token_expiry = 0
         return {'Authorization': 'bearer ' + self.token}
 
+    async def _request_token(self, request):
+        async with _RequestContextManager(request(
+                'POST', self.token_url,
+                data={'grant_type': 'client_credentials'}, auth=self.auth
+        )) as resp:
+            return await resp.json(loads=fastjson.loads)
+
     async def patch_request(self, method, url, params, kwargs):
         auth = await self.auth_token()
         if kwargs.get('headers', None) is None:
@@ -160,6 +302,10 @@ class OAuth2:
 class Session:
     rate_limits = {}
     rate_limit_period = 60
+    # Creates the bucket of each rate limit, set this to
+    # partial(RedisTokenBucket, redis=Redis()) to share rate limits
+    # between processes
+    rate_limit_backend = TokenBucket
 
     persist_user_agent = True
     user_agent = None
@@ -168,10 +314,33 @@ class Session:
     retries_to_error = 5       # Number of retries before failing
     sleep_increment = 15       # Time to sleep between failed requests
 
-    def __init__(self, *args, proxy_pool=None, **kwargs):
-        self.limiter = RateLimiter(self.rate_limits, self.rate_limit_period)
+    # Connection pool created for each session by create_connector
+    connection_limit = 100          # Max open connections, 0 for no limit
+    connection_limit_per_host = 0   # Max open connections to one host
+    keepalive_timeout = 30          # Seconds idle connections are kept open
+    dns_cache_ttl = 300             # Seconds resolved hosts are cached
+
+    # Bytes read at once by fetch when it has max_size or content_types
+    read_chunk_size = 2 ** 16
+
+    def __init__(self, *args, proxy_pool=None, connector=None, **kwargs):
+        self.limiter = RateLimiter(
+            self.rate_limits, self.rate_limit_period,
+            # accessed from the class so functions are not bound to self
+            create_bucket=type(self).rate_limit_backend,
+            key=self.rate_limit_key
+        )
         self._pool = proxy_pool
-        self._session = aiohttp.ClientSession(**kwargs)
+        name = type(self).__name__
+        self._fetch_seconds = _fetch_seconds.labels(name)
+        self._fetch_retries = _fetch_retries.labels(name)
+        self._fetch_failures = _fetch_failures.labels(name)
+        self._fetch_skipped = {reason: _fetch_skipped.labels(name, reason)
+                               for reason in ('size', 'content_type')}
+        # Sessions can share a connector, which is then closed by its owner
+        self._session = aiohttp.ClientSession(
+            connector=connector or self.create_connector(),
+            connector_owner=connector is None, **kwargs)
         # This is so you can call get, post, etc... without having to recode
         # aiohttp uses _request internally for everything, so that is saved,
         # and calls to aiohttp's _request are sent to _request of this class,
@@ -192,6 +361,26 @@ class Session:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         return await self._session.__aexit__(exc_type, exc_val, exc_tb)
 
+    @property
+    def rate_limit_key(self):
+        """Name of rate limits, sessions with the same name share limits"""
+        return type(self).__name__
+
+    @classmethod
+    def create_connector(cls):
+        """
+        Creates the connection pool of a session, which keeps connections
+        open for reuse and caches resolved hosts, as configured by the
+        connection attributes of the session class
+        :return: aiohttp.TCPConnector
+        """
+        return aiohttp.TCPConnector(
+            limit=cls.connection_limit,
+            limit_per_host=cls.connection_limit_per_host,
+            keepalive_timeout=cls.keepalive_timeout,
+            use_dns_cache=True, ttl_dns_cache=cls.dns_cache_ttl
+        )
+
     @property
     def _user_agent(self):
         """
@@ -221,15 +410,29 @@ class Session:
     def request(self, method, url, **kwargs):
         return _RequestContextManager(self._request(method, url, **kwargs))
 
-    async def fetch(self, method, url, *,
-                    params=None, stream_func=None, **kwargs):
-
+    async def fetch(self, method, url, *, params=None, stream_func=None,
+                    max_size=None, content_types=None, **kwargs):
+        """
+        Requests a url, retrying failed requests
+        :param method: http method of request
+        :param url: url to request
+        :param params: query parameters of request
+        :param stream_func: function called with each line of the body,
+            instead of the body being returned
+        :param max_size: max bytes of body, larger bodies are not read
+        :param content_types: content types of bodies read, e.g. text/html,
+            bodies of other content types are not read
+        :return: text of body, or None if the body was not read
+        """
         result = ''
         count = 0
         success = False
         kwargs.update(params=params, timeout=kwargs.pop('timeout', 10))
+        start = monotonic()
 
         while not success and count <= self.retries_to_error:
+            if count:
+                self._fetch_retries.inc()
             async with self.request(method, url, **kwargs) as resp:
                 try:
                     try:
@@ -251,9 +454,16 @@ class Session:
                     else:
                         if stream_func is not None:
                             async for line in resp.content:
-                                stream_func(line)
-                        else:
+                                # Awaiting the result of stream_func lets it
+                                # stop reading the stream while it is busy
+                                res = stream_func(line)
+                                if inspect.isawaitable(res):
+                                    await res
+                        elif max_size is None and content_types is None:
                             result = await resp.text()
+                        else:
+                            result = await self._read_text(
+                                resp, url, max_size, content_types)
 
                         success = True
 
@@ -264,11 +474,50 @@ class Session:
 
             count += 1
 
-        if not success and self.error_on_failure:
-            raise FetchError
+        self._fetch_seconds.observe(monotonic() - start)
+        if not success:
+            self._fetch_failures.inc()
+            if self.error_on_failure:
+                raise FetchError
 
         return result
 
+    async def _read_text(self, resp, url, max_size, content_types):
+        """
+        Reads the body of a response in chunks, which are decoded as they
+        arrive, so the body is not read when its content type is not allowed,
+        and reading stops as soon as the body is larger than max_size bytes
+        """
+        if content_types is not None and \
+                resp.content_type not in content_types:
+            return self._skip(resp, url, 'content_type', resp.content_type)
+        length = resp.headers.get('Content-Length', '')
+        if max_size is not None and length.isdigit() and \
+                int(length) > max_size:
+            return self._skip(resp, url, 'size', '%s bytes' % length)
+
+        decoder = None
+        parts = []
+        size = 0
+        async for chunk in resp.content.iter_chunked(self.read_chunk_size):
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                return self._skip(resp, url, 'size',
+                                  'over %d bytes' % max_size)
+            if decoder is None:
+                decoder = _incremental_decoder(resp.charset, chunk)
+            parts.append(decoder.decode(chunk))
+        if decoder is not None:
+            parts.append(decoder.decode(b'', True))
+        return ''.join(parts)
+
+    def _skip(self, resp, url, reason, detail):
+        log.debug('Skipped reading %s: %s', url, detail)
+        self._fetch_skipped[reason].inc()
+        # Closes the connection, as the rest of the body is not read
+        resp.close()
+        return None
+
     async def on_error(self, error_code):
         """
         This is called when a request returns a non-200 status code.
@@ -282,8 +531,15 @@ class OAuth1Session(Session):
     _patcher = OAuth1
 
     def __init__(self, *args, **kwargs):
-        super(OAuth1Session, self).__init__(**kwargs)
         self.patcher = self._patcher(*args)
+        super(OAuth1Session, self).__init__(**kwargs)
+
+    @property
+    def rate_limit_key(self):
+        # APIs limit requests by credentials, so sessions using
+        # the same client share rate limits
+        client = sha1(str(self.patcher.client).encode()).hexdigest()[:16]
+        return '%s:%s' % (type(self).__name__, client)
 
     async def _request(self, method, url, **kwargs):
         if self.base_url is not None and not url.startswith('http'):
@@ -299,6 +555,12 @@ class OAuth1Session(Session):
 class OAuth2Session(OAuth1Session):
     _patcher = OAuth2
 
+    def __init__(self, *args, **kwargs):
+        super(OAuth2Session, self).__init__(*args, **kwargs)
+        # Tokens are requested with the connection pool of this session,
+        # without the rate limits and authentication of its requests
+        self.patcher.request = self._original_request
+
 
 class FetchError(Exception):
     """
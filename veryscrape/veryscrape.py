@@ -2,6 +2,7 @@ from collections import defaultdict
 from functools import partial
 from multiprocessing import cpu_count
 import asyncio
+import inspect
 import json
 import logging
 import signal
@@ -9,7 +10,10 @@ import threading
 
 from proxybroker import Broker, ProxyPool
 
-from .wrappers import ItemMerger, ItemProcessor, ItemSorter
+from .monitor import LoopLagMonitor
+from .session import Session
+from .wrappers import ItemMerger, ItemProcessor, ItemSorter, \
+    NearDuplicateFilter
 
 log = logging.getLogger('veryscrape')
 
@@ -62,6 +66,9 @@ class VeryScrape:
         self.loop = loop or asyncio.get_event_loop()
         self.queue = q
         self.using_proxies = False
+        # Connection pool shared by all scrapers, if connections are shared
+        self.connector = None
+        self.lag_monitor = LoopLagMonitor(loop=self.loop)
 
         proxy_queue = asyncio.Queue(loop=self.loop)
         self.proxies = ProxyPool(proxy_queue)
@@ -72,7 +79,10 @@ class VeryScrape:
         self.kill_event = asyncio.Event(loop=self.loop)
         self.loop.add_signal_handler(signal.SIGINT, self.close)
 
-    async def scrape(self, config, *, n_cores=1, max_items=0, max_age=None):
+    async def scrape(self, config, *, n_cores=1, max_items=0, max_age=None,
+                     queue_size=0, batch_size=1, near_duplicate_distance=None,
+                     near_duplicate_window=3600, share_connections=False,
+                     parse_in_workers=False):
         """
         Scrape, process and organize data on the web based on a scrape config
         :param config: dict: scrape configuration
@@ -98,6 +108,23 @@ class VeryScrape:
         Set to 0 to use all available cores. Set to -1 to disable processing.
         :param max_items:
         :param max_age:
+        :param queue_size: max number of items waiting at each stage of
+        scraping and processing, 0 for no limit. When a stage is full the
+        stages before it wait, or drop items if they can't be paused
+        :param batch_size: max number of items processed together in one
+        call to a worker process, larger batches cost less per item to send
+        :param near_duplicate_distance: drop items with a simhash of content
+        differing in at most this many bits from an item of the same topic,
+        None to keep near-duplicates
+        :param near_duplicate_window: seconds an item is compared with
+        later items to find near-duplicates
+        :param share_connections: whether all scrapers share one connection
+        pool created by Session.create_connector, instead of each session
+        having its own pool
+        :param parse_in_workers: whether raw data from scrapers is parsed
+        and filtered in the worker processes processing items, in one pass
+        with cleaning and classifying, instead of on the event loop.
+        Ignored when processing is disabled
         """
         if isinstance(config, str):
             with open(config) as f:
@@ -106,34 +133,65 @@ class VeryScrape:
         assert isinstance(config, dict), \
             'Configuration must be a dict or a path to a json config file'
 
+        if share_connections:
+            self.connector = Session.create_connector()
+
         try:
             scrapers, streams, topics = \
                 self.create_all_scrapers_and_streams(config)
         except Exception as e:
             raise ValueError().with_traceback(e.__traceback__)
 
-        self.items = ItemMerger(*[stream() for stream in streams])
+        if queue_size:
+            for scraper in scrapers:
+                scraper.queue_size = queue_size
+
+        item_gens = [stream() for stream in streams]
+        if parse_in_workers and n_cores > -1:
+            for item_gen in item_gens:
+                item_gen.raw = True
+        self.items = ItemMerger(*item_gens, maxsize=queue_size)
 
         if n_cores > -1:
             self.items = ItemProcessor(self.items,
                                        # one core is needed to run event loop
                                        n_cores=n_cores or cpu_count() - 1,
-                                       loop=self.loop)
+                                       loop=self.loop, maxsize=queue_size,
+                                       batch_size=batch_size)
             # Update topics of ItemProcessor for classifying
             self.items.update_topics(**topics)
 
+        if near_duplicate_distance is not None:
+            self.items = NearDuplicateFilter(
+                self.items, max_distance=near_duplicate_distance,
+                window=near_duplicate_window, loop=self.loop,
+                maxsize=queue_size)
+
         if max_items > 0 or max_age is not None:
             self.items = ItemSorter(self.items,
-                                    max_items=max_items, max_age=max_age)
+                                    max_items=max_items, max_age=max_age,
+                                    maxsize=queue_size)
 
         # Start finding proxies if any scrapers use proxies
         if self.using_proxies:
             asyncio.ensure_future(self._update_proxies())
 
+        self.lag_monitor.start()
         async for item in self.items:
             await self.queue.put(item)
 
         await asyncio.gather(*[s.close() for s in scrapers])
+        if self.connector is not None:
+            # Closing is a coroutine in newer versions of aiohttp
+            closed = self.connector.close()
+            if inspect.isawaitable(closed):
+                await closed
+        self.lag_monitor.stop()
+        log.info('Event loop lag: mean %.1f ms, max %.1f ms, '
+                 '%d times over %.0f ms',
+                 self.lag_monitor.mean_lag * 1e3,
+                 self.lag_monitor.max_lag * 1e3, self.lag_monitor.slow,
+                 self.lag_monitor.threshold * 1e3)
 
     def close(self):
         self.kill_event.set()
@@ -175,6 +233,8 @@ class VeryScrape:
             args.extend(auth.split('|'))
 
         kwargs = {'proxy_pool': None}
+        if self.connector is not None:
+            kwargs.update(connector=self.connector)
         kwargs.update(metadata.pop('kwargs', {}))
 
         use_proxies = metadata.pop('use_proxies', False)
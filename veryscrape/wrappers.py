@@ -5,11 +5,39 @@ import asyncio
 import heapq
 import logging
 import time
+import weakref
 
-from .process import classify_text, clean_item
+from .dedup import SimHashIndex, simhash
+from .items import END_OF_STREAM, RawItem
+from .metrics import registry
+from .process import TopicClassifier, process_batch, process_raw_batch
 
 log = logging.getLogger(__name__)
 
+# Stages whose queues are measured when metrics are collected
+_stages = weakref.WeakSet()
+
+
+def _queued_items():
+    totals = defaultdict(int)
+    for stage in list(_stages):
+        totals[(type(stage).__name__,)] += stage.qsize()
+    return dict(totals)
+
+
+registry.gauge('veryscrape_stage_queue_items',
+               'Items waiting in the queue of each stage of the pipeline',
+               labels=('stage',), function=_queued_items)
+_process_batch_seconds = registry.histogram(
+    'veryscrape_process_batch_seconds',
+    'Seconds from sending a batch of items to the process pool '
+    'until it is processed')
+_processed_items = registry.counter(
+    'veryscrape_processed_items_total', 'Items processed by ItemProcessor')
+_near_duplicates = registry.counter(
+    'veryscrape_near_duplicates_total',
+    'Items dropped by NearDuplicateFilter')
+
 
 # the only purpose of this is to allow a defaultdict
 # created with this function as the default factory
@@ -19,13 +47,18 @@ def _create_list_defaultdict():
 
 
 class GeneratorWrapper:
-    def __init__(self, item_gen, loop=None):
+    def __init__(self, item_gen, loop=None, maxsize=0):
         self.loop = loop or asyncio.get_event_loop()
         self.cancelled = False
         self.items = item_gen
         self._gen = None
-        self._q = asyncio.Queue()
+        self._q = asyncio.Queue(maxsize)
         self._future = None
+        _stages.add(self)
+
+    def qsize(self):
+        """Number of items waiting to be returned by get"""
+        return self._q.qsize()
 
     def cancel(self):
         if not self.cancelled:
@@ -33,58 +66,75 @@ class GeneratorWrapper:
             self.items.cancel()
             if self._future is not None and not self._future.done():
                 self._future.cancel()
+            self._wake()
 
     async def get(self):
-        try:
-            return self._q.get_nowait()
-        except asyncio.QueueEmpty:
-            await asyncio.sleep(1e-3)
+        return await self._q.get()
 
     async def put(self, item):
         await self._q.put(item)
 
+    async def join(self):
+        """Waits until all items given to put can be returned by get"""
+        return
+
+    async def end(self):
+        """Signals that no more items will be given to put"""
+        await self.join()
+        await self._q.put(END_OF_STREAM)
+
+    def _wake(self):
+        # Wakes up a consumer waiting in get after the wrapper is cancelled
+        try:
+            self._q.put_nowait(END_OF_STREAM)
+        except asyncio.QueueFull:
+            pass
+
     def __aiter__(self):
         self._gen = self.items.__aiter__()
         self._future = asyncio.ensure_future(self._stream())
         return self
 
     async def __anext__(self):
-        while True:
-            if self.cancelled:
-                raise StopAsyncIteration
-            else:
-                item = await self.get()
-                if item is not None:
-                    return item
+        if not self.cancelled:
+            item = await self.get()
+            if item is not END_OF_STREAM and not self.cancelled:
+                return item
+            self.cancelled = True
+        raise StopAsyncIteration
 
     async def _stream(self):
         while True:
             try:
                 item = await self._gen.__anext__()
-                await self.put(item)
             except StopAsyncIteration:
-                return
+                break
+            await self.put(item)
+        await self.end()
 
 
 class ItemMerger:
-    def __init__(self, *item_gens):
-        self.q = asyncio.Queue()
+    def __init__(self, *item_gens, maxsize=0):
+        self.q = asyncio.Queue(maxsize)
         self.item_gens = item_gens
         self.cancelled = False
         self._future = None
+        _stages.add(self)
+
+    def qsize(self):
+        """Number of items waiting to be returned"""
+        return self.q.qsize()
 
     def __aiter__(self):
-        self._future = asyncio.ensure_future(asyncio.gather(*[
-            self._stream(item_gen) for item_gen in self.item_gens
-        ]))
+        self._future = asyncio.ensure_future(self._stream_all())
         return self
 
     async def __anext__(self):
-        while not self.cancelled:
-            try:
-                return self.q.get_nowait()
-            except asyncio.QueueEmpty:
-                await asyncio.sleep(1e-3)
+        if not self.cancelled:
+            item = await self.q.get()
+            if item is not END_OF_STREAM and not self.cancelled:
+                return item
+            self.cancelled = True
         raise StopAsyncIteration
 
     def cancel(self):
@@ -92,7 +142,19 @@ class ItemMerger:
             self.cancelled = True
             for gen in self.item_gens:
                 gen.cancel()
-            self._future.cancel()
+            if self._future is not None:
+                self._future.cancel()
+            # Wakes up a consumer waiting in __anext__
+            try:
+                self.q.put_nowait(END_OF_STREAM)
+            except asyncio.QueueFull:
+                pass
+
+    async def _stream_all(self):
+        await asyncio.gather(*[
+            self._stream(item_gen) for item_gen in self.item_gens
+        ])
+        await self.q.put(END_OF_STREAM)
 
     async def _stream(self, item_gen):
         async for item in item_gen:
@@ -100,58 +162,133 @@ class ItemMerger:
 
 
 class ItemProcessor(GeneratorWrapper):
-    # The default classification function is simple and fast
+    # The default classifier is simple and fast
     # You can change this if you want more detailed classification
-    # classify takes two arguments - data: any, topics_to_classify: dict
-    # see veryscrape.process.classify_text for more details
-    classify = classify_text
-
-    def __init__(self, items, n_cores=1, loop=None):
+    # classify is either a function taking two arguments -
+    # data: any, topics_to_classify: dict (see process.classify_text),
+    # or a class created from topics_to_classify: dict whose instances
+    # are called with data: any (see process.TopicClassifier)
+    classify = TopicClassifier
+
+    # Items are sent to the process pool in batches of up to batch_size,
+    # waiting at most batch_timeout seconds for a batch to fill up
+    batch_size = 1
+    batch_timeout = 0.05
+
+    def __init__(self, items, n_cores=1, loop=None, maxsize=0,
+                 batch_size=None, batch_timeout=None):
         super(ItemProcessor, self).__init__(items, loop=loop)
         self.pool = ProcessPoolExecutor(max_workers=n_cores)
         self.loop.set_default_executor(self.pool)
         self.topics_by_source = defaultdict(_create_list_defaultdict)
+        self.batch_size = batch_size or self.batch_size
+        self.batch_timeout = batch_timeout or self.batch_timeout
+        self._batch = []
+        self._batch_timer = None
+        self._pending = set()
+        # Topics are cached in worker processes and only sent again
+        # to a worker when its cached version is out of date
+        self._topics_version = 0
+        # Items being processed are put on the queue from callbacks,
+        # so the limit is on items being processed or waiting in the queue
+        self._slots = asyncio.Semaphore(maxsize) if maxsize else None
 
     def cancel(self):
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
         self.pool.shutdown(wait=True)
         super(ItemProcessor, self).cancel()
 
+    async def get(self):
+        item = await self._q.get()
+        if item is not END_OF_STREAM:
+            self._release()
+        return item
+
     async def put(self, item):
-        f = self.loop.run_in_executor(self.pool, clean_item, item)
-        if item.topic == '__classify__':
-            f.add_done_callback(self._classify_item)
-        else:
-            f.add_done_callback(self._enqueue_item)
+        if self._slots is not None:
+            await self._slots.acquire()
+        self._batch.append(item)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+        elif self._batch_timer is None:
+            self._batch_timer = self.loop.call_later(
+                self.batch_timeout, self._flush)
         await asyncio.sleep(0)
 
+    async def join(self):
+        self._flush()
+        while self._pending:
+            await asyncio.wait(list(self._pending))
+
     def update_topics(self, **topics_by_source):
         """
         Update local topics by source for use in classification of items
         :param topics_by_source: dict[list]: associated queries by topic
         """
         self.topics_by_source.update(topics_by_source)
-
-    def _classify_item(self, future):
-        if self._should_continue(future):
-            item = future.result()
-            f = self.loop.run_in_executor(
-                self.pool, ItemProcessor.classify,
-                item.content, self.topics_by_source[item.source]
-            )
-            f.add_done_callback(partial(
-                self._enqueue_classified_item, item=item))
-
-    def _enqueue_classified_item(self, future, item=None):
-        if self._should_continue(future) and item is not None:
-            item.topic = future.result()
-            log.debug('Queuing cleaned and classified item: %s', str(item))
+        self._topics_version += 1
+
+    def _flush(self):
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        if self._batch:
+            batch, self._batch = self._batch, []
+            # RawItems of item generators in raw mode are parsed by workers
+            raw = [item for item in batch if isinstance(item, RawItem)]
+            if raw:
+                self._submit(raw)
+            if len(raw) < len(batch):
+                self._submit([item for item in batch
+                              if not isinstance(item, RawItem)])
+
+    def _submit(self, batch, send_topics=False):
+        topics = self.topics_by_source if send_topics else None
+        if isinstance(batch[0], RawItem):
+            func = process_raw_batch
+            items = [(raw.data, type(raw.generator), raw.generator.topic,
+                      raw.generator.source) for raw in batch]
+        else:
+            func, items = process_batch, batch
+        f = self.loop.run_in_executor(
+            self.pool, func, items, self._topics_version,
+            topics, ItemProcessor.classify
+        )
+        self._pending.add(f)
+        f.add_done_callback(self._pending.discard)
+        f.add_done_callback(partial(self._enqueue_batch, batch=batch,
+                                    start=time.monotonic()))
+
+    def _enqueue_batch(self, future, batch=(), start=None):
+        if start is not None:
+            _process_batch_seconds.observe(time.monotonic() - start)
+        if not self._should_continue(future):
+            self._release(len(batch))
+            return
+
+        items = future.result()
+        if items is None:
+            # The worker did not have the current topics, so send them
+            self._submit(batch, send_topics=True)
+            return
+        if isinstance(batch[0], RawItem):
+            # Texts are remembered by the generators which read them, so
+            # items are only filtered once they are parsed and hashed
+            items = [result[0] for raw, result in zip(batch, items)
+                     if result is not None
+                     and raw.generator.filter_digest(result[1])]
+
+        _processed_items.inc(len(items))
+        for item in items:
+            log.debug('Queuing processed item: %s', item)
             self._q.put_nowait(item)
+        self._release(len(batch) - len(items))
 
-    def _enqueue_item(self, future):
-        if self._should_continue(future):
-            result = future.result()
-            log.debug('Queuing cleaned item: %s', str(result))
-            self._q.put_nowait(result)
+    def _release(self, n=1):
+        if self._slots is not None:
+            for _ in range(n):
+                self._slots.release()
 
     def _should_continue(self, future):
         return (
@@ -161,22 +298,89 @@ class ItemProcessor(GeneratorWrapper):
         )
 
 
+class NearDuplicateFilter(GeneratorWrapper):
+    """
+    Drops items with content nearly the same as the content of an item
+    of the same topic returned within a time window (e.g. retweets, reposts
+    or articles syndicated on several sites), compared by simhash
+    :param max_distance: max number of different bits of simhashes of
+        near-duplicates, out of 64
+    :param window: seconds an item is compared with later items
+    :param max_items: max number of items compared with later items
+    """
+    def __init__(self, items, max_distance=3, window=3600, max_items=100000,
+                 loop=None, maxsize=0):
+        super(NearDuplicateFilter, self).__init__(
+            items, loop=loop, maxsize=maxsize)
+        self.index = SimHashIndex(max_distance=max_distance, window=window,
+                                  max_items=max_items)
+        self.dropped = 0
+
+    async def put(self, item):
+        if self.index.add(simhash(item.content), key=item.topic):
+            await super(NearDuplicateFilter, self).put(item)
+        else:
+            self.dropped += 1
+            _near_duplicates.inc()
+            log.debug('Dropping near-duplicate item: %s', item)
+
+
 class ItemSorter(GeneratorWrapper):
-    def __init__(self, items, max_items=None, max_age=None, loop=None):
+    def __init__(self, items, max_items=None, max_age=None, loop=None,
+                 maxsize=0):
         super(ItemSorter, self).__init__(items, loop=loop)
         self.max_items = max_items or 0
         self.max_age = max_age or 0
+        self.maxsize = maxsize
         self._heap = []
+        self._ended = False
+        self._changed = asyncio.Event()
+        self._popped = asyncio.Event()
 
     async def put(self, item):
+        while self._full() and not self.cancelled:
+            self._popped.clear()
+            await self._popped.wait()
         heapq.heappush(self._heap, (item.created_at.timestamp(), item))
+        self._changed.set()
         await asyncio.sleep(0)
 
+    async def end(self):
+        self._ended = True
+        self._changed.set()
+
     async def get(self):
-        if self._heap and (
-            len(self._heap) > self.max_items
-            or time.time() - self._heap[0][0] > self.max_age
-        ):
-            return heapq.heappop(self._heap)[1]
+        while not self.cancelled:
+            timeout = None
+            if self._heap:
+                age = time.time() - self._heap[0][0]
+                if (
+                    self._ended
+                    or self._full()
+                    or len(self._heap) > self.max_items
+                    or age > self.max_age
+                ):
+                    self._popped.set()
+                    return heapq.heappop(self._heap)[1]
+                # Sleep until the oldest item is old enough to be returned
+                timeout = self.max_age - age
+            elif self._ended:
+                break
+
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        return END_OF_STREAM
+
+    def qsize(self):
+        return len(self._heap)
+
+    def _full(self):
+        return 0 < self.maxsize <= len(self._heap)
 
-        await asyncio.sleep(1e-3)
+    def _wake(self):
+        self._changed.set()
+        self._popped.set()
@@ -0,0 +1,195 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import time
+
+from redis.exceptions import ResponseError
+
+from .items import encode_item
+from .metrics import registry
+
+log = logging.getLogger(__name__)
+
+_write_seconds = registry.histogram(
+    'veryscrape_redis_write_seconds',
+    'Seconds to write a batch of items to redis in one round trip')
+_items_written = registry.counter(
+    'veryscrape_redis_items_total', 'Items written to redis')
+
+
+def format_item(item):
+    return "%s|%s|%s|%s" % (
+        item.source, item.topic, item.created_at, item.content
+    )
+
+
+# Functions encoding items for redis by the name of their format
+item_formats = {
+    'text': format_item,
+    'binary': encode_item
+}
+
+
+class RedisWriter:
+    """
+    Pushes items to a redis list in batches. Each batch is written with
+    one pipelined round trip from a dedicated thread, so the event loop is
+    never blocked by redis. While a batch is being written the next batch
+    is collected, so batches grow with the rate of items
+    :param db: redis client, e.g. redis.Redis()
+    :param key: key of the list items are pushed to
+    :param batch_size: max number of items written in one round trip
+    :param flush_interval: max seconds an item waits before being written
+    :param encode: function converting an item to the value pushed to redis
+    """
+    def __init__(self, db, key='events', batch_size=500, flush_interval=0.05,
+                 encode=format_item, loop=None):
+        self.db = db
+        self.key = key
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.encode = encode
+        self.loop = loop or asyncio.get_event_loop()
+        self._batch = []
+        self._timer = None
+        self._writing = None
+        # One thread keeps batches written in the order they are flushed
+        self._executor = ThreadPoolExecutor(1)
+
+        # Metrics
+        self.items_written = 0
+        self.flushes = 0
+        self.flush_seconds = 0.
+        self.max_flush_seconds = 0.
+        self.max_batch_size = 0
+
+    @property
+    def mean_batch_size(self):
+        return self.items_written / max(1, self.flushes)
+
+    @property
+    def mean_flush_seconds(self):
+        return self.flush_seconds / max(1, self.flushes)
+
+    async def put(self, item):
+        """
+        Adds an item to the current batch, if the batch is full
+        this waits until the previous batch has been written
+        :param item: Item to write
+        """
+        self._batch.append(self.entry(item))
+        if len(self._batch) >= self.batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(
+                self.flush_interval, self._flush_later)
+
+    async def flush(self):
+        """Starts writing the batch once the previous one is written"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._writing is not None:
+            writing, self._writing = self._writing, None
+            await writing
+        batch, self._batch = self._batch, []
+        if batch:
+            self._writing = self.loop.run_in_executor(
+                self._executor, self._write, batch)
+
+    async def close(self):
+        """Writes all remaining items and stops the writer thread"""
+        await self.flush()
+        if self._writing is not None:
+            writing, self._writing = self._writing, None
+            await writing
+        self._executor.shutdown()
+        log.info('Wrote %d items to redis in %d batches, '
+                 'mean batch size %.1f, mean flush time %.2f ms',
+                 self.items_written, self.flushes, self.mean_batch_size,
+                 self.mean_flush_seconds * 1e3)
+
+    def entry(self, item):
+        """
+        Converts an item to the entry added to the batch
+        :param item: Item to write
+        :return: encoded item
+        """
+        return self.encode(item)
+
+    def write_batch(self, pipe, batch):
+        """
+        Adds the commands writing a batch to a redis pipeline
+        :param pipe: redis pipeline
+        :param batch: list of entries
+        """
+        pipe.rpush(self.key, *batch)
+
+    def _flush_later(self):
+        self._timer = None
+        asyncio.ensure_future(self.flush(), loop=self.loop)
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        pipe = self.db.pipeline(transaction=False)
+        self.write_batch(pipe, batch)
+        pipe.execute()
+        elapsed = time.perf_counter() - start
+        _write_seconds.observe(elapsed)
+        _items_written.inc(len(batch))
+        self.items_written += len(batch)
+        self.flushes += 1
+        self.flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+
+
+# Functions naming the stream of an item from the base key by policy
+stream_keys = {
+    'single': lambda key, item: key,
+    'source': lambda key, item: '%s:%s' % (key, item.source),
+    'topic': lambda key, item: '%s:%s:%s' % (key, item.source, item.topic)
+}
+
+
+class RedisStreamWriter(RedisWriter):
+    """
+    Adds items to redis streams with XADD in batches like RedisWriter,
+    so consumers can read items in consumer groups and replay them.
+    Each entry has one field, 'item', which is the encoded item
+    :param stream_key: which stream items are added to, one of
+        'single' (key), 'source' (key:source) or 'topic' (key:source:topic)
+    :param maxlen: approximate max number of entries in each stream,
+        older entries are trimmed with MAXLEN ~ (0 disables trimming)
+    :param group: name of a consumer group to create for each stream,
+        which reads every entry from the start of the stream
+    """
+    def __init__(self, db, stream_key='source', maxlen=0, group=None,
+                 **kwargs):
+        super(RedisStreamWriter, self).__init__(db, **kwargs)
+        self.stream_key = stream_keys[stream_key]
+        self.maxlen = maxlen
+        self.group = group
+        self._streams = set()
+
+    def entry(self, item):
+        return self.stream_key(self.key, item), self.encode(item)
+
+    def write_batch(self, pipe, batch):
+        trim = ('MAXLEN', '~', self.maxlen) if self.maxlen else ()
+        for key, value in batch:
+            if key not in self._streams:
+                self._create_group(key)
+            # execute_command works with clients that do not have xadd
+            pipe.execute_command('XADD', key, *(trim + ('*', 'item', value)))
+
+    def _create_group(self, key):
+        self._streams.add(key)
+        if self.group is None:
+            return
+        try:
+            self.db.execute_command(
+                'XGROUP', 'CREATE', key, self.group, '0', 'MKSTREAM')
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise